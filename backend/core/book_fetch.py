@@ -0,0 +1,218 @@
+"""Concurrent, rate-limited fetching of book metadata from a Google Books style API.
+
+Lookups run on a thread pool sharing one keep-alive requests.Session. Every
+request first takes a token from a TokenBucket, so the pool never exceeds
+the configured rate however many workers it has. Connection errors, 429 and
+5xx responses are retried with exponential backoff (or after the server's
+Retry-After), pausing MAX_BACKOFF seconds at most. Successful responses are kept in a ResponseCache on disk,
+keyed by URL, so a rerun only asks for what it has not fetched yet.
+"""
+import hashlib
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from core.models.book import Book
+
+
+DEFAULT_API_URL = 'https://www.googleapis.com/books/v1/volumes'
+
+CATEGORIES = {key for key, _ in Book.CATEGORY_CHOICES}
+CATEGORY_LABELS = {label.lower(): key for key, label in Book.CATEGORY_CHOICES}
+
+# Statuses worth asking again for, after a pause
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Longest pause before a retry in seconds, whatever the backoff or Retry-After
+MAX_BACKOFF = 60
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing rate acquisitions per second, burst at once"""
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ResponseCache:
+    """JSON responses stored one file per URL under a directory"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest() + '.json')
+
+    def get(self, url):
+        try:
+            with open(self.path(url), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, url, data):
+        # Write to a temporary file first so an interrupted run never leaves half an entry
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(temporary, self.path(url))
+
+
+class FetchError(Exception):
+    pass
+
+
+class FetchResult:
+    """Outcome of one lookup: the book found, if any, or the error that stopped it"""
+
+    def __init__(self, identifier, book=None, error=None, cached=False, attempts=0):
+        self.identifier = identifier
+        self.book = book
+        self.error = error
+        self.cached = cached
+        self.attempts = attempts
+
+
+def title_query(title):
+    return {'q': f'intitle:{title}', 'maxResults': 1}
+
+
+def isbn_query(isbn):
+    return {'q': f"isbn:{isbn.replace('-', '')}"}
+
+
+def category_for(categories):
+    """Map the first API category to one of Book.CATEGORY_CHOICES, or 'other'"""
+    category = categories[0].lower() if categories else 'fiction'
+    category = CATEGORY_LABELS.get(category, category)
+    return category if category in CATEGORIES else 'other'
+
+
+def parse_volume(data):
+    """Turn a volumes response into the fields of a Book, or None when nothing was found"""
+    if not data.get('items'):
+        return None
+    volume_info = data['items'][0]['volumeInfo']
+
+    authors = volume_info.get('authors', ['Unknown Author'])
+    description = volume_info.get('description', '')
+
+    # Extract ISBN if available
+    isbn = 'Unknown'
+    for identifier in volume_info.get('industryIdentifiers', []):
+        if identifier.get('type') in ['ISBN_13', 'ISBN_10']:
+            isbn = identifier.get('identifier', 'Unknown')
+            break
+
+    # Try to get the largest available cover image, over https
+    cover_image = None
+    image_links = volume_info.get('imageLinks', {})
+    for img_type in ['extraLarge', 'large', 'medium', 'thumbnail', 'smallThumbnail']:
+        if img_type in image_links:
+            cover_image = image_links[img_type]
+            if cover_image.startswith('http://'):
+                cover_image = 'https://' + cover_image[7:]
+            break
+
+    return {
+        'title': volume_info.get('title', 'Unknown Title'),
+        'author': authors[0] if authors else 'Unknown Author',
+        'description': description[:500] if description else 'No description available.',
+        'isbn': isbn,
+        'total_copies': random.randint(3, 10),
+        'available_copies': random.randint(1, 3),
+        'category': category_for(volume_info.get('categories', ['fiction'])),
+        'cover_image': cover_image,
+    }
+
+
+class BookFetcher:
+    """Look up books concurrently through one shared session, rate limiter and cache"""
+
+    def __init__(self, api_url=DEFAULT_API_URL, workers=8, rate=5.0, burst=1, retries=3,
+                 backoff=1.0, max_backoff=MAX_BACKOFF, timeout=10, cache=None):
+        self.api_url = api_url
+        self.workers = max(workers, 1)
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = max(retries, 0)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        # One pooled keep-alive connection per worker
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def close(self):
+        self.session.close()
+
+    def get(self, params):
+        """Return the decoded response for params, from the cache or the API, and the attempts made"""
+        url = requests.Request('GET', self.api_url, params=params).prepare().url
+        if self.cache is not None:
+            data = self.cache.get(url)
+            if data is not None:
+                return data, 0
+
+        for attempt in range(1, self.retries + 2):
+            self.bucket.acquire()
+            delay = self.backoff * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            try:
+                response = self.session.get(url, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = str(e)
+            else:
+                if response.status_code == 200:
+                    data = response.json()
+                    if self.cache is not None:
+                        self.cache.set(url, data)
+                    return data, attempt
+                if response.status_code not in RETRY_STATUSES:
+                    raise FetchError(f"HTTP {response.status_code}")
+                error = f"HTTP {response.status_code}"
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = int(retry_after)
+            if attempt <= self.retries:
+                # One response must not stall a worker for longer than max_backoff
+                time.sleep(min(delay, self.max_backoff))
+        raise FetchError(f"{error} after {self.retries + 1} attempts")
+
+    def lookup(self, identifier, params):
+        try:
+            data, attempts = self.get(params)
+            return FetchResult(identifier, parse_volume(data), cached=attempts == 0, attempts=attempts)
+        except (FetchError, requests.RequestException, ValueError) as e:
+            return FetchResult(identifier, error=str(e))
+
+    def fetch(self, queries):
+        """Look up (identifier, params) pairs concurrently, yielding FetchResults in input order"""
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='book-fetch') as executor:
+            yield from executor.map(lambda query: self.lookup(*query), queries)
@@ -0,0 +1,290 @@
+"""Bulk import of the book catalogue from CSV or JSON Lines.
+
+The input is read as a stream and written in chunks of BOOK_IMPORT_CHUNK_SIZE
+rows, each an INSERT ... ON CONFLICT (isbn) DO UPDATE in its own transaction,
+so memory stays flat whatever the size of the file. ISBNs are normalized to
+their 13-digit form before they are matched. A row that cannot be read or
+fails validation is reported with its line number and skipped; the rest of
+the file is still imported. When rows repeat an ISBN the last one wins, and
+the repeats count as updates.
+
+New books get the copies given in the row. For books that already exist only
+the catalogue data is updated, because their stock also moves with
+borrowings and is managed through the book routes.
+"""
+import csv
+import json
+import re
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.validators import URLValidator
+from django.db import DatabaseError, reset_queries, transaction
+
+from core.cache import invalidate_analytics
+from core.models.book import Book
+
+
+FORMATS = ['csv', 'jsonl']
+
+# Fields an import writes over an existing book with the same ISBN
+UPDATE_FIELDS = ['title', 'author', 'description', 'category', 'cover_image', 'updated_at']
+
+CATEGORIES = {key for key, _ in Book.CATEGORY_CHOICES}
+CATEGORY_LABELS = {label.lower(): key for key, label in Book.CATEGORY_CHOICES}
+
+validate_url = URLValidator()
+
+
+def format_for(filename):
+    """Guess the format of a file from its extension, or return None"""
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'csv':
+        return 'csv'
+    if extension in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    return None
+
+
+def _isbn13_check_digit(first_twelve):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first_twelve))
+    return str(-total % 10)
+
+
+def normalize_isbn(value):
+    """Return the ISBN-13 form of an ISBN-10 or ISBN-13, ignoring hyphens and spaces.
+
+    ValueError is raised when value is not an ISBN or its check digit is wrong.
+    """
+    isbn = re.sub(r'[\s-]', '', str(value)).upper()
+    if isbn.startswith('ISBN'):
+        isbn = isbn[4:].lstrip(':')
+
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        total = sum((10 - i) * (10 if digit == 'X' else int(digit)) for i, digit in enumerate(isbn))
+        if total % 11:
+            raise ValueError(f"Invalid ISBN-10 check digit: {value}")
+        isbn = '978' + isbn[:9]
+        return isbn + _isbn13_check_digit(isbn)
+
+    if len(isbn) == 13 and isbn.isdigit():
+        if _isbn13_check_digit(isbn[:12]) != isbn[12]:
+            raise ValueError(f"Invalid ISBN-13 check digit: {value}")
+        return isbn
+
+    raise ValueError(f"Not an ISBN: {value}")
+
+
+def canonical_isbn(value):
+    """The ISBN-13 form of value when it is a valid ISBN, else value as given.
+
+    Books created or edited one at a time are stored in the form imports
+    match on; other identifiers, such as 'Unknown', are kept.
+    """
+    try:
+        return normalize_isbn(value)
+    except ValueError:
+        return value
+
+
+def _text(data, name, max_length=None, required=False):
+    value = data.get(name)
+    value = '' if value is None else str(value).strip()
+    if required and not value:
+        raise ValueError(f"{name} is required")
+    if max_length is not None and len(value) > max_length:
+        raise ValueError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def _count(data, name, default):
+    value = data.get(name)
+    if value is None or str(value).strip() == '':
+        return default
+    try:
+        count = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"{name} must be a whole number, not {value!r}")
+    if count < 0:
+        raise ValueError(f"{name} must not be negative")
+    return count
+
+
+def clean_row(data):
+    """Validate one decoded row and return the Book it describes, or raise ValueError"""
+    if not isinstance(data, dict):
+        raise ValueError("Expected an object of book fields")
+
+    isbn = normalize_isbn(_text(data, 'isbn', required=True))
+
+    total_copies = _count(data, 'total_copies', 1)
+    available_copies = _count(data, 'available_copies', total_copies)
+    if available_copies > total_copies:
+        raise ValueError("available_copies must not exceed total_copies")
+
+    category = _text(data, 'category').lower() or 'other'
+    category = CATEGORY_LABELS.get(category, category)
+    if category not in CATEGORIES:
+        raise ValueError(f"Unknown category: {category}")
+
+    cover_image = _text(data, 'cover_image', max_length=200) or None
+    if cover_image:
+        try:
+            validate_url(cover_image)
+        except ValidationError:
+            raise ValueError(f"cover_image is not a valid URL: {cover_image}")
+
+    return Book(
+        title=_text(data, 'title', max_length=255, required=True),
+        author=_text(data, 'author', max_length=255, required=True),
+        description=_text(data, 'description') or None,
+        isbn=isbn,
+        total_copies=total_copies,
+        available_copies=available_copies,
+        category=category,
+        cover_image=cover_image,
+    )
+
+
+def read_rows(stream, format):
+    """Yield the line number and decoded row of each record of a text stream.
+
+    A row that cannot be decoded is yielded as the ValueError explaining why.
+    """
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    elif format == 'jsonl':
+        for number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, ValueError(f"Invalid JSON: {e}")
+    else:
+        raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+
+
+class ImportReport:
+    """Running totals of an import, keeping the first max_errors row errors.
+
+    on_error, if given, is called with the line, ISBN and message of every error.
+    """
+
+    def __init__(self, max_errors=None, on_error=None):
+        self.max_errors = settings.BOOK_IMPORT_MAX_ERRORS if max_errors is None else max_errors
+        self.on_error = on_error
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    @property
+    def processed(self):
+        return self.created + self.updated + self.failed
+
+    def add_error(self, line, isbn, message):
+        self.failed += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'line': line, 'isbn': isbn or None, 'error': message})
+        if self.on_error:
+            self.on_error(line, isbn, message)
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def _write_chunk(chunk, report):
+    """Upsert a chunk of (line, book) pairs keyed by ISBN"""
+    books = [book for _, book in chunk.values()]
+    try:
+        with transaction.atomic():
+            existing = set(Book.objects.filter(isbn__in=list(chunk)).values_list('isbn', flat=True))
+            Book.objects.bulk_create(
+                books, update_conflicts=True, unique_fields=['isbn'], update_fields=UPDATE_FIELDS
+            )
+    except DatabaseError:
+        # Find the offending rows by writing the chunk one book at a time
+        for line, book in chunk.values():
+            try:
+                with transaction.atomic():
+                    existed = Book.objects.filter(isbn=book.isbn).exists()
+                    Book.objects.bulk_create(
+                        [book], update_conflicts=True, unique_fields=['isbn'], update_fields=UPDATE_FIELDS
+                    )
+            except DatabaseError as e:
+                report.add_error(line, book.isbn, str(e))
+                continue
+            if existed:
+                report.updated += 1
+            else:
+                report.created += 1
+        return
+
+    report.updated += len(existing)
+    report.created += len(books) - len(existing)
+
+
+def import_books(stream, format, chunk_size=None, report=None, on_chunk=None):
+    """Import the books of a CSV or JSON Lines text stream and return an ImportReport"""
+    return import_rows(read_rows(stream, format), chunk_size, report, on_chunk)
+
+
+def import_rows(rows, chunk_size=None, report=None, on_chunk=None):
+    """Import (line, row) pairs of book fields and return an ImportReport.
+
+    on_chunk, if given, is called with the report after each chunk is written.
+    A row repeating the ISBN of an earlier row updates the book that row
+    wrote, whether or not they fall in the same chunk; nothing is kept across
+    chunks.
+    """
+    chunk_size = chunk_size or settings.BOOK_IMPORT_CHUNK_SIZE
+    report = report or ImportReport()
+
+    chunk = {}
+    repeated = 0
+    for line, data in rows:
+        if isinstance(data, ValueError):
+            report.add_error(line, None, str(data))
+            continue
+        try:
+            book = clean_row(data)
+        except ValueError as e:
+            report.add_error(line, data.get('isbn') if isinstance(data, dict) else None, str(e))
+            continue
+
+        previous = chunk.get(book.isbn)
+        if previous is not None:
+            # As in a later chunk, the earlier row's copies stand and this row
+            # only updates the catalogue data
+            book.total_copies = previous[1].total_copies
+            book.available_copies = previous[1].available_copies
+            repeated += 1
+        chunk[book.isbn] = (line, book)
+        if len(chunk) + repeated >= chunk_size:
+            _write_chunk(chunk, report)
+            # Rows replaced by a later one with the same ISBN count as updates
+            report.updated += repeated
+            chunk, repeated = {}, 0
+            # With DEBUG on every query is kept, which would grow with the file
+            reset_queries()
+            if on_chunk:
+                on_chunk(report)
+
+    if chunk:
+        _write_chunk(chunk, report)
+        report.updated += repeated
+        if on_chunk:
+            on_chunk(report)
+
+    # bulk_create bypasses the post_save hook that keeps cached analytics current
+    if report.created or report.updated:
+        invalidate_analytics()
+    return report
@@ -0,0 +1,106 @@
+"""Response cache for the admin analytics endpoints.
+
+Results are stored in the default Django cache under the endpoint name and
+its query parameters, prefixed with a shared version number. Anything that
+changes the data behind the dashboard calls invalidate_analytics(), which
+bumps the version so every cached response is skipped at once; the stale
+entries simply age out. ANALYTICS_CACHE_TIMEOUT bounds how long a response
+is reused even without writes, since overdue counts move with the clock.
+
+The routes are async. The cache is read in one call on a pooled thread and
+only a miss hands the (multi-query, synchronous) computation to a worker
+thread bound to the request, where its database connection lives.
+"""
+from functools import wraps
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import QuerySet
+
+
+VERSION_KEY = 'analytics:version'
+
+
+def analytics_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def invalidate_analytics():
+    """Make every cached analytics response stale once the current transaction commits.
+
+    Bumping before the commit would let a concurrent request cache the old
+    figures under the new version.
+    """
+    transaction.on_commit(_bump_version)
+
+
+def _bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No version stored yet (or it was evicted): start a new one
+        cache.add(VERSION_KEY, 1, timeout=None)
+
+
+def cache_key(version, name, params):
+    query = urlencode(sorted((key, value) for key, value in params.items() if value is not None))
+    return f'analytics:{version}:{name}:{query}'
+
+
+def lookup(names, params):
+    """Return the cache keys of the current version and the results found under them"""
+    keys = {name: cache_key(analytics_version(), name, params) for name in names}
+    return keys, cache.get_many(keys.values())
+
+
+async def cached_many(names, params, compute):
+    """Return {name: result} for several analytics results sharing the same parameters.
+
+    Cached results are read in one round trip; the coroutine function
+    compute(missing_names) must return the others as a dict, which is then
+    stored. Django's async cache methods each hop to a thread of the request,
+    so the version and the results are fetched together on a pooled thread.
+    """
+    keys, found = await sync_to_async(lookup, thread_sensitive=False)(names, params)
+    results = {name: found[key] for name, key in keys.items() if key in found}
+
+    missing = [name for name in names if name not in results]
+    if missing:
+        computed = await compute(missing)
+        await sync_to_async(cache.set_many, thread_sensitive=False)(
+            {keys[name]: result for name, result in computed.items()},
+            timeout=getattr(settings, 'ANALYTICS_CACHE_TIMEOUT', 60)
+        )
+        results.update(computed)
+    return {name: results[name] for name in names}
+
+
+def evaluated(result):
+    """Turn a lazy queryset result into a list so it can be cached"""
+    return list(result) if isinstance(result, QuerySet) else result
+
+
+def cached_analytics(name):
+    """Serve a synchronous analytics view as an async route cached on name and query parameters.
+
+    The view itself runs in a worker thread, and only when its result is not
+    cached, so a slow computation never blocks the event loop.
+    """
+    def decorator(view):
+        compute_view = sync_to_async(lambda self, request, kwargs: evaluated(view(self, request, **kwargs)))
+
+        @wraps(view)
+        async def wrapper(self, request, **kwargs):
+            async def compute(missing):
+                return {name: await compute_view(self, request, kwargs)}
+            results = await cached_many([name], kwargs, compute)
+            return results[name]
+        return wrapper
+    return decorator
@@ -1,447 +1,593 @@
+import asyncio
 from ninja_extra import api_controller, route
-from django.db.models import Count, Q
-from django.db.models.functions import TruncMonth, TruncDay, TruncWeek
+from ninja.errors import HttpError
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractWeekDay
 from django.utils import timezone
-from datetime import timedelta
-from typing import List, Dict, Any
-from core.models.book import Book, BookBorrowing, User
+from datetime import date, timedelta
+from typing import List, Dict, Any, Optional
+from core.models.book import Book, BookBorrowing, User, popularity_score
 from core.models.event import Event, EventRegistration
-from ..permissions import IsAdmin
+from core.cache import cached_analytics, cached_many, evaluated
+from core.models.analytics import DailyAnalytics
+from core.rollup import count_active_users, ensure_range, rollup_rows
+from core.timebuckets import Buckets, day_start
+from core.schemas.analytics import (
+    AnalyticsSummarySchema, BookStatSchema, UserStatSchema,
+    BorrowingTrendSchema, PopularBookSchema
+)
+from ..permissions import AsyncIsAdmin
 
 
-is_admin = IsAdmin()
+is_admin = AsyncIsAdmin()
+
+TIME_RANGE_DAYS = {
+    '30days': 30,
+    '3months': 90,
+    '6months': 180,
+    '1year': 365,
+}
+
+# Most queries one computed response may issue, whatever the size of the data.
+# The dashboard runs its panels on other connections, where its request's
+# query count does not see them, so it has no budget of its own.
+QUERY_BUDGETS = {
+    'metrics': 3,
+    'categories': 2,
+    'activity': 2,
+    'users': 3,
+    'events': 2,
+    'summary': 5,
+    'books': 3,
+    'user-stats': 4,
+    'borrowing-trends': 2,
+    'popular-books': 1,
+}
+
+# Names of ExtractWeekDay values, which run from 1 (Sunday) to 7 (Saturday)
+WEEKDAY_NAMES = ['Sunday', 'Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+
+
+# Timestamps behind the rollup fields that are charted, for buckets shorter than a day
+FIELD_TIMESTAMPS = {
+    'borrows': (BookBorrowing, 'borrowed_date'),
+    'returns': (BookBorrowing, 'returned_date'),
+    'new_users': (User, 'date_joined'),
+    'registrations': (EventRegistration, 'registration_date'),
+    'events_created': (Event, 'created_at'),
+}
+
+
+def analytics_days(timeRange='6months', start=None, end=None):
+    """Resolve the range parameters of an analytics route into its first and last day
+
+    start and end are inclusive calendar days and take precedence over
+    timeRange, which otherwise says how far back from today (or from end) the
+    range starts.
+    """
+    end_day = end or timezone.localdate()
+    start_day = start or end_day - timedelta(days=TIME_RANGE_DAYS.get(timeRange, 180))
+    return start_day, end_day
+
+
+def analytics_buckets(timeRange='6months', start=None, end=None, granularity=None):
+    """Resolve the range parameters of an analytics route into time buckets
+
+    The range is that of analytics_days. Without a granularity one is picked
+    from the length of the range: days up to a month, weeks up to three
+    months, then months and, beyond two years, quarters.
+    """
+    start_day, end_day = analytics_days(timeRange, start, end)
+    try:
+        return Buckets(
+            day_start(start_day), day_start(end_day + timedelta(days=1)), granularity,
+            limit=getattr(settings, 'ANALYTICS_MAX_BUCKETS', 1000)
+        )
+    except ValueError as error:
+        raise HttpError(400, str(error))
+
+
+def totals_by_bucket(buckets, rows, fields):
+    """Add up rollup fields per bucket; hourly buckets are counted from the timestamps instead"""
+    if buckets.granularity != 'hour':
+        return buckets.sum(rows, fields)
+    
+    totals = [{} for _ in buckets.starts]
+    for field in fields:
+        model, column = FIELD_TIMESTAMPS[field]
+        moments = model.objects.filter(**{
+            f'{column}__gte': buckets.start, f'{column}__lt': buckets.end
+        }).values_list(column, flat=True)
+        for total, count in zip(totals, buckets.count(moments.iterator())):
+            total[field] = count
+    return totals
+
+
+class RollupWindow:
+    """Daily rollup rows loaded once and shared by the panels of a dashboard request"""
+
+    def __init__(self, first_day, last_day):
+        self.rows = rollup_rows(first_day, last_day)
+
+    def between(self, first_day, last_day):
+        return [row for row in self.rows if first_day <= row.date <= last_day]
+
+
+def rows_between(rollup, first_day, last_day):
+    """Rollup rows of a range, from the shared window when a panel is given one"""
+    if rollup is None:
+        return rollup_rows(first_day, last_day)
+    return rollup.between(first_day, last_day)
+
+
+# Panels of the admin dashboard, each served by its own route and by /analytics/dashboard.
+# They take the Buckets of the requested range and, given a RollupWindow, read
+# from it instead of querying the rollup themselves.
+def metrics_panel(buckets, rollup=None):
+    """Totals and trends of the metrics cards
+
+    Trends compare with the period of the same length just before the range.
+    Checked-out and overdue counts are those of the present moment.
+    """
+    now = timezone.now()
+    start_date, end_date = buckets.start, buckets.end
+    prev_start_date = start_date - (end_date - start_date)  # Previous period for trends
+    
+    # Borrowing totals and the overdue snapshot come from the daily rollup
+    start_day = buckets.first_day
+    prev_start_day = start_day - (buckets.last_day - start_day) - timedelta(days=1)
+    rows = rows_between(rollup, prev_start_day, buckets.last_day)
+    
+    total_books = sum(row.borrows for row in rows if row.date >= start_day)
+    prev_total_books = sum(row.borrows for row in rows if row.date < start_day)
+    
+    # Overdue borrowings as they stood when the current period began
+    prev_overdue_books = next(
+        (row.overdue for row in rows if row.date == start_day - timedelta(days=1)), 0
+    )
+    
+    # Everything else, for both periods, in one pass over the open and recent borrowings
+    is_open = Q(status__in=BookBorrowing.OPEN_STATUSES)
+    figures = BookBorrowing.objects.filter(
+        is_open | Q(borrowed_date__gte=prev_start_date, borrowed_date__lt=end_date)
+    ).aggregate(
+        checked_out=Count('id', filter=is_open),
+        overdue=Count('id', filter=BookBorrowing.overdue_condition(now)),
+        prev_checked_out=Count('id', filter=is_open & Q(borrowed_date__lt=start_date)),
+        active_users=Count('user', distinct=True, filter=Q(
+            borrowed_date__gte=start_date, borrowed_date__lt=end_date
+        )),
+        prev_active_users=Count('user', distinct=True, filter=Q(
+            borrowed_date__gte=prev_start_date, borrowed_date__lt=start_date
+        ))
+    )
+    books_checked_out = figures['checked_out']
+    overdue_books = figures['overdue']
+    active_users = figures['active_users']
+    prev_books_checked_out = figures['prev_checked_out']
+    prev_active_users = figures['prev_active_users']
+    
+    # Calculate trends
+    def calculate_trend(current, previous):
+        if previous == 0:
+            return "+100%" if current > 0 else "0%"
+        change = ((current - previous) / previous) * 100
+        return f"+{change:.1f}%" if change >= 0 else f"{change:.1f}%"
+    
+    books_trend = calculate_trend(total_books, prev_total_books)
+    checked_out_trend = calculate_trend(books_checked_out, prev_books_checked_out)
+    overdue_trend = calculate_trend(overdue_books, prev_overdue_books)
+    users_trend = calculate_trend(active_users, prev_active_users)
+    
+    return {
+        "totalBooks": total_books,
+        "booksCheckedOut": books_checked_out,
+        "overdueBooks": overdue_books,
+        "activeUsers": active_users,
+        "booksTrend": books_trend,
+        "checkedOutTrend": checked_out_trend,
+        "overdueTrend": overdue_trend,
+        "usersTrend": users_trend
+    }
+
+def categories_panel(buckets, rollup=None):
+    """Borrowings per book category"""
+    # Sum the per-category borrowing counts of the daily rollup
+    totals = {}
+    for row in rows_between(rollup, buckets.first_day, buckets.last_day):
+        for category, count in row.borrows_by_category.items():
+            totals[category] = totals.get(category, 0) + count
+    
+    category_data = [
+        {'category': category, 'value': value}
+        for category, value in sorted(totals.items(), key=lambda item: -item[1])
+    ]
+    
+    # If no data, get overall book counts by category
+    if not category_data:
+        category_data = Book.objects.values('category').annotate(
+            value=Count('id')
+        ).order_by('-value')
+    
+    # Convert to list of dicts with proper naming
+    result = []
+    
+    # Define colors for different categories (these match the frontend chart colors)
+    colors = [
+        "hsl(var(--chart-1))",
+        "hsl(var(--chart-2))",
+        "hsl(var(--chart-3))",
+        "hsl(var(--chart-4))",
+        "hsl(var(--chart-5))"
+    ]
+    
+    for i, item in enumerate(category_data):
+        category_name = item['category'].capitalize() if item['category'] else "Uncategorized"
+        result.append({
+            "name": category_name,
+            "value": item['value'],
+            "color": colors[i % len(colors)]
+        })
+    
+    return result
+
+def activity_panel(buckets, rollup=None):
+    """Borrowing and return activity over time"""
+    # Fill every period of the range from the daily rollup
+    rows = rows_between(rollup, buckets.first_day, buckets.last_day)
+    totals = totals_by_bucket(buckets, rows, ['borrows', 'returns'])
+    
+    # Combine the data
+    activity = []
+    for period_start, label, total in zip(buckets.starts, buckets.labels(), totals):
+        activity.append({
+            "period": period_start,
+            "month": label,  # Keep 'month' for compatibility
+            "borrowed": total['borrows'],
+            "returned": total['returns']
+        })
+        
+    return activity
+
+def user_metrics_panel(buckets, rollup=None):
+    """User growth and activity over time"""
+    # Fill new users of every period of the range from the daily rollup
+    rows = rows_between(rollup, buckets.first_day, buckets.last_day)
+    totals = totals_by_bucket(buckets, rows, ['new_users'])
+    
+    # Active users: daily figures are stored in the rollup, but distinct users
+    # over any other period cannot be summed from days, so those are counted
+    if buckets.granularity == 'day':
+        active_counts = [total['active_users'] for total in buckets.sum(rows, ['active_users'])]
+    else:
+        active_counts = count_active_users(
+            [max(start, buckets.start) for start in buckets.starts],
+            [min(end, buckets.end) for end in buckets.ends]
+        )
+    
+    # Combine the data
+    user_metrics = []
+    for period_start, label, total, active_count in zip(buckets.starts, buckets.labels(), totals, active_counts):
+        user_metrics.append({
+            "period": period_start,
+            "month": label,  # Keep 'month' for compatibility
+            "new_users": total['new_users'],
+            "active_users": active_count
+        })
+        
+    return user_metrics
+
+def event_panel(buckets, rollup=None):
+    """Event and registration figures over time"""
+    # Events and registrations over time from the daily rollup
+    rows = rows_between(rollup, buckets.first_day, buckets.last_day)
+    totals = totals_by_bucket(buckets, rows, ['events_created', 'registrations'])
+    
+    total_events = sum(row.events_created for row in rows)
+    total_registrations = sum(row.registrations for row in rows)
+    
+    # Average registrations per event
+    avg_registrations = total_registrations / total_events if total_events > 0 else 0
+    
+    # Events by category
+    category_totals = {}
+    for row in rows:
+        for category, count in row.events_by_category.items():
+            category_totals[category] = category_totals.get(category, 0) + count
+    
+    # Convert to response format
+    events_by_category_list = [
+        {
+            "category": category if category else "Uncategorized",
+            "count": count
+        }
+        for category, count in sorted(category_totals.items(), key=lambda item: -item[1])
+    ]
+    
+    activity_over_time = [
+        {
+            "period": period_start,
+            "month": label,
+            "events": total['events_created'],
+            "registrations": total['registrations']
+        }
+        for period_start, label, total in zip(buckets.starts, buckets.labels(), totals)
+    ]
+    
+    return {
+        "totalEvents": total_events,
+        "totalRegistrations": total_registrations,
+        "avgRegistrationsPerEvent": round(avg_registrations, 2),
+        "eventsByCategory": events_by_category_list,
+        "activityOverTime": activity_over_time
+    }
+
+
+DASHBOARD_PANELS = {
+    'metrics': metrics_panel,
+    'categories': categories_panel,
+    'activity': activity_panel,
+    'users': user_metrics_panel,
+    'events': event_panel,
+}
+
+
+def run_panel(panel, buckets, rollup):
+    """Compute one panel on a worker thread and release that thread's database connection"""
+    try:
+        return evaluated(panel(buckets, rollup))
+    finally:
+        connection.close()
+
 
 # Change the path to match what the frontend expects
 @api_controller('/admin')
 class AnalyticsController:
     
     @route.get('/analytics/metrics', response=Dict[str, Any], auth=is_admin)
-    def get_metrics(self, request, timeRange: str = '6months'):
+    @cached_analytics('metrics')
+    def get_metrics(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                    end: Optional[date] = None, granularity: Optional[str] = None):
         """Get overall analytics metrics for the dashboard (admin only)"""
-        # Map time range to days
-        days_lookup = {
-            '30days': 30,
-            '3months': 90,
-            '6months': 180,
-            '1year': 365,
-        }
-        days = days_lookup.get(timeRange, 180)  # Default to 6 months
-        
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        prev_start_date = start_date - timedelta(days=days)  # Previous period for trends
-        
-        # Get current period metrics
-        total_books = BookBorrowing.objects.filter(
-            borrowed_date__gte=start_date
-        ).count()
-        
-        books_checked_out = BookBorrowing.objects.filter(
-            status='active'
-        ).count()
-        
-        overdue_books = BookBorrowing.objects.filter(
-            status='active',
-            due_date__lt=end_date
-        ).count()
-        
-        active_users = User.objects.filter(
-            borrowed_books__borrowed_date__gte=start_date
-        ).distinct().count()
-        
-        # Get previous period metrics for trends
-        prev_total_books = BookBorrowing.objects.filter(
-            borrowed_date__gte=prev_start_date,
-            borrowed_date__lt=start_date
-        ).count()
-        
-        prev_books_checked_out = BookBorrowing.objects.filter(
-            borrowed_date__lt=start_date,
-            status='active'
-        ).count() if prev_start_date else 0
-        
-        prev_overdue_books = BookBorrowing.objects.filter(
-            status='active',
-            due_date__lt=start_date
-        ).count() if prev_start_date else 0
-        
-        prev_active_users = User.objects.filter(
-            borrowed_books__borrowed_date__gte=prev_start_date,
-            borrowed_books__borrowed_date__lt=start_date
-        ).distinct().count() if prev_start_date else 0
-        
-        # Calculate trends
-        def calculate_trend(current, previous):
-            if previous == 0:
-                return "+100%" if current > 0 else "0%"
-            change = ((current - previous) / previous) * 100
-            return f"+{change:.1f}%" if change >= 0 else f"{change:.1f}%"
-        
-        books_trend = calculate_trend(total_books, prev_total_books)
-        checked_out_trend = calculate_trend(books_checked_out, prev_books_checked_out)
-        overdue_trend = calculate_trend(overdue_books, prev_overdue_books)
-        users_trend = calculate_trend(active_users, prev_active_users)
-        
-        return {
-            "totalBooks": total_books,
-            "booksCheckedOut": books_checked_out,
-            "overdueBooks": overdue_books,
-            "activeUsers": active_users,
-            "booksTrend": books_trend,
-            "checkedOutTrend": checked_out_trend,
-            "overdueTrend": overdue_trend,
-            "usersTrend": users_trend
-        }
-    
+        return metrics_panel(analytics_buckets(timeRange, start, end, granularity))
+
     @route.get('/analytics/categories', response=List[Dict[str, Any]], auth=is_admin)
-    def get_categories(self, request, timeRange: str = '6months'):
+    @cached_analytics('categories')
+    def get_categories(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                       end: Optional[date] = None, granularity: Optional[str] = None):
         """Get statistics by book category"""
-        # Map time range to days
-        days_lookup = {
-            '30days': 30,
-            '3months': 90,
-            '6months': 180,
-            '1year': 365,
-        }
-        days = days_lookup.get(timeRange, 180)
-        
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # Get books borrowed in the time period
-        borrowed_books = BookBorrowing.objects.filter(
-            borrowed_date__gte=start_date
-        ).values_list('book_id', flat=True)
-        
-        # Get categories with their borrowing counts
-        category_data = Book.objects.filter(
-            id__in=borrowed_books
-        ).values('category').annotate(
-            value=Count('id')
-        ).order_by('-value')
-        
-        # If no data, get overall book counts by category
-        if not category_data:
-            category_data = Book.objects.values('category').annotate(
-                value=Count('id')
-            ).order_by('-value')
-        
-        # Convert to list of dicts with proper naming
-        result = []
-        
-        # Define colors for different categories (these match the frontend chart colors)
-        colors = [
-            "hsl(var(--chart-1))",
-            "hsl(var(--chart-2))",
-            "hsl(var(--chart-3))",
-            "hsl(var(--chart-4))",
-            "hsl(var(--chart-5))"
-        ]
-        
-        for i, item in enumerate(category_data):
-            category_name = item['category'].capitalize() if item['category'] else "Uncategorized"
-            result.append({
-                "name": category_name,
-                "value": item['value'],
-                "color": colors[i % len(colors)]
-            })
-        
-        return result
-    
+        return categories_panel(analytics_buckets(timeRange, start, end, granularity))
+
     @route.get('/analytics/activity', response=List[Dict[str, Any]], auth=is_admin)
-    def get_activity(self, request, timeRange: str = '6months'):
+    @cached_analytics('activity')
+    def get_activity(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                     end: Optional[date] = None, granularity: Optional[str] = None):
         """Get borrowing and return activity over time"""
-        # Map time range to days and truncation function
-        time_config = {
-            '30days': {'days': 30, 'trunc': TruncDay, 'date_format': '%d %b'},
-            '3months': {'days': 90, 'trunc': TruncWeek, 'date_format': '%d %b'},
-            '6months': {'days': 180, 'trunc': TruncMonth, 'date_format': '%b'},
-            '1year': {'days': 365, 'trunc': TruncMonth, 'date_format': '%b'},
-        }
-        
-        config = time_config.get(timeRange, time_config['6months'])
-        days = config['days']
-        trunc_function = config['trunc']
-        
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # Query for borrowed books grouped by time period
-        borrowed = BookBorrowing.objects.filter(
-            borrowed_date__gte=start_date,
-            borrowed_date__lte=end_date
-        ).annotate(
-            period=trunc_function('borrowed_date')
-        ).values('period').annotate(
-            count=Count('id')
-        ).order_by('period')
-
-        # Query for returned books grouped by time period
-        returned = BookBorrowing.objects.filter(
-            returned_date__isnull=False,
-            returned_date__gte=start_date,
-            returned_date__lte=end_date
-        ).annotate(
-            period=trunc_function('returned_date')
-        ).values('period').annotate(
-            count=Count('id')
-        ).order_by('period')
-        
-        # Convert to dictionaries for easier merging
-        borrowed_dict = {item['period'].strftime(config['date_format']): item['count'] for item in borrowed}
-        returned_dict = {item['period'].strftime(config['date_format']): item['count'] for item in returned}
-        
-        # Get all periods within the date range
-        all_periods = []
-        
-        if timeRange == '30days':
-            # Generate days for 30 days period
-            for i in range(days):
-                day = start_date + timedelta(days=i)
-                all_periods.append(day.strftime(config['date_format']))
-        elif timeRange == '3months':
-            # Generate weeks for 3 months period
-            current_date = start_date
-            while current_date <= end_date:
-                all_periods.append(current_date.strftime(config['date_format']))
-                current_date += timedelta(days=7)
-        else:
-            # Generate months for 6 months or 1 year
-            current_date = start_date.replace(day=1)
-            while current_date <= end_date:
-                all_periods.append(current_date.strftime(config['date_format']))
-                
-                # Move to next month
-                if current_date.month == 12:
-                    current_date = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    current_date = current_date.replace(month=current_date.month + 1)
-        
-        # Combine the data
-        activity = []
-        for period in all_periods:
-            activity.append({
-                "month": period,  # Keep 'month' for compatibility
-                "borrowed": borrowed_dict.get(period, 0),
-                "returned": returned_dict.get(period, 0)
-            })
-            
-        return activity
-    
+        return activity_panel(analytics_buckets(timeRange, start, end, granularity))
+
     @route.get('/analytics/users', response=List[Dict[str, Any]], auth=is_admin)
-    def get_user_metrics(self, request, timeRange: str = '6months'):
+    @cached_analytics('users')
+    def get_user_metrics(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                         end: Optional[date] = None, granularity: Optional[str] = None):
         """Get user growth and activity metrics"""
-        # Map time range to days and truncation function
-        time_config = {
-            '30days': {'days': 30, 'trunc': TruncDay, 'date_format': '%d %b'},
-            '3months': {'days': 90, 'trunc': TruncWeek, 'date_format': '%d %b'},
-            '6months': {'days': 180, 'trunc': TruncMonth, 'date_format': '%b'},
-            '1year': {'days': 365, 'trunc': TruncMonth, 'date_format': '%b'},
-        }
-        
-        config = time_config.get(timeRange, time_config['6months'])
-        days = config['days']
-        trunc_function = config['trunc']
-        
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
-        
-        # New users: count users by join date
-        new_users = User.objects.filter(
-            date_joined__gte=start_date,
-            date_joined__lte=end_date
-        ).annotate(
-            period=trunc_function('date_joined')
-        ).values('period').annotate(
-            count=Count('id')
-        ).order_by('period')
-        
-        # Active users: count distinct users who borrowed books in each period
-        active_users_by_period = {}
-        
-        if timeRange == '30days':
-            # For each day, count users who borrowed books
-            for i in range(days):
-                day = start_date + timedelta(days=i)
-                next_day = day + timedelta(days=1)
-                
-                active_count = User.objects.filter(
-                    borrowed_books__borrowed_date__lt=next_day
-                ).filter(
-                    Q(borrowed_books__returned_date__isnull=True) | 
-                    Q(borrowed_books__returned_date__gte=day)
-                ).distinct().count()
-                
-                active_users_by_period[day.strftime(config['date_format'])] = active_count
-        else:
-            # For each month, count users who borrowed books
-            current_date = start_date.replace(day=1)
-            while current_date <= end_date:
-                if current_date.month == 12:
-                    next_month = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    next_month = current_date.replace(month=current_date.month + 1)
-                
-                active_count = User.objects.filter(
-                    borrowed_books__borrowed_date__lt=next_month
-                ).filter(
-                    Q(borrowed_books__returned_date__isnull=True) | 
-                    Q(borrowed_books__returned_date__gte=current_date)
-                ).distinct().count()
-                
-                active_users_by_period[current_date.strftime(config['date_format'])] = active_count
-                
-                # Move to next month
-                current_date = next_month
-        
-        # Convert new users to dictionary
-        new_users_dict = {item['period'].strftime(config['date_format']): item['count'] for item in new_users}
-        
-        # Get all periods within the date range
-        all_periods = []
-        
-        if timeRange == '30days':
-            # Generate days for 30 days period
-            for i in range(days):
-                day = start_date + timedelta(days=i)
-                all_periods.append(day.strftime(config['date_format']))
-        elif timeRange == '3months':
-            # Generate weeks for 3 months period
-            current_date = start_date
-            while current_date <= end_date:
-                all_periods.append(current_date.strftime(config['date_format']))
-                current_date += timedelta(days=7)
-        else:
-            # Generate months for 6 months or 1 year
-            current_date = start_date.replace(day=1)
-            while current_date <= end_date:
-                all_periods.append(current_date.strftime(config['date_format']))
-                
-                # Move to next month
-                if current_date.month == 12:
-                    current_date = current_date.replace(year=current_date.year + 1, month=1)
-                else:
-                    current_date = current_date.replace(month=current_date.month + 1)
-        
-        # Combine the data
-        user_metrics = []
-        for period in all_periods:
-            user_metrics.append({
-                "month": period,  # Keep 'month' for compatibility
-                "new_users": new_users_dict.get(period, 0),
-                "active_users": active_users_by_period.get(period, 0)
-            })
-            
-        return user_metrics
+        return user_metrics_panel(analytics_buckets(timeRange, start, end, granularity))
 
     @route.get('/analytics/events', response=Dict[str, Any], auth=is_admin)
-    def get_event_analytics(self, request, timeRange: str = '6months'):
+    @cached_analytics('events')
+    def get_event_analytics(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                            end: Optional[date] = None, granularity: Optional[str] = None):
         """Get analytics related to events (admin only)"""
-        # Map time range to days
-        days_lookup = {
-            '30days': 30,
-            '3months': 90, 
-            '6months': 180,
-            '1year': 365,
-        }
-        days = days_lookup.get(timeRange, 180)
-        
-        # Calculate date range
-        end_date = timezone.now()
-        start_date = end_date - timedelta(days=days)
+        return event_panel(analytics_buckets(timeRange, start, end, granularity))
+
+    @route.get('/analytics/dashboard', response=Dict[str, Any], auth=is_admin)
+    async def get_dashboard(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                      end: Optional[date] = None, granularity: Optional[str] = None,
+                      panels: str = ','.join(DASHBOARD_PANELS)):
+        """Get several dashboard panels in one request (admin only)
+
+        panels is a comma-separated selection of metrics, categories, activity,
+        users and events. Cached panels are shared with the individual routes;
+        the rest read one rollup window loaded for all of them and run their
+        live queries concurrently.
+        """
+        names = list(dict.fromkeys(name.strip() for name in panels.split(',') if name.strip()))
+        unknown = [name for name in names if name not in DASHBOARD_PANELS]
+        if unknown or not names:
+            raise HttpError(400, f"panels must be a selection of: {', '.join(DASHBOARD_PANELS)}")
+        buckets = analytics_buckets(timeRange, start, end, granularity)
+        
+        async def compute(missing):
+            # The metrics panel compares with the previous period, so load twice the range
+            days = (buckets.last_day - buckets.first_day).days + 1
+            rollup = await sync_to_async(RollupWindow)(buckets.first_day - timedelta(days=days), buckets.last_day)
+            
+            # Each panel runs on its own worker thread and connection, a few at a time
+            workers = asyncio.Semaphore(max(getattr(settings, 'ANALYTICS_DASHBOARD_WORKERS', 4), 1))
+            
+            async def run(name):
+                async with workers:
+                    return await sync_to_async(run_panel, thread_sensitive=False)(
+                        DASHBOARD_PANELS[name], buckets, rollup
+                    )
+            
+            results = await asyncio.gather(*(run(name) for name in missing))
+            return dict(zip(missing, results))
         
-        # Get events in the time period
-        events = Event.objects.filter(
-            created_at__gte=start_date,
-            created_at__lte=end_date
+        # Same parameters as the individual routes, so that their cache entries are shared
+        params = {'timeRange': timeRange, 'start': start, 'end': end, 'granularity': granularity}
+        return await cached_many(names, params, compute)
+
+    @route.get('/analytics/summary', response=AnalyticsSummarySchema, auth=is_admin)
+    @cached_analytics('summary')
+    def get_summary(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                    end: Optional[date] = None):
+        """Get catalogue, user and borrowing totals (admin only)"""
+        now = timezone.now()
+        buckets = analytics_buckets(timeRange, start, end)
+        start_day, end_day = buckets.first_day, buckets.last_day
+        
+        books = Book.objects.aggregate(
+            total=Count('id'),
+            low_stock=Count('id', filter=Q(
+                available_copies__gt=0, available_copies__lte=F('total_copies') * 0.2
+            )),
+            unavailable=Count('id', filter=Q(available_copies=0))
         )
-        
-        total_events = events.count()
-        
-        # Get event registrations
-        registrations = EventRegistration.objects.filter(
-            registration_date__gte=start_date,
-            registration_date__lte=end_date
+        users = User.objects.aggregate(
+            readers=Count('id', filter=Q(role='reader')),
+            admins=Count('id', filter=Q(role='admin'))
+        )
+        borrowings = BookBorrowing.objects.filter(status__in=BookBorrowing.OPEN_STATUSES).aggregate(
+            active=Count('id'),
+            overdue=Count('id', filter=BookBorrowing.overdue_condition(now))
         )
         
-        total_registrations = registrations.count()
-        
-        # Average registrations per event
-        avg_registrations = total_registrations / total_events if total_events > 0 else 0
-        
-        # Events by category
-        events_by_category = events.values('category').annotate(
-            count=Count('id')
-        ).order_by('-count')
-        
-        # Events over time (by month)
-        events_over_time = events.annotate(
-            month=TruncMonth('created_at')
-        ).values('month').annotate(
-            count=Count('id')
-        ).order_by('month')
-        
-        # Registrations over time
-        registrations_over_time = registrations.annotate(
-            month=TruncMonth('registration_date')
-        ).values('month').annotate(
-            count=Count('id')
-        ).order_by('month')
+        # Weekday with the most borrowings in the time range, grouped over the daily rollup
+        ensure_range(start_day, end_day)
+        busiest = DailyAnalytics.objects.filter(date__gte=start_day, date__lte=end_day).annotate(
+            weekday=ExtractWeekDay('date')
+        ).values('weekday').annotate(count=Sum('borrows')).order_by('-count', 'weekday').first()
         
-        # Convert to response format
-        events_by_category_list = [
-            {
-                "category": item['category'] if item['category'] else "Uncategorized",
-                "count": item['count']
+        return {
+            "total_books": books['total'],
+            "total_users": users['readers'],
+            "total_admins": users['admins'],
+            "active_borrowings": borrowings['active'],
+            "overdue_borrowings": borrowings['overdue'],
+            "low_stock_books": books['low_stock'],
+            "unavailable_books": books['unavailable'],
+            "most_active_day": {
+                "day": WEEKDAY_NAMES[busiest['weekday'] - 1] if busiest else "",
+                "count": busiest['count'] if busiest else 0
             }
-            for item in events_by_category
-        ]
+        }
+
+    @route.get('/analytics/books', response=BookStatSchema, auth=is_admin)
+    @cached_analytics('books')
+    def get_book_stats(self, request, limit: int = 10):
+        """Get stock figures per category and the most borrowed books (admin only)"""
+        limit = min(max(limit, 1), 100)
+        
+        categories = list(Book.objects.values('category').annotate(
+            count=Count('id'),
+            total_copies=Sum('total_copies'),
+            available_copies=Sum('available_copies')
+        ).order_by('-count', 'category'))
+        
+        totals = Book.objects.aggregate(
+            total_copies=Sum('total_copies', default=0),
+            available_copies=Sum('available_copies', default=0)
+        )
+        borrowed_copies = totals['total_copies'] - totals['available_copies']
         
-        # Create a dictionary of months for more readable formats
-        months_dict = {}
-        current_date = start_date.replace(day=1)
-        while current_date <= end_date:
-            month_str = current_date.strftime('%b %Y')
-            months_dict[month_str] = {
-                "events": 0,
-                "registrations": 0
-            }
-            
-            # Move to next month
-            if current_date.month == 12:
-                current_date = current_date.replace(year=current_date.year + 1, month=1)
-            else:
-                current_date = current_date.replace(month=current_date.month + 1)
+        # Served by the (-borrow_count, id) index
+        most_borrowed = list(Book.objects.order_by('-borrow_count', 'id').values(
+            'id', 'title', 'author', 'borrow_count'
+        )[:limit])
         
-        # Fill in actual data
-        for item in events_over_time:
-            month_str = item['month'].strftime('%b %Y')
-            if month_str in months_dict:
-                months_dict[month_str]["events"] = item['count']
+        return {
+            "categories": categories,
+            "total_copies": totals['total_copies'],
+            "available_copies": totals['available_copies'],
+            "borrowed_copies": borrowed_copies,
+            "availability_percentage": round(
+                totals['available_copies'] / totals['total_copies'] * 100, 2
+            ) if totals['total_copies'] else 0.0,
+            "most_borrowed": most_borrowed
+        }
+
+    @route.get('/analytics/user-stats', response=UserStatSchema, auth=is_admin)
+    @cached_analytics('user-stats')
+    def get_user_stats(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                       end: Optional[date] = None, granularity: Optional[str] = None, limit: int = 10):
+        """Get registrations per month (or per granularity) and the most active borrowers (admin only)"""
+        buckets = analytics_buckets(timeRange, start, end, granularity or 'month')
+        start_date, end_date = buckets.start, buckets.end
+        limit = min(max(limit, 1), 100)
+        
+        # New users per period from the daily rollup
+        rows = rollup_rows(buckets.first_day, buckets.last_day)
+        totals = totals_by_bucket(buckets, rows, ['new_users'])
+        monthly_registrations = [
+            {"month": period_start, "count": total['new_users']}
+            for period_start, total in zip(buckets.starts, totals)
+        ]
         
-        for item in registrations_over_time:
-            month_str = item['month'].strftime('%b %Y')
-            if month_str in months_dict:
-                months_dict[month_str]["registrations"] = item['count']
+        # Borrowings of the range; the upper bound is left out when the range runs
+        # up to today, as it only makes SQLite pick a worse index
+        bounds = {'gte': start_date}
+        if end_date <= timezone.now():
+            bounds['lt'] = end_date
+        
+        # Grouped over the (user, borrowed_date) index without touching the table
+        top_users = list(BookBorrowing.objects.filter(**{
+            f'borrowed_date__{lookup}': value for lookup, value in bounds.items()
+        }).values(
+            'user_id'
+        ).annotate(
+            username=F('user__username'),
+            email=F('user__email'),
+            borrowing_count=Count('id')
+        ).order_by('-borrowing_count', 'user_id')[:limit])
+        for row in top_users:
+            row['id'] = row.pop('user_id')
+        
+        readers = User.objects.filter(role='reader').aggregate(
+            total=Count('id', distinct=True),
+            active=Count('id', filter=Q(**{
+                f'borrowed_books__borrowed_date__{lookup}': value for lookup, value in bounds.items()
+            }), distinct=True)
+        )
         
-        # Convert dictionary to list
-        activity_over_time = [
-            {
-                "month": month,
-                "events": data["events"],
-                "registrations": data["registrations"]
-            }
-            for month, data in months_dict.items()
-        ]
+        return {
+            "monthly_registrations": monthly_registrations,
+            "top_users_by_borrowing": top_users,
+            "active_users": readers['active'],
+            "inactive_users": readers['total'] - readers['active']
+        }
+
+    @route.get('/analytics/borrowing-trends', response=BorrowingTrendSchema, auth=is_admin)
+    @cached_analytics('borrowing-trends')
+    def get_borrowing_trends(self, request, timeRange: str = '6months', start: Optional[date] = None,
+                             end: Optional[date] = None, granularity: Optional[str] = None):
+        """Get borrowings and returns per period and the average loan length (admin only)"""
+        # Same periods as the activity chart
+        buckets = analytics_buckets(timeRange, start, end, granularity)
+        rows = rollup_rows(buckets.first_day, buckets.last_day)
+        totals = totals_by_bucket(buckets, rows, ['borrows', 'returns'])
+        
+        # Loans returned in the range, averaged from the per-day totals
+        returns = sum(row.returns for row in rows)
+        loan_days = sum(row.loan_days for row in rows)
         
         return {
-            "totalEvents": total_events,
-            "totalRegistrations": total_registrations,
-            "avgRegistrationsPerEvent": round(avg_registrations, 2),
-            "eventsByCategory": events_by_category_list,
-            "activityOverTime": activity_over_time
+            "period": buckets.granularity,
+            "borrowing_counts": [
+                {"date": period_start, "count": total['borrows']}
+                for period_start, total in zip(buckets.starts, totals)
+            ],
+            "return_counts": [
+                {"date": period_start, "count": total['returns']}
+                for period_start, total in zip(buckets.starts, totals)
+            ],
+            "average_borrowing_duration_days": round(loan_days / returns, 2) if returns else None
         }
+
+    @route.get('/analytics/popular-books', response=List[PopularBookSchema], auth=is_admin)
+    @cached_analytics('popular-books')
+    def get_popular_books(self, request, limit: int = 10):
+        """Get the books ranked by weighted popularity (admin only)
+
+        The score is computed in SQL from the borrow and wishlist counters and
+        the ranking is read from the matching expression index.
+        """
+        limit = min(max(limit, 1), 100)
+        return Book.objects.annotate(
+            popularity_score=popularity_score()
+        ).order_by('-popularity_score', 'id').values(
+            'id', 'title', 'author', 'category', 'total_copies', 'available_copies',
+            'borrow_count', 'wishlist_count', 'popularity_score'
+        )[:limit]
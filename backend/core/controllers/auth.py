@@ -1,14 +1,45 @@
+import hashlib
+import json
 from django.conf import settings
 from ninja_extra import api_controller, route
-from ninja_jwt.tokens import RefreshToken
-from ninja_jwt.authentication import JWTAuth
+from ninja_jwt.tokens import AccessToken
+from ninja_jwt.exceptions import TokenError
+from ninja_jwt.settings import api_settings
 from django.contrib.auth import get_user_model, authenticate
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseNotModified
 from core.schemas.users import UserRegisterSchema, UserLoginSchema, UserSchema, TokenSchema, AuthResponseSchema
 from ninja.errors import HttpError
+from ..permissions import jwt_auth
+from core.token_cache import token_cache
+from core.tokens import LMSRefreshToken
 
 User = get_user_model()
 
+
+def role_response(request, identity):
+    """Build the verify-role payload by hand with an ETag and a short private max-age"""
+    if identity is None:
+        payload = {"authenticated": False, "role": None, "id": None, "username": None, "isAdmin": False}
+    else:
+        payload = {
+            "authenticated": True,
+            "role": identity["role"],
+            "id": identity["id"],
+            "username": identity["username"],
+            "isAdmin": identity["role"] == 'admin'
+        }
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    etag = '"%s"' % hashlib.sha1(body).hexdigest()
+    
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = etag
+    response['Cache-Control'] = f'private, max-age={settings.AUTH_VERIFY_ROLE_MAX_AGE}'
+    response['Vary'] = 'Cookie'
+    return response
+
 @api_controller('/auth')
 class AuthController:
     
@@ -24,7 +55,7 @@ class AuthController:
             role=data.role
         )
         
-        refresh = RefreshToken.for_user(user)
+        refresh = LMSRefreshToken.for_user(user)
         user_data = UserSchema.from_orm(user)
         token_data = TokenSchema(
             access=str(refresh.access_token),
@@ -82,7 +113,7 @@ class AuthController:
             raise HttpError(401, "Authentication failed. Please try again later.")
             
         # If we get here, authentication is successful
-        refresh = RefreshToken.for_user(user)
+        refresh = LMSRefreshToken.for_user(user)
         user_data = UserSchema.from_orm(user)
         token_data = TokenSchema(
             access=str(refresh.access_token),
@@ -128,45 +159,50 @@ class AuthController:
 
     @route.get('/verify-role', response={200: dict}, auth=None)
     def verify_role(self, request):
-        """Verify the current user's role from the token"""
+        """Verify the current user's role from the token.
+
+        This is called by the Next.js middleware on every dashboard navigation,
+        so it answers from the token cache or the signed token claims whenever
+        it can and only falls back to a database lookup for tokens issued
+        without role claims.
+        """
         # Get token from cookies
         access_token = request.COOKIES.get('access_token')
         
         if not access_token:
-            return {
-                "authenticated": False,
-                "role": None,
-                "id": None,
-                "username": None,
-                "isAdmin": False
-            }
+            return role_response(request, None)
         
-        # Try to authenticate with the token
-        jwt_auth = JWTAuth()
-        try:
-            # JWTAuth expects the token as a second arg, not inside the request
-            user = jwt_auth.authenticate(request, access_token)
-            if user:
-                return {
-                    "authenticated": True,
-                    "role": user.role,
-                    "id": user.id,
-                    "username": user.username,
-                    "isAdmin": user.role == 'admin'
+        # Tokens verified earlier in this process are answered from the cache
+        identity = token_cache.get(access_token)
+        
+        if identity is None and settings.AUTH_VERIFY_ROLE_STATELESS:
+            try:
+                token = AccessToken(access_token)
+            except TokenError as e:
+                print(f"Role verification error: {str(e)}")
+                return role_response(request, None)
+            
+            if 'role' in token and 'username' in token:
+                identity = {
+                    "id": token[api_settings.USER_ID_CLAIM],
+                    "role": token['role'],
+                    "username": token['username'],
                 }
-        except Exception as e:
-            print(f"Role verification error: {str(e)}")
+        
+        if identity is None:
+            # Try to authenticate with the token
+            try:
+                # JWTAuth expects the token as a second arg, not inside the request
+                user = jwt_auth.authenticate(request, access_token)
+                if user:
+                    identity = {"id": user.id, "role": user.role, "username": user.username}
+            except Exception as e:
+                print(f"Role verification error: {str(e)}")
             
-        return {
-            "authenticated": False,
-            "role": None,
-            "id": None,
-            "username": None,
-            "isAdmin": False
-        }
+        return role_response(request, identity)
 
     @route.get('/verify', auth=None)
-    def verify(self, request):
+    async def verify(self, request):
         """Verify the user's authentication and return their data"""
         # Get token from cookies
         access_token = request.COOKIES.get('access_token')
@@ -175,10 +211,9 @@ class AuthController:
             return {"authenticated": False, "user": None}
         
         # Try to authenticate with the token
-        jwt_auth = JWTAuth()
         try:
             # JWTAuth expects the token as a second arg, not inside the request
-            user = jwt_auth.authenticate(request, access_token)
+            user = await jwt_auth.aauthenticate(request, access_token)
             if user:
                 return {"authenticated": True, "user": UserSchema.from_orm(user)}
         except Exception as e:
@@ -202,7 +237,6 @@ class AuthController:
         # Verify token and check role
         try:
             # Get user from token
-            jwt_auth = JWTAuth()
             # JWTAuth expects the token as a second arg
             user = jwt_auth.authenticate(request, access_token)
             
@@ -1,13 +1,18 @@
+import io
+from ninja import File, UploadedFile
 from ninja_extra import api_controller, route
 from ninja.errors import HttpError
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
-from django.db import models  # Added for Q objects
+from django.db.models import BooleanField, ExpressionWrapper, F
 from datetime import timedelta
 from typing import List, Optional
 from core.models.book import Book, BookBorrowing, WishlistItem
 from core.schemas.book import (
-    BookCreateSchema, BookUpdateSchema, BookResponseSchema,
+    BookCreateSchema, BookUpdateSchema, BookResponseSchema, BookImportResultSchema,
     BookBorrowSchema, BookReturnSchema, BookBorrowingResponseSchema,
     WishlistAddSchema, WishlistResponseSchema
 )
@@ -16,37 +21,86 @@ from core.schemas.book import (
 #     BookBorrowSchema, BookReturnSchema, BookBorrowingResponseSchema,
 #     WishlistAddSchema, WishlistResponseSchema
 # )
-from ..permissions import IsAdmin, IsAuthenticated, IsReader
+from core.pagination import akeyset_paginate
+from core.search import asearch_books
+from core.cache import invalidate_analytics
+from core import book_import
+from core import rollup
+from ..permissions import AsyncIsAuthenticated, IsAdmin, IsAuthenticated, IsReader
 
 # Create instances of permission classes
 is_admin = IsAdmin()
 is_authenticated = IsAuthenticated()
 is_reader = IsReader()
+# For the async routes
+async_is_authenticated = AsyncIsAuthenticated()
+
+# Keyset orderings accepted by list_books; each ends with a unique column
+BOOK_ORDERINGS = {
+    'title': ('title', 'id'),
+    'created': ('created_at', 'id'),
+}
 
 @api_controller('/books')
 class BookController:
-    @route.get('', response=List[BookResponseSchema], auth=is_authenticated)
-    def list_books(self, request, category: Optional[str] = None, search: Optional[str] = None):
-        """Get all books with optional filtering - requires authentication (admin or reader)"""
+    @route.get('', response=List[BookResponseSchema], auth=async_is_authenticated)
+    async def list_books(self, request, category: Optional[str] = None, search: Optional[str] = None,
+                   order: str = 'title', cursor: Optional[str] = None, limit: Optional[int] = None):
+        """Get a page of books with optional filtering - requires authentication (admin or reader)
+
+        Pages are keyset-paginated on (title, id) or, with order=created, on
+        (created_at, id); search results are ranked by relevance instead. The
+        cursor of the next page is returned in the X-Next-Cursor header and is
+        absent on the last page.
+        """
         books = Book.objects.all()
-        
+
         if category and category.lower() != 'all':
             books = books.filter(category=category)
-            
+
+        if order not in BOOK_ORDERINGS:
+            raise HttpError(400, f"order must be one of: {', '.join(BOOK_ORDERINGS)}")
+
+        # Clamp the page size to the server-side limits
+        limit = min(max(limit or settings.BOOKS_PAGE_SIZE, 1), settings.BOOKS_MAX_PAGE_SIZE)
+
         if search:
-            books = books.filter(
-                models.Q(title__icontains=search) | 
-                models.Q(author__icontains=search) |
-                models.Q(isbn__icontains=search)
-            )
-            
-        return books
+            page, next_cursor = await asearch_books(books, search, cursor, limit)
+        else:
+            page, next_cursor = await akeyset_paginate(books, BOOK_ORDERINGS[order], cursor, limit)
+        if next_cursor:
+            self.context.response['X-Next-Cursor'] = next_cursor
+
+        return page
+    
+    # Declared before the /{book_id} routes, whose pattern would otherwise take 'import'
+    @route.post('/import', response=BookImportResultSchema, auth=is_admin)
+    def import_books(self, request, file: UploadedFile = File(...), format: Optional[str] = None):
+        """Create or update books in bulk from a CSV or JSON Lines file (admin only)
+
+        Rows are matched to existing books by normalized ISBN. Invalid rows are
+        reported with their line number and skipped; the others are imported.
+        The format is taken from the file extension unless given.
+        """
+        format = format or book_import.format_for(file.name or '')
+        if format not in book_import.FORMATS:
+            raise HttpError(400, f"format must be one of: {', '.join(book_import.FORMATS)}")
+
+        # Large uploads are spooled to disk by Django and read back a line at a time
+        stream = io.TextIOWrapper(file.file, encoding='utf-8-sig', newline='')
+        try:
+            report = book_import.import_books(stream, format)
+        except UnicodeDecodeError:
+            raise HttpError(400, "The file must be UTF-8 encoded")
+        return report.as_dict()
     
-    @route.get('/{book_id}', response=BookResponseSchema, auth=is_authenticated)
-    def get_book(self, request, book_id: int):
+    @route.get('/{book_id}', response=BookResponseSchema, auth=async_is_authenticated)
+    async def get_book(self, request, book_id: int):
         """Get details of a specific book - requires authentication (admin or reader)"""
-        book = get_object_or_404(Book, id=book_id)
-        return book
+        try:
+            return await Book.objects.aget(id=book_id)
+        except Book.DoesNotExist:
+            raise Http404("No Book matches the given query.")
     
     @route.post('', response=BookResponseSchema, auth=is_admin)
     def create_book(self, request, data: BookCreateSchema):
@@ -60,7 +114,7 @@ class BookController:
             title=data.title,
             author=data.author,
             description=data.description,
-            isbn=data.isbn,
+            isbn=book_import.canonical_isbn(data.isbn),
             total_copies=data.total_copies,
             available_copies=available_copies,
             category=data.category,
@@ -81,7 +135,7 @@ class BookController:
         if data.description is not None:
             book.description = data.description
         if data.isbn:
-            book.isbn = data.isbn
+            book.isbn = book_import.canonical_isbn(data.isbn)
         if data.total_copies is not None:
             book.total_copies = data.total_copies
         if data.available_copies is not None:
@@ -91,7 +145,11 @@ class BookController:
         if data.cover_image is not None:
             book.cover_image = data.cover_image
             
-        book.save()
+        # Leave the counters to their F() updates so a concurrent borrow is not overwritten
+        book.save(update_fields=[
+            'title', 'author', 'description', 'isbn', 'total_copies', 'available_copies',
+            'category', 'cover_image', 'updated_at'
+        ])
         return book
     
     @route.delete('/{book_id}', auth=is_admin)
@@ -105,34 +163,37 @@ class BookController:
 class ReaderBookController:
     @route.post('/borrow', response=BookBorrowingResponseSchema, auth=is_reader)
     def borrow_book(self, request, data: BookBorrowSchema):
-        """Borrow a book (reader only)"""
+        """Borrow a book (reader only)
+
+        Taking a copy is a conditional UPDATE, so concurrent borrowers can
+        never drive available_copies below zero, and the unique_active_borrowing
+        constraint rejects a second open borrowing of the same book. Both
+        happen in one transaction, so a rejected borrow gives its copy back.
+        """
         book = get_object_or_404(Book, id=data.book_id)
-        
-        # Check if book is available
-        if book.available_copies <= 0:
-            raise HttpError(400, "Book is not available for borrowing")
-            
-        # Check if user already has this book
-        if BookBorrowing.objects.filter(
-            book=book, 
-            user=request.user, 
-            status='active'
-        ).exists():
-            raise HttpError(400, "You have already borrowed this book")
             
         # Default due date is 14 days from now if not specified
         due_date = data.due_date if data.due_date else timezone.now() + timedelta(days=14)
         
-        # Create borrowing record
-        borrowing = BookBorrowing.objects.create(
-            book=book,
-            user=request.user,
-            due_date=due_date
-        )
-        
-        # Update available copies
-        book.available_copies -= 1
-        book.save()
+        with transaction.atomic():
+            # Take a copy only if one is left
+            taken = Book.objects.filter(id=book.id, available_copies__gt=0).update(
+                available_copies=F('available_copies') - 1,
+                borrow_count=F('borrow_count') + 1
+            )
+            if not taken:
+                raise HttpError(400, "Book is not available for borrowing")
+            
+            # Create borrowing record
+            try:
+                with transaction.atomic():
+                    borrowing = BookBorrowing.objects.create(
+                        book=book,
+                        user=request.user,
+                        due_date=due_date
+                    )
+            except IntegrityError:
+                raise HttpError(400, "You have already borrowed this book")
         
         return {
             "id": borrowing.id,
@@ -147,23 +208,34 @@ class ReaderBookController:
     
     @route.post('/return', response=dict, auth=is_authenticated)
     def return_book(self, request, data: BookReturnSchema):
-        """Return a borrowed book"""
+        """Return a borrowed book
+
+        Only the request whose conditional UPDATE closes the borrowing gives the
+        copy back, so concurrent returns of the same borrowing count once.
+        """
         borrowing = get_object_or_404(
-            BookBorrowing, 
+            BookBorrowing.objects.only('id', 'book_id', 'borrowed_date'), 
             id=data.borrowing_id, 
             user=request.user, 
-            status='active'
+            status__in=BookBorrowing.OPEN_STATUSES
         )
+        returned_date = timezone.now()
         
-        # Update borrowing record
-        borrowing.returned_date = timezone.now()
-        borrowing.status = 'returned'
-        borrowing.save()
+        with transaction.atomic():
+            # Update borrowing record
+            closed = BookBorrowing.objects.filter(id=borrowing.id, status__in=BookBorrowing.OPEN_STATUSES).update(
+                returned_date=returned_date,
+                status='returned'
+            )
+            if not closed:
+                raise HttpError(400, "This book has already been returned")
+            
+            # Update available copies
+            Book.objects.filter(id=borrowing.book_id).update(available_copies=F('available_copies') + 1)
         
-        # Update available copies
-        book = borrowing.book
-        book.available_copies += 1
-        book.save()
+        # update() bypasses the post_save hooks that keep the rollup and cache current
+        rollup.mark_stale(borrowing.borrowed_date, returned_date)
+        invalidate_analytics()
         
         return {"success": True, "message": "Book returned successfully"}
     
@@ -175,36 +247,35 @@ class ReaderBookController:
         if status:
             borrowings = borrowings.filter(status=status)
             
-        response = []
-        for borrowing in borrowings:
-            response.append({
-                "id": borrowing.id,
-                "book_id": borrowing.book.id,
-                "book_title": borrowing.book.title,
-                "book_author": borrowing.book.author,  # Add author
-                "cover_image": borrowing.book.cover_image,  # Add cover image
-                "borrowed_date": borrowing.borrowed_date,
-                "due_date": borrowing.due_date,
-                "returned_date": borrowing.returned_date,
-                "status": borrowing.status,
-                "is_overdue": borrowing.due_date < timezone.now() and borrowing.status == 'active'
-            })
-            
-        return response
+        # Join the book columns and compute is_overdue in the same query
+        return borrowings.order_by('id').values(
+            'id', 'book_id', 'borrowed_date', 'due_date', 'returned_date', 'status',
+            book_title=F('book__title'),
+            book_author=F('book__author'),
+            cover_image=F('book__cover_image'),
+            is_overdue=ExpressionWrapper(
+                BookBorrowing.overdue_condition(timezone.now()),
+                output_field=BooleanField()
+            )
+        )
     
     @route.post('/wishlist/add', response=WishlistResponseSchema, auth=is_authenticated)
     def add_to_wishlist(self, request, data: WishlistAddSchema):
         """Add a book to user's wishlist"""
         book = get_object_or_404(Book, id=data.book_id)
         
-        # Check if already in wishlist
-        if WishlistItem.objects.filter(user=request.user, book=book).exists():
-            raise HttpError(400, "Book is already in your wishlist")
+        with transaction.atomic():
+            # The unique (book, user) index rejects a book that is already in the wishlist
+            try:
+                with transaction.atomic():
+                    wishlist_item = WishlistItem.objects.create(
+                        user=request.user,
+                        book=book
+                    )
+            except IntegrityError:
+                raise HttpError(400, "Book is already in your wishlist")
             
-        wishlist_item = WishlistItem.objects.create(
-            user=request.user,
-            book=book
-        )
+            Book.objects.filter(id=book.id).update(wishlist_count=F('wishlist_count') + 1)
         
         return {
             "id": wishlist_item.id,
@@ -220,7 +291,14 @@ class ReaderBookController:
     def remove_from_wishlist(self, request, item_id: int):
         """Remove a book from user's wishlist"""
         wishlist_item = get_object_or_404(WishlistItem, id=item_id, user=request.user)
-        wishlist_item.delete()
+        
+        with transaction.atomic():
+            # Only the request that actually deletes the item gives the count back
+            deleted, _ = WishlistItem.objects.filter(id=wishlist_item.id).delete()
+            if deleted:
+                Book.objects.filter(id=wishlist_item.book_id, wishlist_count__gt=0).update(
+                    wishlist_count=F('wishlist_count') - 1
+                )
         
         return {"success": True, "message": "Book removed from wishlist"}
     
@@ -229,16 +307,11 @@ class ReaderBookController:
         """Get user's wishlist"""
         wishlist_items = WishlistItem.objects.filter(user=request.user)
         
-        response = []
-        for item in wishlist_items:
-            response.append({
-                "id": item.id,
-                "book_id": item.book.id,
-                "book_title": item.book.title,
-                "book_author": item.book.author,
-                "book_status": item.book.status,
-                "book_category": item.book.category,
-                "added_date": item.added_date
-            })
-            
-        return response
+        # Join the book columns and compute the stock status in the same query
+        return wishlist_items.order_by('id').values(
+            'id', 'book_id', 'added_date',
+            book_title=F('book__title'),
+            book_author=F('book__author'),
+            book_status=Book.status_expression('book__'),
+            book_category=F('book__category')
+        )
@@ -1,12 +1,16 @@
 from ninja_extra import api_controller, route
+from ninja.errors import HttpError
+from asgiref.sync import sync_to_async
 from typing import List, Optional
 from django.shortcuts import get_object_or_404
-from django.db.models import Count, Q
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
 from django.http import Http404
 from django.utils import timezone
 from django.db.utils import OperationalError, ProgrammingError
 from core.models.event import Event, EventRegistration
-from core.schemas.events import EventIn, EventOut,EventRegistrationOut
+from core.seats import claim_seat, fill_from_waitlist
+from core.schemas.events import EventIn, EventOut, EventRegistrationOut, EventAttendeeOut
 
 # from .models import Event, EventRegistration, User
 # from .schemas import EventIn, EventOut, EventRegistrationIn, EventRegistrationOut
@@ -15,19 +19,28 @@ from ..permissions import IsAuthenticated, IsAdmin
 is_authenticated = IsAuthenticated()
 is_admin = IsAdmin()
 
+
+def is_staff_request(request):
+    """Whether the request comes from a staff user; may load the session user"""
+    return hasattr(request, 'user') and request.user and hasattr(request.user, 'is_staff') and request.user.is_staff
+
+
+def with_event_details(registrations):
+    """Load registrations with their event, creator and user joined in"""
+    return registrations.select_related('event__created_by', 'user')
+
+
 @api_controller('/events')
 class EventsController:
     
-    @route.get('/', response=List[EventOut])
-    def list_events(self, request, 
-                   search: Optional[str] = None,
-                   category: Optional[str] = None,
-                   upcoming_only: bool = False):
+    @route.get('/', response=List[EventOut], auth=None)
+    async def list_events(self, request, 
+                         search: Optional[str] = None,
+                         category: Optional[str] = None,
+                         upcoming_only: bool = False):
         """List all events with optional filtering - public endpoint"""
         try:
-            events = Event.objects.annotate(
-                registered_count=Count('registrations')
-            )
+            events = Event.objects.select_related('created_by')
             
             if search:
                 events = events.filter(
@@ -44,12 +57,12 @@ class EventsController:
                 events = events.filter(end_date__gte=now)
             
             # Only show active events to non-staff users
-            # Check if user exists and has staff permissions
-            is_staff = hasattr(request, 'user') and request.user and hasattr(request.user, 'is_staff') and request.user.is_staff
+            # Check if user exists and has staff permissions; the session user is loaded synchronously
+            is_staff = await sync_to_async(is_staff_request)(request)
             if not is_staff:
                 events = events.filter(is_active=True)
                 
-            return events
+            return [event async for event in events]
         except (OperationalError, ProgrammingError) as e:
             # Handle database table not existing
             print(f"Database error in list_events: {str(e)}")
@@ -60,14 +73,12 @@ class EventsController:
         print("Event ID:", event_id)
         """Get a specific event by ID - public endpoint"""
         try:
-            event = Event.objects.annotate(
-                registered_count=Count('registrations')
-            ).get(id=event_id)
+            event = Event.objects.select_related('created_by').get(id=event_id)
             print(f"Event retrieved: {event.title}")
             
             # Check if event is active if not admin
             # If request doesn't have a user attribute or user is not authenticated, treat as public
-            is_staff = hasattr(request, 'user') and request.user and hasattr(request.user, 'is_staff') and request.user.is_staff
+            is_staff = is_staff_request(request)
             
             # Only enforce active check for non-staff users
             if not is_staff and not event.is_active:
@@ -92,11 +103,9 @@ class EventsController:
             category=payload.category,
             image=payload.image,
             is_active=payload.is_active,
+            waitlist_enabled=payload.waitlist_enabled,
             created_by=request.user
         )
-        
-        # Annotate with registered count for response
-        event.registered_count = 0
         return event
     
     @route.put('/{int:event_id}', response=EventOut, auth=is_admin)
@@ -112,14 +121,20 @@ class EventsController:
         event.capacity = payload.capacity
         event.category = payload.category
         event.is_active = payload.is_active
+        event.waitlist_enabled = payload.waitlist_enabled
         
         if payload.image:
             event.image = payload.image
             
-        event.save()
+        # registered_count is maintained by conditional updates, never from this instance
+        event.save(update_fields=[
+            'title', 'description', 'location', 'start_date', 'end_date', 'capacity',
+            'category', 'is_active', 'waitlist_enabled', 'image', 'updated_at'
+        ])
         
-        # Annotate with registered count for response
-        event.registered_count = event.registrations.count()
+        # A raised capacity frees seats for the waitlist
+        if fill_from_waitlist(event.id):
+            event.refresh_from_db(fields=['registered_count'])
         return event
     
     @route.delete('/{int:event_id}', auth=is_admin)
@@ -131,32 +146,41 @@ class EventsController:
     
     @route.post('/{int:event_id}/register', response=EventRegistrationOut, auth=is_authenticated)
     def register_for_event(self, request, event_id: int):
-        """Register the current user for an event"""
+        """Register the current user for an event
+
+        The seat is claimed with a conditional UPDATE of registered_count in
+        the same transaction as the insert, so capacity holds under concurrent
+        registrations without counting rows. When the event is full and has
+        waitlist_enabled, the registration is waitlisted instead.
+        """
         event = get_object_or_404(Event, id=event_id)
         
         # Check if event is active
         if not event.is_active:
-            return {"error": "This event is not active"}, 400
+            raise HttpError(400, "This event is not active")
             
         # Check if event has passed
         if event.end_date < timezone.now():
-            return {"error": "This event has already ended"}, 400
-            
-        # Check if event has capacity left
-        if event.capacity > 0 and event.registrations.count() >= event.capacity:
-            return {"error": "This event has reached its capacity"}, 400
-            
-        # Check if user is already registered
-        if EventRegistration.objects.filter(event=event, user=request.user).exists():
-            return {"error": "You are already registered for this event"}, 400
+            raise HttpError(400, "This event has already ended")
+        
+        with transaction.atomic():
+            # Check if event has capacity left
+            seated = claim_seat(event.id)
+            if not seated and not event.waitlist_enabled:
+                raise HttpError(400, "This event has reached its capacity")
             
-        # Register user
-        registration = EventRegistration.objects.create(
-            event=event,
-            user=request.user
-        )
+            # Register user; the unique (event, user) index rejects a second registration
+            try:
+                with transaction.atomic():
+                    registration = EventRegistration.objects.create(
+                        event=event,
+                        user=request.user,
+                        status='registered' if seated else 'waitlisted'
+                    )
+            except IntegrityError:
+                raise HttpError(400, "You are already registered for this event")
         
-        return registration
+        return with_event_details(EventRegistration.objects.filter(id=registration.id)).get()
     
     @route.delete('/{int:event_id}/unregister', auth=is_authenticated)
     def unregister_from_event(self, request, event_id: int):
@@ -165,21 +189,28 @@ class EventsController:
         
         # Check if event has passed
         if event.start_date < timezone.now():
-            return {"error": "Cannot unregister from a past or ongoing event"}, 400
+            raise HttpError(400, "Cannot unregister from a past or ongoing event")
             
-        # Check if user is registered
-        try:
-            registration = EventRegistration.objects.get(event=event, user=request.user)
+        with transaction.atomic():
+            # Write to the event row first: that takes SQLite's write lock, or on
+            # Postgres the row lock fill_from_waitlist needs to claim a seat, so
+            # the registration cannot be promoted between reading its status
+            # and deleting it
+            Event.objects.filter(id=event.id).update(registered_count=F('registered_count'))
+            registration = EventRegistration.objects.filter(event=event, user=request.user).first()
+            if registration is None:
+                raise HttpError(404, "You are not registered for this event")
+            
+            # Gives the seat back and refills it from the waitlist (see core.signals)
             registration.delete()
-            return {"success": True}
-        except EventRegistration.DoesNotExist:
-            return {"error": "You are not registered for this event"}, 404
+        
+        return {"success": True}
     
     @route.get('/user/registrations', response=List[EventRegistrationOut], auth=is_authenticated)
     def get_user_registrations(self, request):
         """Get all events the current user is registered for"""
         registrations = EventRegistration.objects.filter(user=request.user)
-        return registrations
+        return with_event_details(registrations)
     
     @route.put('/{int:event_id}/attendance/{int:user_id}', auth=is_admin)
     def mark_attendance(self, request, event_id: int, user_id: int, attended: bool):
@@ -193,4 +224,13 @@ class EventsController:
     def get_event_attendees(self, request, event_id: int):
         """Get all users registered for an event (admin only)"""
         registrations = EventRegistration.objects.filter(event_id=event_id)
-        return registrations
+        return with_event_details(registrations)
+    
+    @route.get('/{int:event_id}/attendees/slim', response=List[EventAttendeeOut], auth=is_admin)
+    def get_event_attendees_slim(self, request, event_id: int):
+        """Get a flat list of the users registered for an event, without nested event data (admin only)"""
+        return EventRegistration.objects.filter(event_id=event_id).values(
+            'id', 'user_id', 'registration_date', 'attended', 'status',
+            username=F('user__username'),
+            email=F('user__email')
+        )
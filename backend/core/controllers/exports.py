@@ -0,0 +1,105 @@
+from ninja_extra import api_controller, route
+from ninja.errors import HttpError
+from django.db.models import BooleanField, ExpressionWrapper, F
+from django.utils import timezone
+from datetime import date, timedelta
+from typing import Optional
+from core.models.book import BookBorrowing, User
+from core.models.event import EventRegistration
+from core.exports import FORMATS, export_response
+from core.timebuckets import day_start
+from core.controllers.analytics import analytics_days
+from ..permissions import IsAdmin
+
+is_admin = IsAdmin()
+
+
+def within_range(queryset, column, timeRange, start, end):
+    """Filter on a timestamp with the range parameters of the analytics routes.
+
+    Without any of them every row is exported.
+    """
+    if timeRange is None and start is None and end is None:
+        return queryset
+    start_day, end_day = analytics_days(timeRange or '6months', start, end)
+    if start_day > end_day:
+        raise HttpError(400, "The end of the range must be after its start")
+    return queryset.filter(**{
+        f'{column}__gte': day_start(start_day),
+        f'{column}__lt': day_start(end_day + timedelta(days=1)),
+    })
+
+
+def check_format(format):
+    if format not in FORMATS:
+        raise HttpError(400, f"format must be one of: {', '.join(FORMATS)}")
+
+
+@api_controller('/admin/export')
+class ExportController:
+    """Streamed downloads of whole tables (admin only)
+
+    Each route takes format=csv (the default) or format=ndjson, and the
+    timeRange, start and end parameters of the analytics routes to restrict
+    the rows to a period. Rows are ordered by the timestamp they are filtered on.
+    """
+
+    @route.get('/borrowings', auth=is_admin)
+    def export_borrowings(self, request, format: str = 'csv', timeRange: Optional[str] = None,
+                          start: Optional[date] = None, end: Optional[date] = None,
+                          status: Optional[str] = None):
+        """Export the borrowings made in a period, optionally with one status"""
+        check_format(format)
+        borrowings = within_range(BookBorrowing.objects.all(), 'borrowed_date', timeRange, start, end)
+        if status:
+            if status not in dict(BookBorrowing.STATUS_CHOICES):
+                raise HttpError(400, f"status must be one of: {', '.join(dict(BookBorrowing.STATUS_CHOICES))}")
+            borrowings = borrowings.filter(status=status)
+
+        return export_response(request, borrowings.order_by('borrowed_date', 'id'), [
+            'id', 'book_id',
+            ('book_title', F('book__title')),
+            ('book_isbn', F('book__isbn')),
+            'user_id',
+            ('username', F('user__username')),
+            'borrowed_date', 'due_date', 'returned_date', 'status',
+            ('is_overdue', ExpressionWrapper(
+                BookBorrowing.overdue_condition(timezone.now()), output_field=BooleanField()
+            )),
+        ], format, 'borrowings')
+
+    @route.get('/users', auth=is_admin)
+    def export_users(self, request, format: str = 'csv', timeRange: Optional[str] = None,
+                     start: Optional[date] = None, end: Optional[date] = None,
+                     role: Optional[str] = None):
+        """Export the users who joined in a period, optionally with one role"""
+        check_format(format)
+        users = within_range(User.objects.all(), 'date_joined', timeRange, start, end)
+        if role:
+            users = users.filter(role=role)
+
+        return export_response(request, users.order_by('date_joined', 'id'), [
+            'id', 'username', 'email', 'first_name', 'last_name', 'role', 'is_active',
+            'date_joined', 'last_login',
+        ], format, 'users')
+
+    @route.get('/registrations', auth=is_admin)
+    def export_registrations(self, request, format: str = 'csv', timeRange: Optional[str] = None,
+                             start: Optional[date] = None, end: Optional[date] = None,
+                             event_id: Optional[int] = None):
+        """Export the event registrations made in a period, optionally for one event"""
+        check_format(format)
+        registrations = within_range(
+            EventRegistration.objects.all(), 'registration_date', timeRange, start, end
+        )
+        if event_id is not None:
+            registrations = registrations.filter(event_id=event_id)
+
+        return export_response(request, registrations.order_by('registration_date', 'id'), [
+            'id', 'event_id',
+            ('event_title', F('event__title')),
+            'user_id',
+            ('username', F('user__username')),
+            ('email', F('user__email')),
+            'registration_date', 'status', 'attended',
+        ], format, 'registrations')
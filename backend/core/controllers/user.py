@@ -75,6 +75,7 @@ class UserController:
         if data.password:
             user.set_password(data.password)
             
+        # Saving drops the tokens cached for the old role or status (see core.signals)
         user.save()
         return user
     
@@ -0,0 +1,47 @@
+"""Repair of the denormalized counter columns.
+
+Book.borrow_count, Book.wishlist_count and Event.registered_count are kept
+current by F() updates in the request paths. Writes that bypass those paths,
+such as cascading deletes, bulk loads or manual edits, can leave them
+drifted; these functions recompute them from the underlying rows.
+"""
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from core.models.book import Book, BookBorrowing, WishlistItem
+from core.models.event import Event, EventRegistration
+
+
+def _count_of(model, field, **filters):
+    """Correlated subquery counting the rows of model that point at the outer row"""
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}, **filters).order_by().values(field).annotate(
+            count=Count('id')
+        ).values('count')
+    ), 0)
+
+
+def recount_book_counters(dry_run=False):
+    """Recompute borrow_count and wishlist_count; returns the number of drifted books"""
+    drifted = Book.objects.annotate(
+        actual_borrows=_count_of(BookBorrowing, 'book'),
+        actual_wishlist=_count_of(WishlistItem, 'book'),
+    ).exclude(borrow_count=F('actual_borrows'), wishlist_count=F('actual_wishlist'))
+    if dry_run:
+        return drifted.count()
+    return Book.objects.filter(id__in=drifted.values('id')).update(
+        borrow_count=_count_of(BookBorrowing, 'book'),
+        wishlist_count=_count_of(WishlistItem, 'book'),
+    )
+
+
+def recount_event_counters(dry_run=False):
+    """Recompute registered_count from registrations holding a seat; returns the number of drifted events"""
+    drifted = Event.objects.annotate(
+        actual_registered=_count_of(EventRegistration, 'event', status='registered'),
+    ).exclude(registered_count=F('actual_registered'))
+    if dry_run:
+        return drifted.count()
+    return Event.objects.filter(id__in=drifted.values('id')).update(
+        registered_count=_count_of(EventRegistration, 'event', status='registered'),
+    )
@@ -0,0 +1,91 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from core.cache import invalidate_analytics
+from core.controllers.analytics import QUERY_BUDGETS
+from core.models.book import Book, BookBorrowing, User
+from core.tokens import LMSRefreshToken
+
+
+ENDPOINTS = [
+    'metrics', 'categories', 'activity', 'users', 'events',
+    'summary', 'books', 'user-stats', 'borrowing-trends', 'popular-books', 'dashboard',
+]
+
+
+class QueryCounter:
+    """Database execute wrapper that counts the statements it sees"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Measure the latency and query count of the admin analytics endpoints on the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5,
+                            help='Timed requests per endpoint after one warm-up request (default: 5)')
+        parser.add_argument('--time-range', type=str, default='6months',
+                            help='timeRange passed to every endpoint (default: 6months)')
+        parser.add_argument('--endpoint', action='append', choices=ENDPOINTS,
+                            help='Endpoint to measure; may be repeated (default: all)')
+        parser.add_argument('--cached', action='store_true',
+                            help='Measure responses served from the analytics cache instead of computed ones')
+
+    def handle(self, *args, **options):
+        admin = User.objects.filter(role='admin', is_active=True).first()
+        if admin is None:
+            raise CommandError('An active admin user is needed to call the analytics endpoints')
+
+        client = Client(HTTP_HOST='localhost')
+        client.cookies['access_token'] = str(LMSRefreshToken.for_user(admin).access_token)
+
+        self.stdout.write(
+            f'{Book.objects.count()} books, {BookBorrowing.objects.count()} borrowings, '
+            f'{User.objects.count()} users; timeRange={options["time_range"]}'
+        )
+        self.stdout.write(
+            f'{"endpoint":<18} {"queries":>7} {"budget":>7} {"min ms":>9} {"median ms":>9} {"max ms":>9}'
+        )
+
+        over_budget = []
+
+        for endpoint in options['endpoint'] or ENDPOINTS:
+            url = f'/api/admin/analytics/{endpoint}?timeRange={options["time_range"]}'
+
+            # The warm-up request fills the rollup and token caches and is not measured
+            response = client.get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{url} returned {response.status_code}')
+
+            repeat = max(options['repeat'], 1)
+            queries = QueryCounter()
+            timings = []
+            with connection.execute_wrapper(queries):
+                for _ in range(repeat):
+                    if not options['cached']:
+                        invalidate_analytics()
+                    started = time.perf_counter()
+                    client.get(url)
+                    timings.append((time.perf_counter() - started) * 1000)
+
+            per_request = queries.count // repeat
+            budget = QUERY_BUDGETS.get(endpoint)
+            # Cached responses skip the database, so only computed ones are held to the budget
+            if budget is not None and not options['cached'] and per_request > budget:
+                over_budget.append(f'{endpoint} ({per_request} > {budget})')
+
+            self.stdout.write(
+                f'{endpoint:<18} {per_request:>7} {budget if budget is not None else "-":>7} '
+                f'{min(timings):>9.1f} {statistics.median(timings):>9.1f} {max(timings):>9.1f}'
+            )
+
+        if over_budget:
+            raise CommandError(f'Query budget exceeded: {", ".join(over_budget)}')
@@ -0,0 +1,102 @@
+import json
+import random
+import statistics
+import threading
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from core.models.book import Book, User
+from core.tokens import LMSRefreshToken
+
+
+class Command(BaseCommand):
+    help = ('Measure borrow/return throughput with several concurrent writers on the current database. '
+            'Every cycle commits a borrowing, so run it on a copy of the data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--writers', type=int, default=8,
+                            help='Threads borrowing and returning books at the same time (default: 8)')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to keep writing (default: 10)')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random choice of books (default: 0)')
+
+    def handle(self, *args, **options):
+        readers = list(User.objects.filter(role='reader', is_active=True).order_by('id')[:options['writers']])
+        book_ids = list(Book.objects.filter(total_copies__gt=0).values_list('id', flat=True))
+        if not readers or not book_ids:
+            raise CommandError('Active readers and books with copies are needed; run seed_db first')
+
+        settings_dict = connection.settings_dict
+        self.stdout.write(
+            f'{connection.vendor} {settings_dict["NAME"]}: {options["writers"]} writers, '
+            f'{len(readers)} readers, {len(book_ids)} books'
+        )
+
+        deadline = time.perf_counter() + options['duration']
+        totals = {'borrowed': 0, 'returned': 0, 'rejected': 0, 'failed': 0}
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def writer(index):
+            reader = readers[index % len(readers)]
+            client = Client(HTTP_HOST='localhost', raise_request_exception=False)
+            client.cookies['access_token'] = str(LMSRefreshToken.for_user(reader).access_token)
+            rng = random.Random(options['seed'] + index)
+            counts = dict.fromkeys(totals, 0)
+            timings = []
+            errors = []
+
+            def post(path, payload):
+                started = time.perf_counter()
+                response = client.post(path, json.dumps(payload), content_type='application/json')
+                timings.append(time.perf_counter() - started)
+                if response.status_code >= 500:
+                    counts['failed'] += 1
+                    errors.append(f'{path} returned {response.status_code}')
+                elif response.status_code >= 400:
+                    # Out of copies or already borrowed: an expected outcome under contention
+                    counts['rejected'] += 1
+                return response
+
+            try:
+                while time.perf_counter() < deadline:
+                    response = post('/api/reader/borrow', {'book_id': rng.choice(book_ids)})
+                    if response.status_code != 200:
+                        continue
+                    counts['borrowed'] += 1
+                    response = post('/api/reader/return', {'borrowing_id': response.json()['id']})
+                    if response.status_code == 200:
+                        counts['returned'] += 1
+            finally:
+                connection.close()
+                with lock:
+                    for key, value in counts.items():
+                        totals[key] += value
+                    latencies.extend(timings)
+                    failures.extend(errors)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=writer, args=(i,)) for i in range(max(options['writers'], 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        requests = len(latencies)
+        self.stdout.write(
+            f'{requests} requests in {elapsed:.1f} s: {requests / elapsed:.1f} req/s, '
+            f'{totals["borrowed"]} borrowed, {totals["returned"]} returned, '
+            f'{totals["rejected"]} rejected, {totals["failed"]} failed'
+        )
+        if latencies:
+            latencies.sort()
+            self.stdout.write(
+                f'latency ms: median {statistics.median(latencies) * 1000:.1f}, '
+                f'p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f}, max {latencies[-1] * 1000:.1f}'
+            )
+        if failures:
+            self.stdout.write(self.style.WARNING(f'{len(failures)} failed request(s), e.g. {failures[0]}'))
@@ -1,8 +1,7 @@
 import json
-import requests
 import time
-import random
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from core import book_fetch, book_import
 
 class Command(BaseCommand):
     help = 'Fetch book data from Google Books API based on title or ISBN'
@@ -10,15 +9,42 @@ class Command(BaseCommand):
     def add_arguments(self, parser):
         parser.add_argument('--titles', type=str, nargs='*', help='List of book titles to fetch')
         parser.add_argument('--isbns', type=str, nargs='*', help='List of ISBNs to fetch')
+        parser.add_argument('--isbn-file', type=str, help='File with one ISBN per line to fetch')
         parser.add_argument('--output', type=str, default='book_data.json', help='Output JSON file path')
         parser.add_argument('--format', choices=['json', 'python'], default='json', 
                             help='Output format (json or Python dictionary format)')
+        parser.add_argument('--upsert', action='store_true',
+                            help='Also create or update the fetched books in the catalogue, matched by ISBN')
+        parser.add_argument('--api-url', type=str, default=book_fetch.DEFAULT_API_URL,
+                            help='Volumes endpoint to query, e.g. a local stub server for testing')
+        parser.add_argument('--workers', type=int, default=8, help='Requests in flight at once (default: 8)')
+        parser.add_argument('--rate', type=float, default=5,
+                            help='Most requests per second, shared by all workers (default: 5)')
+        parser.add_argument('--burst', type=int, default=1,
+                            help='Requests allowed at once above the rate after a pause (default: 1)')
+        parser.add_argument('--retries', type=int, default=3,
+                            help='Retries of a request after a connection error, 429 or 5xx (default: 3)')
+        parser.add_argument('--timeout', type=float, default=10, help='Seconds to wait for a response (default: 10)')
+        parser.add_argument('--cache-dir', type=str, default='.book_data_cache',
+                            help='Directory of cached API responses, reused by later runs (default: .book_data_cache)')
+        parser.add_argument('--no-cache', action='store_true', help='Neither read nor write the response cache')
 
     def handle(self, *args, **options):
         titles = options.get('titles') or []
         isbns = options.get('isbns') or []
         output_file = options.get('output')
         output_format = options.get('format')
+
+        if options['isbn_file']:
+            try:
+                with open(options['isbn_file'], encoding='utf-8') as f:
+                    isbns += [line.strip() for line in f if line.strip()]
+            except OSError as e:
+                raise CommandError(f"Cannot read {options['isbn_file']}: {e}")
+        if options['rate'] <= 0:
+            raise CommandError('--rate must be positive')
+        if options['retries'] < 0:
+            raise CommandError('--retries must not be negative')
         
         if not titles and not isbns:
             # Default list of popular book titles
@@ -31,25 +57,43 @@ class Command(BaseCommand):
             ]
             self.stdout.write(self.style.WARNING('No titles or ISBNs provided, using default popular book titles.'))
         
+        queries = [(title, book_fetch.title_query(title)) for title in titles]
+        queries += [(f"ISBN: {isbn}", book_fetch.isbn_query(isbn)) for isbn in isbns]
+
+        fetcher = book_fetch.BookFetcher(
+            api_url=options['api_url'],
+            workers=options['workers'],
+            rate=options['rate'],
+            burst=options['burst'],
+            retries=options['retries'],
+            timeout=options['timeout'],
+            cache=None if options['no_cache'] else book_fetch.ResponseCache(options['cache_dir']),
+        )
+
+        started = time.perf_counter()
         books_data = []
-        
-        # Fetch by title
-        for title in titles:
-            self.stdout.write(f"Fetching data for title: {title}")
-            book_data = self.fetch_book_by_title(title)
-            if book_data:
-                books_data.append(book_data)
-                # Sleep to avoid hitting API rate limits
-                time.sleep(1)
-            
-        # Fetch by ISBN
-        for isbn in isbns:
-            self.stdout.write(f"Fetching data for ISBN: {isbn}")
-            book_data = self.fetch_book_by_isbn(isbn)
-            if book_data:
-                books_data.append(book_data)
-                # Sleep to avoid hitting API rate limits
-                time.sleep(1)
+        cached = requested = failed = 0
+        try:
+            for result in fetcher.fetch(queries):
+                if result.cached:
+                    cached += 1
+                else:
+                    requested += 1
+                if result.error:
+                    failed += 1
+                    self.stdout.write(self.style.ERROR(f"Error fetching data for {result.identifier}: {result.error}"))
+                elif result.book:
+                    books_data.append(result.book)
+                    self.stdout.write(self.style.SUCCESS(f"Found: {result.book['title']} by {result.book['author']}"))
+                else:
+                    self.stdout.write(self.style.WARNING(f"No results found for {result.identifier}"))
+        finally:
+            fetcher.close()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{len(queries)} lookups in {elapsed:.1f} s: {cached} from the cache, '
+            f'{requested} requested, {failed} failed'
+        )
         
         # Write output
         if books_data:
@@ -61,78 +105,17 @@ class Command(BaseCommand):
             self.stdout.write(self.style.SUCCESS(f'Successfully fetched {len(books_data)} books and saved to {output_file}'))
         else:
             self.stdout.write(self.style.ERROR('No book data was fetched.'))
-    
-    def fetch_book_by_title(self, title):
-        """Fetch book data from Google Books API by title"""
-        url = f"https://www.googleapis.com/books/v1/volumes?q=intitle:{title}&maxResults=1"
-        return self._fetch_book_data(url, title)
-    
-    def fetch_book_by_isbn(self, isbn):
-        """Fetch book data from Google Books API by ISBN"""
-        # Remove hyphens if present
-        isbn = isbn.replace('-', '')
-        url = f"https://www.googleapis.com/books/v1/volumes?q=isbn:{isbn}"
-        return self._fetch_book_data(url, f"ISBN: {isbn}")
-    
-    def _fetch_book_data(self, url, identifier):
-        """Fetch and process book data from Google Books API"""
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-            data = response.json()
-            
-            if data.get('items'):
-                volume_info = data['items'][0]['volumeInfo']
-                
-                # Extract relevant data
-                title = volume_info.get('title', 'Unknown Title')
-                authors = volume_info.get('authors', ['Unknown Author'])
-                description = volume_info.get('description', '')
-                categories = volume_info.get('categories', ['fiction'])
-                
-                # Extract ISBN if available
-                isbn = 'Unknown'
-                for identifier in volume_info.get('industryIdentifiers', []):
-                    if identifier.get('type') in ['ISBN_13', 'ISBN_10']:
-                        isbn = identifier.get('identifier', 'Unknown')
-                        break
-                
-                # Extract cover image URL
-                cover_image = None
-                if 'imageLinks' in volume_info:
-                    # Try to get the largest available image
-                    for img_type in ['extraLarge', 'large', 'medium', 'thumbnail', 'smallThumbnail']:
-                        if img_type in volume_info['imageLinks']:
-                            cover_image = volume_info['imageLinks'][img_type]
-                            # Convert from http to https if needed
-                            if cover_image.startswith('http://'):
-                                cover_image = 'https://' + cover_image[7:]
-                            break
-                
-                # Format for our model
-                book_data = {
-                    'title': title,
-                    'author': authors[0] if authors else 'Unknown Author',
-                    'description': description[:500] if description else 'No description available.',
-                    'isbn': isbn,
-                    'total_copies': random.randint(3, 10),
-                    'available_copies': random.randint(1, 3),
-                    'category': categories[0].lower() if categories else 'fiction',
-                    'cover_image': cover_image
-                }
-                
-                self.stdout.write(self.style.SUCCESS(f"Found: {title} by {book_data['author']}"))
-                return book_data
-            else:
-                self.stdout.write(self.style.WARNING(f"No results found for {identifier}"))
-                return None
-                
-        except requests.exceptions.RequestException as e:
-            self.stdout.write(self.style.ERROR(f"Error fetching data for {identifier}: {str(e)}"))
-            return None
-        except Exception as e:
-            self.stdout.write(self.style.ERROR(f"Unexpected error for {identifier}: {str(e)}"))
-            return None
+
+        if options['upsert'] and books_data:
+            report = book_import.import_rows(
+                enumerate(books_data, 1),
+                report=book_import.ImportReport(on_error=lambda line, isbn, message: self.stderr.write(
+                    f"book {line}" + (f" ({isbn})" if isbn else "") + f": {message}"
+                ))
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Catalogue updated: {report.created} created, {report.updated} updated, {report.failed} skipped'
+            ))
     
     def write_json_output(self, books_data, output_file):
         """Write book data to JSON file"""
@@ -146,10 +129,8 @@ class Command(BaseCommand):
             for i, book in enumerate(books_data):
                 f.write("    {\n")
                 for key, value in book.items():
-                    if isinstance(value, str):
-                        f.write(f"        '{key}': '{value.replace('\'', '\\\'')}',\n")
-                    else:
-                        f.write(f"        '{key}': {value},\n")
+                    # repr() escapes quotes and backslashes in the values
+                    f.write(f"        {key!r}: {value!r},\n")
                 if i < len(books_data) - 1:
                     f.write("    },\n")
                 else:
@@ -0,0 +1,57 @@
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import book_import
+from core.models.book import Book
+
+
+class Command(BaseCommand):
+    help = 'Create or update books in bulk from a CSV or JSON Lines file, matched by ISBN'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="File to import, or - to read standard input")
+        parser.add_argument('--format', choices=book_import.FORMATS,
+                            help='Input format (default: from the file extension)')
+        parser.add_argument('--chunk-size', type=int,
+                            help='Rows written per statement (default: BOOK_IMPORT_CHUNK_SIZE)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or book_import.format_for(path)
+        if format is None:
+            raise CommandError('Cannot tell the format from the file name; pass --format')
+        if options['chunk_size'] is not None and options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+
+        started = time.perf_counter()
+
+        def progress(report):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(
+                f'{report.processed} rows in {elapsed:.1f} s ({report.processed / elapsed:.0f} rows/s): '
+                f'{report.created} created, {report.updated} updated, {report.failed} failed'
+            )
+
+        def print_error(line, isbn, message):
+            self.stderr.write(f'line {line}' + (f' ({isbn})' if isbn else '') + f': {message}')
+
+        # Every error is printed as it happens, so the report need not keep any
+        report = book_import.ImportReport(max_errors=0, on_error=print_error)
+
+        try:
+            if path == '-':
+                book_import.import_books(sys.stdin, format, options['chunk_size'], report, progress)
+            else:
+                with open(path, encoding='utf-8-sig', newline='') as stream:
+                    book_import.import_books(stream, format, options['chunk_size'], report, progress)
+        except OSError as e:
+            raise CommandError(f'Cannot read {path}: {e}')
+        except UnicodeDecodeError:
+            raise CommandError(f'{path} is not UTF-8 encoded')
+
+        style = self.style.WARNING if report.failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Imported {report.created + report.updated} book(s) in {time.perf_counter() - started:.1f} s: '
+            f'{report.created} created, {report.updated} updated, {report.failed} row(s) failed; '
+            f'the catalogue holds {Book.objects.count()} book(s)'
+        ))
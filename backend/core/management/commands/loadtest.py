@@ -0,0 +1,106 @@
+import http.client
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+from django.core.management.base import BaseCommand, CommandError
+from core.models.book import User
+from core.tokens import LMSRefreshToken
+
+
+# Read-heavy routes served by async views; each client cycles through them
+DEFAULT_PATHS = [
+    '/api/auth/verify',
+    '/api/books?limit=20',
+    '/api/books/1',
+    '/api/events/',
+    '/api/admin/analytics/metrics',
+    '/api/admin/analytics/dashboard',
+]
+
+
+class Command(BaseCommand):
+    help = 'Load a running API server with concurrent keep-alive clients and report its throughput and latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', type=str, default='http://127.0.0.1:8000',
+                            help='Base URL of the server under test (default: http://127.0.0.1:8000)')
+        parser.add_argument('--path', action='append',
+                            help='Path to request, including the query string; may be repeated '
+                                 '(default: a mix of the read-heavy routes)')
+        parser.add_argument('--concurrency', type=int, default=32,
+                            help='Clients sending requests at the same time (default: 32)')
+        parser.add_argument('--duration', type=float, default=10,
+                            help='Seconds to keep the load up (default: 10)')
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme not in ('http', 'https') or not url.hostname:
+            raise CommandError(f'Invalid --url: {options["url"]}')
+
+        # The server reads the same database, so an admin token from here is valid there
+        admin = User.objects.filter(role='admin', is_active=True).first()
+        if admin is None:
+            raise CommandError('An active admin user is needed to call the admin routes')
+        headers = {
+            'Cookie': f'access_token={LMSRefreshToken.for_user(admin).access_token}',
+            'Host': url.netloc,
+        }
+
+        paths = options['path'] or DEFAULT_PATHS
+        deadline = time.perf_counter() + options['duration']
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def client(offset):
+            connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+            connection = connection_class(url.hostname, url.port, timeout=60)
+            timings = []
+            failures = []
+            index = offset
+            while time.perf_counter() < deadline:
+                path = paths[index % len(paths)]
+                index += 1
+                started = time.perf_counter()
+                try:
+                    connection.request('GET', path, headers=headers)
+                    response = connection.getresponse()
+                    response.read()
+                    if response.status >= 400:
+                        failures.append(f'{path} returned {response.status}')
+                except (OSError, http.client.HTTPException) as e:
+                    failures.append(f'{path}: {e}')
+                    connection.close()
+                    continue
+                timings.append(time.perf_counter() - started)
+            connection.close()
+            with lock:
+                latencies.extend(timings)
+                errors.extend(failures)
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(max(options['concurrency'], 1))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        if not latencies:
+            raise CommandError(f'No request completed: {errors[0] if errors else "unknown error"}')
+
+        latencies.sort()
+        def percentile(fraction):
+            return latencies[min(int(len(latencies) * fraction), len(latencies) - 1)] * 1000
+
+        self.stdout.write(
+            f'{len(latencies)} requests in {elapsed:.1f} s with {len(threads)} clients: '
+            f'{len(latencies) / elapsed:.1f} req/s'
+        )
+        self.stdout.write(
+            f'latency ms: median {statistics.median(latencies) * 1000:.1f}, '
+            f'p95 {percentile(0.95):.1f}, p99 {percentile(0.99):.1f}, max {latencies[-1] * 1000:.1f}'
+        )
+        if errors:
+            self.stdout.write(self.style.WARNING(f'{len(errors)} failed request(s), e.g. {errors[0]}'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from core.counters import recount_book_counters, recount_event_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized book and event counters from their underlying rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only report how many rows have drifted')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        books = recount_book_counters(dry_run=dry_run)
+        events = recount_event_counters(dry_run=dry_run)
+
+        verb = 'drifted' if dry_run else 'repaired'
+        self.stdout.write(self.style.SUCCESS(f'{books} book(s) and {events} event(s) {verb}'))
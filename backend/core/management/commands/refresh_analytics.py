@@ -0,0 +1,63 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+from core.models.analytics import DailyAnalytics
+from core.models.book import BookBorrowing, User
+from core import rollup
+
+
+class Command(BaseCommand):
+    help = 'Refresh the DailyAnalytics rollup table used by the analytics endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=30,
+                            help='Number of trailing days to check (default: 30)')
+        parser.add_argument('--start', type=str, help='First day to refresh (YYYY-MM-DD)')
+        parser.add_argument('--end', type=str, help='Last day to refresh (YYYY-MM-DD, default: today)')
+        parser.add_argument('--all', action='store_true',
+                            help='Rebuild every day since the first user or borrowing')
+        parser.add_argument('--force', action='store_true',
+                            help='Recompute days even if their rollup row is up to date')
+
+    def handle(self, *args, **options):
+        end_day = self.parse_day(options['end']) if options['end'] else timezone.localdate()
+
+        if options['all']:
+            first_moments = [
+                BookBorrowing.objects.aggregate(first=Min('borrowed_date'))['first'],
+                User.objects.aggregate(first=Min('date_joined'))['first'],
+            ]
+            first_moments = [moment for moment in first_moments if moment is not None]
+            if not first_moments:
+                self.stdout.write(self.style.WARNING('No data to roll up'))
+                return
+            start_day = timezone.localdate(min(first_moments))
+        elif options['start']:
+            start_day = self.parse_day(options['start'])
+        else:
+            start_day = end_day - timedelta(days=options['days'] - 1)
+
+        if start_day > end_day:
+            raise CommandError('The start day must not be after the end day')
+
+        # Refresh in chunks so a multi-year rebuild keeps memory bounded
+        refreshed = 0
+        chunk_start = start_day
+        while chunk_start <= end_day:
+            chunk_end = min(chunk_start + timedelta(days=89), end_day)
+            if options['all'] or options['force']:
+                refreshed += rollup.refresh_range(chunk_start, chunk_end)
+            else:
+                refreshed += rollup.ensure_range(chunk_start, chunk_end)
+            self.stdout.write(f'Processed {chunk_start} to {chunk_end}')
+            chunk_start = chunk_end + timedelta(days=1)
+
+        total = DailyAnalytics.objects.count()
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} day(s); rollup holds {total} day(s)'))
+
+    def parse_day(self, value):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f'Invalid date: {value}')
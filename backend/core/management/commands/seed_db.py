@@ -1,4 +1,6 @@
-from django.core.management.base import BaseCommand
+import time
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 import sys
@@ -11,13 +13,31 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../.
 
 # Now we can import from core
 from core.models.book import Book, BookBorrowing, WishlistItem
+from core.cache import invalidate_analytics
+from core.counters import recount_book_counters, recount_event_counters
+from core.synthetic import SyntheticData, volumes_for
 
 User = get_user_model()
 
 class Command(BaseCommand):
-    help = 'Seed database with test data'
+    help = 'Seed database with test data, or with synthetic production-scale volumes using --scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float,
+                            help='Write synthetic volumes for benchmarking: 1 is 100k books, 50k readers, '
+                                 '5M borrowings, 2k events and 200k registrations; 0.01 is a hundredth of that')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Seed of the random generator, for repeatable data (default: 0)')
+        parser.add_argument('--years', type=int, default=5,
+                            help='Years of history to spread the synthetic data over (default: 5)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows per bulk insert (default: 5000)')
 
     def handle(self, *args, **options):
+        if options['scale'] is not None:
+            self.seed_at_scale(options)
+            return
+
         self.stdout.write(self.style.SUCCESS('Seeding database...'))
         
         # Create users if they don't exist
@@ -29,7 +49,58 @@ class Command(BaseCommand):
         # Create borrowings and wishlists
         self.create_borrowings_and_wishlists()
         
+        # The seed writes rows directly, so bring the book counters in line
+        recount_book_counters()
+        
         self.stdout.write(self.style.SUCCESS('Database seeded successfully!'))
+
+    def seed_at_scale(self, options):
+        if options['scale'] <= 0 or options['years'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--scale must be positive, --years and --batch-size at least 1')
+        if User.objects.filter(username='user0000000').exists():
+            raise CommandError('Synthetic data is already present; run it on an empty database (manage.py flush)')
+
+        volumes = volumes_for(options['scale'])
+        self.stdout.write(self.style.SUCCESS(
+            'Seeding ' + ', '.join(f'{count:,} {name}' for name, count in volumes.items())
+            + f' over {options["years"]} year(s) with seed {options["seed"]}...'
+        ))
+        self.create_users()
+
+        started = time.perf_counter()
+        step = {'kind': None, 'started': started, 'called': started, 'reported': 0}
+
+        def progress(kind, done, total, finished=False):
+            now = time.perf_counter()
+            if kind != step['kind']:
+                # Each kind is written right after the previous one finished
+                step.update(kind=kind, started=step['called'], reported=0)
+            step['called'] = now
+            # A line every few seconds, and one when a kind of row is complete
+            if done == step['reported'] or not finished and now - step.get('reported_at', 0) < 5:
+                return
+            step.update(reported=done, reported_at=now)
+            elapsed = now - step['started']
+            self.stdout.write(
+                f'{kind}: {done:,}/{total:,} ({done * 100 // total}%), {done / elapsed:,.0f} rows/s'
+            )
+
+        SyntheticData(
+            scale=options['scale'], seed=options['seed'], years=options['years'],
+            batch_size=options['batch_size'], progress=progress,
+        ).run()
+
+        self.stdout.write('Recounting counters...')
+        recount_book_counters()
+        recount_event_counters()
+        self.stdout.write('Rebuilding the analytics rollup...')
+        call_command('refresh_analytics', '--all', stdout=self.stdout)
+        # bulk_create bypasses the post_save hook that keeps cached analytics current
+        invalidate_analytics()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Database seeded at scale {options["scale"]:g} in {time.perf_counter() - started:.0f} s'
+        ))
     
     def create_users(self):
         # Create admin user
@@ -211,7 +282,7 @@ class Command(BaseCommand):
                 continue
             
             # Skip if user already has this book
-            if BookBorrowing.objects.filter(book=book, user=user, status='active').exists():
+            if BookBorrowing.objects.filter(book=book, user=user, status__in=BookBorrowing.OPEN_STATUSES).exists():
                 continue
             
             # Create active borrowing
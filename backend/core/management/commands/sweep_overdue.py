@@ -0,0 +1,35 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from django.utils import timezone
+from core.models.book import BookBorrowing
+from core.overdue import sweep_overdue
+
+
+class Command(BaseCommand):
+    help = "Mark active borrowings past their due date as 'overdue', in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int,
+                            help='Borrowings updated per statement (default: OVERDUE_SWEEP_BATCH_SIZE)')
+        parser.add_argument('--every', type=int, metavar='SECONDS',
+                            help='Keep running and sweep again every SECONDS, e.g. under a process supervisor')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] is not None and options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+        if options['every'] is not None and options['every'] < 1:
+            raise CommandError('--every must be at least 1')
+
+        while True:
+            started = time.perf_counter()
+            swept = sweep_overdue(batch_size=options['batch_size'])
+            overdue = BookBorrowing.objects.filter(status='overdue').count()
+            self.stdout.write(self.style.SUCCESS(
+                f'{timezone.now():%Y-%m-%d %H:%M:%S} marked {swept} borrowing(s) overdue '
+                f'in {time.perf_counter() - started:.2f} s; {overdue} overdue in total'
+            ))
+            if options['every'] is None:
+                return
+            time.sleep(options['every'])
+            close_old_connections()
@@ -0,0 +1,68 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from core.routers import replica_configured, replica_reads
+
+
+# Set on a client after it writes, so that its reads stay on the primary until
+# the replica has caught up with the write
+PRIMARY_PIN_COOKIE = 'lms_primary'
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaMiddleware:
+    """Serve the GET requests of DATABASE_REPLICA_PATHS from the read replica.
+
+    A client that made a successful write within the last
+    DATABASE_REPLICA_PIN_SECONDS carries the pin cookie and is served from the
+    primary, so it sees its own borrows, returns and registrations. Unused
+    when no replica database is configured.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.paths = tuple(settings.DATABASE_REPLICA_PATHS)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        if self.uses_replica(request):
+            with replica_reads():
+                response = self.get_response(request)
+        else:
+            response = self.get_response(request)
+        return self.pin(request, response)
+
+    async def __acall__(self, request):
+        if self.uses_replica(request):
+            with replica_reads():
+                response = await self.get_response(request)
+        else:
+            response = await self.get_response(request)
+        return self.pin(request, response)
+
+    def uses_replica(self, request):
+        return (
+            request.method in ('GET', 'HEAD')
+            and PRIMARY_PIN_COOKIE not in request.COOKIES
+            and request.path.startswith(self.paths)
+        )
+
+    def pin(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_PIN_COOKIE, '1',
+                max_age=settings.DATABASE_REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
@@ -0,0 +1,88 @@
+from django.db import migrations
+
+
+# The search index as this migration creates it; later changes go in new migrations
+SQLITE_SETUP = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS core_book_fts USING fts5(
+        title, author, description, isbn,
+        content='core_book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_book_fts_insert AFTER INSERT ON core_book BEGIN
+        INSERT INTO core_book_fts(rowid, title, author, description, isbn)
+        VALUES (new.id, new.title, new.author, new.description, new.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_book_fts_delete AFTER DELETE ON core_book BEGIN
+        INSERT INTO core_book_fts(core_book_fts, rowid, title, author, description, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS core_book_fts_update AFTER UPDATE OF title, author, description, isbn ON core_book BEGIN
+        INSERT INTO core_book_fts(core_book_fts, rowid, title, author, description, isbn)
+        VALUES ('delete', old.id, old.title, old.author, old.description, old.isbn);
+        INSERT INTO core_book_fts(rowid, title, author, description, isbn)
+        VALUES (new.id, new.title, new.author, new.description, new.isbn);
+    END
+    """,
+    # Rank title and ISBN matches above author and description matches
+    "INSERT INTO core_book_fts(core_book_fts, rank) VALUES ('rank', 'bm25(10.0, 4.0, 1.0, 8.0)')",
+    "INSERT INTO core_book_fts(core_book_fts) VALUES ('rebuild')",
+]
+
+SQLITE_TEARDOWN = [
+    "DROP TRIGGER IF EXISTS core_book_fts_update",
+    "DROP TRIGGER IF EXISTS core_book_fts_delete",
+    "DROP TRIGGER IF EXISTS core_book_fts_insert",
+    "DROP TABLE IF EXISTS core_book_fts",
+]
+
+POSTGRES_SETUP = [
+    """
+    ALTER TABLE core_book ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(isbn, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS core_book_search_vector_idx ON core_book USING GIN (search_vector)",
+]
+
+POSTGRES_TEARDOWN = [
+    "DROP INDEX IF EXISTS core_book_search_vector_idx",
+    "ALTER TABLE core_book DROP COLUMN IF EXISTS search_vector",
+]
+
+
+def install_search_index(apps, schema_editor):
+    """Create (or restore) the search index; safe to run again.
+
+    On SQLite, Django rebuilds core_book when a column is added, which drops
+    the sync triggers, so migrations that alter Book call this again.
+    """
+    setup = {'sqlite': SQLITE_SETUP, 'postgresql': POSTGRES_SETUP}
+    for statement in setup.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+def remove_search_index(apps, schema_editor):
+    teardown = {'sqlite': SQLITE_TEARDOWN, 'postgresql': POSTGRES_TEARDOWN}
+    for statement in teardown.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_book_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, remove_search_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_book_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['user', 'status'], name='borrowing_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['book', 'user'], name='borrowing_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['status', 'due_date'], name='borrowing_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['borrowed_date'], name='borrowing_borrowed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['returned_date'], name='borrowing_returned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['start_date'], name='event_active_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['end_date'], name='event_active_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['category'], name='event_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['created_at'], name='event_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventregistration',
+            index=models.Index(fields=['registration_date'], name='registration_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['date_joined'], name='user_date_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2.30 on 2026-10-17 03:59
+
+from django.db import migrations, models
+from django.db.models.functions import Least
+from django.utils import timezone
+
+
+def close_duplicate_borrowings(apps, schema_editor):
+    """Return all but the first active borrowing of a book by a reader.
+
+    The borrow endpoint used to check and create in two steps, so racing
+    requests could open the same book twice for a reader. The extra
+    borrowings are closed as returned now and their copies go back on the
+    shelf, so that the unique constraint below can be added.
+    """
+    Book = apps.get_model('core', 'Book')
+    BookBorrowing = apps.get_model('core', 'BookBorrowing')
+    duplicated = (
+        BookBorrowing.objects.filter(status='active').values('book_id', 'user_id')
+        .annotate(count=models.Count('id')).filter(count__gt=1).order_by()
+    )
+    now = timezone.now()
+    for row in duplicated:
+        extra = list(
+            BookBorrowing.objects.filter(book_id=row['book_id'], user_id=row['user_id'], status='active')
+            .order_by('borrowed_date', 'id').values_list('id', flat=True)[1:]
+        )
+        BookBorrowing.objects.filter(id__in=extra).update(status='returned', returned_date=now)
+        Book.objects.filter(id=row['book_id']).update(
+            available_copies=Least(models.F('available_copies') + len(extra), models.F('total_copies'))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(close_duplicate_borrowings, migrations.RunPython.noop),
+        migrations.RemoveIndex(
+            model_name='bookborrowing',
+            name='borrowing_active_idx',
+        ),
+        migrations.AddConstraint(
+            model_name='bookborrowing',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'active')), fields=('book', 'user'), name='unique_active_borrowing'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:00
+
+from django.db import migrations, models
+
+
+def count_registrations(apps, schema_editor):
+    Event = apps.get_model('core', 'Event')
+    EventRegistration = apps.get_model('core', 'EventRegistration')
+    counts = EventRegistration.objects.values('event_id').annotate(count=models.Count('id')).order_by()
+    for row in counts:
+        Event.objects.filter(id=row['event_id']).update(registered_count=row['count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_unique_active_borrowing'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='registered_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='waitlist_enabled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='eventregistration',
+            name='status',
+            field=models.CharField(choices=[('registered', 'Registered'), ('waitlisted', 'Waitlisted')], default='registered', max_length=10),
+        ),
+        migrations.AddIndex(
+            model_name='eventregistration',
+            index=models.Index(condition=models.Q(('status', 'waitlisted')), fields=['event', 'registration_date'], name='registration_waitlist_idx'),
+        ),
+        migrations.RunPython(count_registrations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:01
+
+from importlib import import_module
+
+from django.db import migrations, models
+
+# The index of 0006, as it was then
+install_search_index = import_module('core.migrations.0006_book_search_index').install_search_index
+
+
+def count_popularity(apps, schema_editor):
+    Book = apps.get_model('core', 'Book')
+    for field, related in (('borrow_count', 'borrowings'), ('wishlist_count', 'wishlisted_by')):
+        counts = Book.objects.annotate(count=models.Count(related)).filter(count__gt=0).values_list('id', 'count')
+        for book_id, count in counts:
+            Book.objects.filter(id=book_id).update(**{field: count})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_event_registered_count'),
+    ]
+
+    # Adding columns rebuilds core_book on SQLite, which drops the search triggers,
+    # so they are reinstalled after the change in either direction
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, install_search_index),
+        migrations.AddField(
+            model_name='book',
+            name='borrow_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='wishlist_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-borrow_count', 'id'], name='book_borrow_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['-wishlist_count', 'id'], name='book_wishlist_count_idx'),
+        ),
+        migrations.RunPython(count_popularity, migrations.RunPython.noop),
+        migrations.RunPython(install_search_index, migrations.RunPython.noop),
+    ]
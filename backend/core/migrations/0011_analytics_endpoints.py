@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:14
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def mark_rollup_stale(apps, schema_editor):
+    # Existing rollup rows have no loan_days yet; the next read recomputes them
+    DailyAnalytics = apps.get_model('core', 'DailyAnalytics')
+    DailyAnalytics.objects.update(is_stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_book_popularity_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyanalytics',
+            name='loan_days',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(models.OrderBy(django.db.models.expressions.CombinedExpression(django.db.models.expressions.CombinedExpression(models.F('borrow_count'), '*', models.Value(2)), '+', models.F('wishlist_count')), descending=True), models.F('id'), name='book_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['user', 'borrowed_date'], name='borrowing_user_borrowed_idx'),
+        ),
+        migrations.RunPython(mark_rollup_stale, migrations.RunPython.noop),
+    ]
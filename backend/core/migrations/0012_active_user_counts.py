@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 04:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_analytics_endpoints'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='bookborrowing',
+            name='borrowing_returned_idx',
+        ),
+        migrations.AddIndex(
+            model_name='bookborrowing',
+            index=models.Index(fields=['returned_date', 'borrowed_date', 'user'], name='borrowing_returned_user_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.30 on 2026-10-17 05:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_active_user_counts'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='bookborrowing',
+            name='unique_active_borrowing',
+        ),
+        migrations.AddConstraint(
+            model_name='bookborrowing',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['active', 'overdue'])), fields=('book', 'user'), name='unique_active_borrowing'),
+        ),
+    ]
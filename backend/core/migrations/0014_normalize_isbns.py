@@ -0,0 +1,52 @@
+import re
+
+from django.db import migrations
+
+
+def _isbn13_check_digit(first_twelve):
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(first_twelve))
+    return str(-total % 10)
+
+
+def normalize_isbn(value):
+    """The ISBN-13 form of an ISBN-10 or ISBN-13, or None when value is not a valid ISBN"""
+    isbn = re.sub(r'[\s-]', '', value).upper()
+    if isbn.startswith('ISBN'):
+        isbn = isbn[4:].lstrip(':')
+    if len(isbn) == 10 and isbn[:9].isdigit() and (isbn[9].isdigit() or isbn[9] == 'X'):
+        total = sum((10 - i) * (10 if digit == 'X' else int(digit)) for i, digit in enumerate(isbn))
+        if total % 11:
+            return None
+        isbn = '978' + isbn[:9]
+        return isbn + _isbn13_check_digit(isbn)
+    if len(isbn) == 13 and isbn.isdigit() and _isbn13_check_digit(isbn[:12]) == isbn[12]:
+        return isbn
+    return None
+
+
+def normalize_isbns(apps, schema_editor):
+    """Store valid ISBNs in the ISBN-13 form the bulk import matches on.
+
+    A book whose normalized ISBN another book already has keeps its own, as
+    do identifiers that are not valid ISBNs.
+    """
+    Book = apps.get_model('core', 'Book')
+    taken = set(Book.objects.values_list('isbn', flat=True))
+    for book_id, isbn in Book.objects.order_by('id').values_list('id', 'isbn').iterator():
+        normalized = normalize_isbn(isbn)
+        if normalized is None or normalized == isbn or normalized in taken:
+            continue
+        Book.objects.filter(id=book_id).update(isbn=normalized)
+        taken.discard(isbn)
+        taken.add(normalized)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_overdue_status'),
+    ]
+
+    operations = [
+        migrations.RunPython(normalize_isbns, migrations.RunPython.noop),
+    ]
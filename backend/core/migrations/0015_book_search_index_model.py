@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-17 06:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_normalize_isbns'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookSearchIndex',
+            fields=[
+                ('book', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='core.book')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'core_book_fts',
+                'managed': False,
+            },
+        ),
+    ]
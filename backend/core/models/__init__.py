@@ -1,12 +1,15 @@
 from core.models.user import User
-from core.models.book import Book, BookBorrowing, WishlistItem
+from core.models.book import Book, BookBorrowing, BookSearchIndex, WishlistItem
 from core.models.event import Event, EventRegistration
+from core.models.analytics import DailyAnalytics
 
 __all__ = [
     'User',
     'Book',
     'BookBorrowing',
+    'BookSearchIndex',
     'WishlistItem',
     'Event',
     'EventRegistration',
+    'DailyAnalytics',
 ]
\ No newline at end of file
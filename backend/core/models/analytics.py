@@ -0,0 +1,24 @@
+from django.db import models
+
+
+# DailyAnalytics model to hold pre-aggregated per-day dashboard figures
+class DailyAnalytics(models.Model):
+    date = models.DateField(unique=True)
+    borrows = models.PositiveIntegerField(default=0)
+    returns = models.PositiveIntegerField(default=0)
+    loan_days = models.FloatField(default=0)  # combined length of the loans returned during the day
+    new_users = models.PositiveIntegerField(default=0)
+    active_users = models.PositiveIntegerField(default=0)  # distinct users with an open borrowing during the day
+    overdue = models.PositiveIntegerField(default=0)  # open borrowings past due at the end of the day
+    registrations = models.PositiveIntegerField(default=0)
+    events_created = models.PositiveIntegerField(default=0)
+    borrows_by_category = models.JSONField(default=dict)
+    events_by_category = models.JSONField(default=dict)
+    is_stale = models.BooleanField(default=False)  # set by signal hooks, cleared on refresh
+    refreshed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['date']
+
+    def __str__(self):
+        return f"Analytics for {self.date}"
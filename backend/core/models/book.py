@@ -1,6 +1,15 @@
 from django.db import models
 from .user import User
 
+
+def popularity_score():
+    """Weighted popularity of a book: lifetime borrows count double a wishlist entry.
+
+    Kept as one expression so the popularity index and the ORDER BY that uses
+    it stay identical.
+    """
+    return models.F('borrow_count') * 2 + models.F('wishlist_count')
+
 class Book(models.Model):
     STATUS_CHOICES = [
         ('Available', 'Available'),
@@ -30,9 +39,22 @@ class Book(models.Model):
     available_copies = models.PositiveIntegerField(default=1)
     category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='other')
     cover_image = models.URLField(blank=True, null=True)
+    borrow_count = models.PositiveIntegerField(default=0)  # lifetime borrowings, maintained by borrow_book
+    wishlist_count = models.PositiveIntegerField(default=0)  # current wishlist entries, maintained by the wishlist routes
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Keyset pagination orderings of the catalogue listing
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+            models.Index(fields=['created_at', 'id'], name='book_created_id_idx'),
+            # Popularity rankings
+            models.Index(fields=['-borrow_count', 'id'], name='book_borrow_count_idx'),
+            models.Index(fields=['-wishlist_count', 'id'], name='book_wishlist_count_idx'),
+            models.Index(popularity_score().desc(), models.F('id'), name='book_popularity_idx'),
+        ]
+    
     @property
     def status(self):
         if self.available_copies == 0:
@@ -42,6 +64,19 @@ class Book(models.Model):
         else:
             return 'Available'
     
+    @staticmethod
+    def status_expression(prefix=''):
+        """SQL equivalent of the status property, for use in values() and annotate()"""
+        return models.Case(
+            models.When(**{f'{prefix}available_copies': 0}, then=models.Value('Unavailable')),
+            models.When(
+                **{f'{prefix}available_copies__lte': models.F(f'{prefix}total_copies') * 0.2},
+                then=models.Value('Low Stock')
+            ),
+            default=models.Value('Available'),
+            output_field=models.CharField()
+        )
+    
     @property
     def borrowed(self):
         return self.total_copies - self.available_copies
@@ -49,6 +84,22 @@ class Book(models.Model):
     def __str__(self):
         return f"{self.title} by {self.author}"
     
+
+class BookSearchIndex(models.Model):
+    """A row of the SQLite full-text index of the books (see migration 0006)
+
+    The table is created and kept in sync by the database, so this model is
+    only read, by joining it from Book as search_index. rank is the bm25
+    relevance of the row to the MATCH query in the same statement.
+    """
+    book = models.OneToOneField(Book, on_delete=models.DO_NOTHING, primary_key=True,
+                                db_column='rowid', related_name='search_index')
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = 'core_book_fts'
+    
 # BookBorrowing model to track borrowings  
 class BookBorrowing(models.Model):
     STATUS_CHOICES = [
@@ -56,6 +107,8 @@ class BookBorrowing(models.Model):
         ('returned', 'Returned'),
         ('overdue', 'Overdue'),
     ]
+    # Not returned yet; active borrowings past due become overdue when the sweeper runs
+    OPEN_STATUSES = ['active', 'overdue']
     
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrowings')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='borrowed_books')
@@ -64,6 +117,38 @@ class BookBorrowing(models.Model):
     returned_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='active')
     
+    class Meta:
+        indexes = [
+            # my_books and the per-user active borrowing counts
+            models.Index(fields=['user', 'status'], name='borrowing_user_status_idx'),
+            # Per-user borrowing counts over a date range, answered from the index alone
+            models.Index(fields=['user', 'borrowed_date'], name='borrowing_user_borrowed_idx'),
+            # Overdue lookups and the sweeper's range scan of active borrowings by due date
+            models.Index(fields=['status', 'due_date'], name='borrowing_status_due_idx'),
+            # Date range scans of the analytics rollup
+            models.Index(fields=['borrowed_date'], name='borrowing_borrowed_idx'),
+            # Also covers the active-user counts, which read only these three columns
+            models.Index(fields=['returned_date', 'borrowed_date', 'user'], name='borrowing_returned_user_idx'),
+        ]
+        constraints = [
+            # A reader holds at most one open borrowing (OPEN_STATUSES) of a book; borrow_book relies on this
+            models.UniqueConstraint(
+                fields=['book', 'user'], condition=models.Q(status__in=['active', 'overdue']),
+                name='unique_active_borrowing'
+            ),
+        ]
+    
+    @staticmethod
+    def overdue_condition(now, prefix=''):
+        """Q of the borrowings past due at now, including active ones the sweeper has not reached yet.
+
+        Both halves are range lookups on the (status, due_date) index.
+        """
+        return (
+            models.Q(**{f'{prefix}status': 'overdue'})
+            | models.Q(**{f'{prefix}status': 'active', f'{prefix}due_date__lt': now})
+        )
+    
     def __str__(self):
         return f"{self.book.title} borrowed by {self.user.username}"
     
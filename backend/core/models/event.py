@@ -11,6 +11,8 @@ class Event(models.Model):
     end_date = models.DateTimeField()
     image = models.ImageField(upload_to='event_images/', blank=True, null=True)
     capacity = models.PositiveIntegerField(default=0)  # 0 means unlimited
+    registered_count = models.PositiveIntegerField(default=0)  # seats taken, maintained by register/unregister
+    waitlist_enabled = models.BooleanField(default=False)  # queue registrations once the event is full
     category = models.CharField(max_length=50, blank=True, null=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='created_events')
     created_at = models.DateTimeField(auto_now_add=True)
@@ -22,17 +24,38 @@ class Event(models.Model):
         
     class Meta:
         ordering = ['-start_date']
+        indexes = [
+            # Public listing of active events, in display order and upcoming only
+            models.Index(fields=['start_date'], name='event_active_start_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['end_date'], name='event_active_end_idx', condition=models.Q(is_active=True)),
+            models.Index(fields=['category'], name='event_category_idx'),
+            models.Index(fields=['created_at'], name='event_created_idx'),
+        ]
 
 # EventRegistration model to track event registrations
 class EventRegistration(models.Model):
+    STATUS_CHOICES = [
+        ('registered', 'Registered'),
+        ('waitlisted', 'Waitlisted'),
+    ]
+    
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='registrations')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='event_registrations')
     registration_date = models.DateTimeField(auto_now_add=True)
     attended = models.BooleanField(default=False)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='registered')
     
     class Meta:
         unique_together = ['event', 'user']
         ordering = ['-registration_date']
+        indexes = [
+            models.Index(fields=['registration_date'], name='registration_date_idx'),
+            # Oldest waitlisted registration of an event, for promotion
+            models.Index(
+                fields=['event', 'registration_date'], name='registration_waitlist_idx',
+                condition=models.Q(status='waitlisted')
+            ),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.event.title}"
\ No newline at end of file
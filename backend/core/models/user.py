@@ -17,6 +17,12 @@ class User(AbstractUser):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
     
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # New user counts of the analytics rollup
+            models.Index(fields=['date_joined'], name='user_date_joined_idx'),
+        ]
+    
     def is_admin(self):
         return self.role == self.ADMIN
     
@@ -0,0 +1,77 @@
+"""Sweeper that moves active borrowings past their due date to 'overdue'.
+
+Each batch is a range scan of the (status, due_date) index followed by an
+UPDATE of at most OVERDUE_SWEEP_BATCH_SIZE rows, each committed on its own,
+so a sweep never holds locks for long however much is due. The UPDATE only
+matches rows that are still active, so a sweep racing with a return, or with
+another sweeper, changes nothing twice.
+
+Counts do not depend on the sweeper having run: they use
+BookBorrowing.overdue_condition, which also matches active borrowings that
+are past due but not swept yet.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+
+from core.models.book import BookBorrowing
+
+
+logger = logging.getLogger(__name__)
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def sweep_overdue(now=None, batch_size=None):
+    """Mark the active borrowings due before now as overdue and return how many were marked"""
+    now = now or timezone.now()
+    batch_size = batch_size or settings.OVERDUE_SWEEP_BATCH_SIZE
+
+    swept = 0
+    while True:
+        ids = list(
+            BookBorrowing.objects.filter(status='active', due_date__lt=now)
+            .order_by('due_date')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return swept
+        swept += BookBorrowing.objects.filter(id__in=ids, status='active').update(status='overdue')
+
+
+def _run_scheduler(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            swept = sweep_overdue()
+            if swept:
+                logger.info('Marked %d borrowing(s) overdue', swept)
+        except Exception:
+            # Keep sweeping on the next tick, e.g. after "database is locked"
+            logger.exception('Overdue sweep failed')
+        finally:
+            connection.close()
+
+
+def start_scheduler():
+    """Start the in-process sweeper thread if OVERDUE_SWEEP_INTERVAL is set.
+
+    Called by the WSGI and ASGI entry points, so management commands never
+    start it. Idempotent within a process.
+    """
+    global _scheduler
+    interval = settings.OVERDUE_SWEEP_INTERVAL
+    if not interval:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(
+                target=_run_scheduler, args=(interval,), name='overdue-sweeper', daemon=True
+            )
+            _scheduler.start()
+    return _scheduler
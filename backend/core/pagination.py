@@ -0,0 +1,62 @@
+import base64
+import json
+from django.db.models import Q
+from ninja.errors import HttpError
+
+
+def encode_cursor(values):
+    """Encode the ordering values of the last row of a page as an opaque cursor"""
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise HttpError(400, "Invalid cursor")
+    if not isinstance(values, list) or len(values) != size:
+        raise HttpError(400, "Invalid cursor")
+    return values
+
+
+def keyset_query(queryset, ordering, cursor=None, limit=50):
+    """Return the unevaluated rows of one page of an ascending keyset ordering.
+
+    ``ordering`` lists the fields to sort on and must end with a unique field
+    (usually ``id``). Rows after the cursor are selected with a row-value
+    comparison expanded into ORs, so an index on the same fields serves every
+    page at the cost of the first one, unlike OFFSET. One row more than
+    ``limit`` is selected to tell whether another page follows.
+    """
+    if cursor:
+        values = decode_cursor(cursor, len(ordering))
+        after = Q()
+        for i, field in enumerate(ordering):
+            condition = Q(**{f'{field}__gt': values[i]})
+            for previous, value in zip(ordering[:i], values[:i]):
+                condition &= Q(**{previous: value})
+            after |= condition
+        queryset = queryset.filter(after)
+
+    return queryset.order_by(*ordering)[:limit + 1]
+
+
+def split_page(rows, fields, limit):
+    """Drop the extra row of a fetched page; return the page and the cursor of the next one"""
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field) for field in fields])
+    return rows, next_cursor
+
+
+def keyset_paginate(queryset, ordering, cursor=None, limit=50):
+    """Return one page of an ascending keyset ordering and the cursor of the next page"""
+    return split_page(list(keyset_query(queryset, ordering, cursor, limit)), ordering, limit)
+
+
+async def akeyset_paginate(queryset, ordering, cursor=None, limit=50):
+    """Async version of keyset_paginate"""
+    page = keyset_query(queryset, ordering, cursor, limit)
+    return split_page([row async for row in page], ordering, limit)
@@ -1,6 +1,57 @@
 from ninja_extra.security import HttpBearer
 from ninja_jwt.authentication import JWTAuth
 from ninja.errors import HttpError
+from ninja_jwt.exceptions import AuthenticationFailed, InvalidToken
+from ninja_jwt.settings import api_settings
+from core.token_cache import token_cache, build_user
+
+class CachedJWTAuth(JWTAuth):
+    """JWTAuth that remembers verified tokens so repeat requests skip decoding and the user query"""
+    def authenticate(self, request, token):
+        identity = token_cache.get(token)
+        if identity is not None:
+            user = build_user(identity)
+            request.user = user
+            return user
+        
+        validated_token = self.get_validated_token(token)
+        user = self.get_user(validated_token)
+        request.user = user
+        token_cache.set(token, user, validated_token.get('exp'))
+        return user
+
+    async def aauthenticate(self, request, token):
+        """Async version of authenticate; cached tokens are answered without leaving the event loop"""
+        identity = token_cache.get(token)
+        if identity is not None:
+            user = build_user(identity)
+            request.user = user
+            return user
+        
+        validated_token = self.get_validated_token(token)
+        user = await self.aget_user(validated_token)
+        request.user = user
+        token_cache.set(token, user, validated_token.get('exp'))
+        return user
+
+    async def aget_user(self, validated_token):
+        """Async version of JWTAuth.get_user using the async ORM"""
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken("Token contained no recognizable user identification") from e
+        
+        try:
+            user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+        except self.user_model.DoesNotExist as e:
+            raise AuthenticationFailed("User not found") from e
+        
+        if not user.is_active:
+            raise AuthenticationFailed("User is inactive")
+        return user
+
+# Shared instance used by the permission classes and the auth controller
+jwt_auth = CachedJWTAuth()
 
 class BaseAuthPermission:
     """Base class that provides authentication checking for permission classes"""
@@ -10,8 +61,7 @@ class BaseAuthPermission:
         if not access_token:
             return None
             
-        # Use JWTAuth to authenticate the request
-        jwt_auth = JWTAuth()
+        # Use the cached JWTAuth to authenticate the request
         try:
             # JWTAuth needs the token as the second argument
             return jwt_auth.authenticate(request, access_token)
@@ -19,11 +69,24 @@ class BaseAuthPermission:
             print(f"Authentication error: {str(e)}")
             return None
 
+    async def aauthenticate(self, request):
+        """Async version of authenticate, for the permission classes of async routes"""
+        access_token = request.COOKIES.get('access_token')
+        if not access_token:
+            return None
+        
+        try:
+            return await jwt_auth.aauthenticate(request, access_token)
+        except Exception as e:
+            print(f"Authentication error: {str(e)}")
+            return None
+
 class IsAuthenticated(BaseAuthPermission):
     def __call__(self, request):
         # Authenticate the request
-        user = self.authenticate(request)
-        
+        return self.check(request, self.authenticate(request))
+    
+    def check(self, request, user):
         # Check if user is authenticated
         if user and user.is_authenticated:
             # Set user on request for later use
@@ -36,8 +99,9 @@ class IsAuthenticated(BaseAuthPermission):
 class IsAdmin(BaseAuthPermission):
     def __call__(self, request):
         # Authenticate the request
-        user = self.authenticate(request)
-        
+        return self.check(request, self.authenticate(request))
+    
+    def check(self, request, user):
         # Check if user is authenticated and is admin
         if user and user.is_authenticated:
             # Set user on request for later use
@@ -71,6 +135,15 @@ class IsReader(BaseAuthPermission):
         # Using a string for the error message instead of a dictionary
         raise HttpError(401, "Authentication required")
 
+# Variants for async routes: ninja awaits these, so the user lookup runs on the async ORM
+class AsyncIsAuthenticated(IsAuthenticated):
+    async def __call__(self, request):
+        return self.check(request, await self.aauthenticate(request))
+
+class AsyncIsAdmin(IsAdmin):
+    async def __call__(self, request):
+        return self.check(request, await self.aauthenticate(request))
+
 class JWTAuthBearer(HttpBearer):
     def authenticate(self, request, token):
         # Also check for token in cookies
@@ -79,7 +152,6 @@ class JWTAuthBearer(HttpBearer):
             if not token:
                 return None
         
-        jwt_auth = JWTAuth()
         try:
             user_auth = jwt_auth.authenticate(request, token)
             if user_auth:
@@ -90,14 +162,3 @@ class JWTAuthBearer(HttpBearer):
             print(f"JWT Authentication error: {str(e)}")
         
         return None
-    
-    def __call__(self, request):
-        # Skip authentication for specific paths that should be public
-        if request.path.endswith('/events/'):
-            # Set an anonymous user equivalent
-            if not hasattr(request, 'user') or not request.user:
-                request.user = None
-            return True
-            
-        # Try normal authentication
-        return super().__call__(request)
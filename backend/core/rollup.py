@@ -0,0 +1,250 @@
+"""Maintenance of the DailyAnalytics rollup table.
+
+Days are computed in bulk with one grouped query per measure over a
+contiguous run of days, so refreshing a range costs a fixed number of
+queries regardless of its length. Signal hooks in core.signals only flag
+the affected days as stale; reads refresh stale and missing days on demand.
+
+Everything here reads from the primary database, even in requests that
+core.routers sends to the replica: a day computed from a lagging replica
+would be stored as fresh and keep its stale figures until it is next
+flagged, and a row just refreshed may not have reached the replica yet.
+"""
+from bisect import bisect_right
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.models.analytics import DailyAnalytics
+from core.models.book import BookBorrowing, User
+from core.models.event import Event, EventRegistration
+from core.timebuckets import day_start
+
+
+ROLLUP_FIELDS = [
+    'borrows', 'returns', 'loan_days', 'new_users', 'active_users', 'overdue',
+    'registrations', 'events_created', 'borrows_by_category', 'events_by_category',
+]
+
+# Most periods counted by one active user query; each period is a column of its result
+ACTIVE_USERS_CHUNK = 200
+
+
+def count_active_users(period_starts, period_ends):
+    """Count distinct users with an open borrowing in each period.
+
+    A user is active in a period if one of their borrowings started before the
+    period ends and was not returned before it starts. Each period is a
+    filtered COUNT(DISTINCT user) of a single aggregate, so the database does
+    the counting in one scan of the (returned_date, borrowed_date, user)
+    index instead of the rows being fetched and swept in Python. Periods are
+    counted ACTIVE_USERS_CHUNK at a time, which keeps the result within the
+    database's column limit and each scan to the borrowings of its chunk.
+    """
+    counts = []
+    for offset in range(0, len(period_starts), ACTIVE_USERS_CHUNK):
+        counts += _count_active_users(
+            period_starts[offset:offset + ACTIVE_USERS_CHUNK], period_ends[offset:offset + ACTIVE_USERS_CHUNK]
+        )
+    return counts
+
+
+def _count_active_users(period_starts, period_ends):
+    counts = BookBorrowing.objects.using(DEFAULT_DB_ALIAS).filter(
+        Q(returned_date__isnull=True) | Q(returned_date__gte=period_starts[0]),
+        borrowed_date__lt=period_ends[-1],
+    ).aggregate(**{
+        f'period_{index}': Count('user', distinct=True, filter=Q(borrowed_date__lt=end) & (
+            Q(returned_date__isnull=True) | Q(returned_date__gte=start)
+        ))
+        for index, (start, end) in enumerate(zip(period_starts, period_ends))
+    })
+    return [counts[f'period_{index}'] for index in range(len(period_starts))]
+
+
+def count_overdue(instants):
+    """Count borrowings that are open and past due at each instant using one query"""
+    if not instants:
+        return []
+
+    borrowings = BookBorrowing.objects.using(DEFAULT_DB_ALIAS).filter(
+        borrowed_date__lt=instants[-1],
+        due_date__lt=instants[-1]
+    ).filter(
+        Q(returned_date__isnull=True) | Q(returned_date__gte=instants[0])
+    ).values_list('borrowed_date', 'due_date', 'returned_date')
+
+    last_index = len(instants) - 1
+    deltas = [0] * (len(instants) + 1)
+
+    for borrowed_date, due_date, returned_date in borrowings.iterator():
+        first = bisect_right(instants, max(borrowed_date, due_date))
+        last = last_index if returned_date is None else min(bisect_right(instants, returned_date) - 1, last_index)
+        if first <= last:
+            deltas[first] += 1
+            deltas[last + 1] -= 1
+
+    return _running_total(deltas)
+
+
+def _running_total(deltas):
+    counts = []
+    running = 0
+    for delta in deltas[:-1]:
+        running += delta
+        counts.append(running)
+    return counts
+
+
+def _daily_counts(queryset, field, extra=None):
+    """Group a queryset by the calendar day of a datetime field"""
+    rows = queryset.annotate(day=TruncDate(field)).values('day', *([extra] if extra else [])).annotate(
+        count=Count('id')
+    ).order_by()
+    if extra is None:
+        return {row['day']: row['count'] for row in rows}
+
+    result = {}
+    for row in rows:
+        key = row[extra] or ''
+        result.setdefault(row['day'], {})[key] = row['count']
+    return result
+
+
+def refresh_range(first_day, last_day):
+    """Recompute the rollup rows for every day from first_day to last_day inclusive"""
+    days = [first_day + timedelta(days=i) for i in range((last_day - first_day).days + 1)]
+    if not days:
+        return 0
+
+    starts = [day_start(day) for day in days]
+    ends = starts[1:] + [day_start(last_day + timedelta(days=1))]
+    lower, upper = starts[0], ends[-1]
+
+    primary = DEFAULT_DB_ALIAS
+    borrowings = BookBorrowing.objects.using(primary).filter(borrowed_date__gte=lower, borrowed_date__lt=upper)
+    borrows = _daily_counts(borrowings, 'borrowed_date')
+    borrows_by_category = _daily_counts(borrowings, 'borrowed_date', 'book__category')
+    returns = {}
+    loan_days = {}
+    returned = BookBorrowing.objects.using(primary).filter(
+        returned_date__gte=lower, returned_date__lt=upper
+    ).annotate(
+        day=TruncDate('returned_date')
+    ).values('day').annotate(
+        count=Count('id'),
+        duration=Sum(ExpressionWrapper(F('returned_date') - F('borrowed_date'), output_field=DurationField()))
+    ).order_by()
+    for row in returned:
+        returns[row['day']] = row['count']
+        loan_days[row['day']] = row['duration'].total_seconds() / 86400 if row['duration'] else 0
+    new_users = _daily_counts(
+        User.objects.using(primary).filter(date_joined__gte=lower, date_joined__lt=upper), 'date_joined'
+    )
+    registrations = _daily_counts(
+        EventRegistration.objects.using(primary).filter(registration_date__gte=lower, registration_date__lt=upper),
+        'registration_date'
+    )
+    events = Event.objects.using(primary).filter(created_at__gte=lower, created_at__lt=upper)
+    events_created = _daily_counts(events, 'created_at')
+    events_by_category = _daily_counts(events, 'created_at', 'category')
+    active_users = count_active_users(starts, ends)
+    overdue = count_overdue(ends)
+
+    rows = [
+        DailyAnalytics(
+            date=day,
+            borrows=borrows.get(day, 0),
+            returns=returns.get(day, 0),
+            loan_days=loan_days.get(day, 0),
+            new_users=new_users.get(day, 0),
+            active_users=active_users[i],
+            overdue=overdue[i],
+            registrations=registrations.get(day, 0),
+            events_created=events_created.get(day, 0),
+            borrows_by_category=borrows_by_category.get(day, {}),
+            events_by_category=events_by_category.get(day, {}),
+            is_stale=False,
+        )
+        for i, day in enumerate(days)
+    ]
+    DailyAnalytics.objects.using(primary).bulk_create(
+        rows,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['date'],
+        update_fields=ROLLUP_FIELDS + ['is_stale', 'refreshed_at'],
+    )
+    return len(rows)
+
+
+def refresh_days(days):
+    """Recompute a set of days, batching contiguous runs into single range refreshes"""
+    refreshed = 0
+    run_start = run_end = None
+    for day in sorted(set(days)):
+        if run_end is not None and day == run_end + timedelta(days=1):
+            run_end = day
+            continue
+        if run_end is not None:
+            refreshed += refresh_range(run_start, run_end)
+        run_start = run_end = day
+    if run_end is not None:
+        refreshed += refresh_range(run_start, run_end)
+    return refreshed
+
+
+def mark_stale(*moments):
+    """Flag the days containing the given datetimes so the next read recomputes them"""
+    days = {timezone.localdate(moment) for moment in moments if moment is not None}
+    if days:
+        DailyAnalytics.objects.filter(date__in=days, is_stale=False).update(is_stale=True)
+
+
+def mark_stale_between(start, end):
+    """Flag every day from start to end inclusive, for changes that span several days"""
+    DailyAnalytics.objects.filter(
+        date__gte=timezone.localdate(start), date__lte=timezone.localdate(end), is_stale=False
+    ).update(is_stale=True)
+
+
+def ensure_range(first_day, last_day):
+    """Make sure every day in the range has an up-to-date rollup row.
+
+    Missing and stale days are recomputed. Today is also recomputed once it is
+    older than ANALYTICS_ROLLUP_MAX_AGE seconds, because overdue counts move
+    with the clock even when no rows change.
+    """
+    today = timezone.localdate()
+    last_day = min(last_day, today)
+    max_age = timedelta(seconds=getattr(settings, 'ANALYTICS_ROLLUP_MAX_AGE', 60))
+
+    existing = DailyAnalytics.objects.using(DEFAULT_DB_ALIAS).filter(
+        date__gte=first_day, date__lte=last_day
+    ).values_list('date', 'is_stale', 'refreshed_at')
+
+    fresh = set()
+    for day, is_stale, refreshed_at in existing:
+        if is_stale:
+            continue
+        # Rows computed before their day was over are partial
+        if refreshed_at < day_start(day + timedelta(days=1)) and refreshed_at < timezone.now() - max_age:
+            continue
+        fresh.add(day)
+
+    pending = [
+        first_day + timedelta(days=i)
+        for i in range((last_day - first_day).days + 1)
+        if first_day + timedelta(days=i) not in fresh
+    ]
+    return refresh_days(pending)
+
+
+def rollup_rows(first_day, last_day):
+    """Return up-to-date rollup rows for the range, refreshing what is missing"""
+    ensure_range(first_day, last_day)
+    return list(DailyAnalytics.objects.using(DEFAULT_DB_ALIAS).filter(date__gte=first_day, date__lte=last_day))
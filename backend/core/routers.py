@@ -0,0 +1,68 @@
+"""Database routing between the primary database and a read replica.
+
+Reads go to the replica only while ReplicaMiddleware serves a request it
+considers read-only; every other query, and every write, uses the primary.
+As soon as a request writes, its later reads fall back to the primary so it
+reads what it has just written. The switch lives in a context variable, so
+it follows the request into the threads that async views hand work to.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+
+REPLICA_DB_ALIAS = 'replica'
+
+_replica_reads = ContextVar('replica_reads', default=None)
+
+
+class _ReplicaReads:
+    """Whether reads may still go to the replica during one request.
+
+    A mutable object rather than a plain value, so that a write made in one
+    of the request's worker threads turns the replica off for all of them.
+    """
+    __slots__ = ('enabled',)
+
+    def __init__(self):
+        self.enabled = True
+
+
+def replica_configured():
+    return REPLICA_DB_ALIAS in settings.DATABASES
+
+
+@contextmanager
+def replica_reads():
+    """Send the reads made inside the block to the replica until something is written"""
+    token = _replica_reads.set(_ReplicaReads())
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+class ReplicaRouter:
+    """Database router installed when a replica database is configured"""
+
+    def db_for_read(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is not None and reads.enabled:
+            return REPLICA_DB_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        reads = _replica_reads.get()
+        if reads is not None:
+            # Read your own writes for the rest of the request
+            reads.enabled = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_DB_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
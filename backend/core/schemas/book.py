@@ -1,5 +1,5 @@
 from ninja import Schema
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 # Book schemas
@@ -35,9 +35,22 @@ class BookResponseSchema(Schema):
     cover_image: Optional[str]
     status: str
     borrowed: int
+    borrow_count: int
+    wishlist_count: int
     created_at: datetime
     updated_at: datetime
 
+class BookImportErrorSchema(Schema):
+    line: int
+    isbn: Optional[str]
+    error: str
+
+class BookImportResultSchema(Schema):
+    created: int
+    updated: int
+    failed: int
+    errors: List[BookImportErrorSchema]
+
 # Book Borrowing schemas
 class BookBorrowSchema(Schema):
     book_id: int
@@ -19,6 +19,7 @@ class EventIn(Schema):
     category: Optional[str] = None
     image: Optional[str] = None
     is_active: bool = True
+    waitlist_enabled: bool = False
 
 class EventOut(Schema):
     id: int
@@ -35,6 +36,7 @@ class EventOut(Schema):
     updated_at: datetime
     is_active: bool
     registered_count: int
+    waitlist_enabled: bool
 
 class EventRegistrationIn(Schema):
     event_id: int
@@ -45,3 +47,13 @@ class EventRegistrationOut(Schema):
     user: UserSchema
     registration_date: datetime
     attended: bool
+    status: str
+
+class EventAttendeeOut(Schema):
+    id: int
+    user_id: int
+    username: str
+    email: str
+    registration_date: datetime
+    attended: bool
+    status: str
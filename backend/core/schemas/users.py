@@ -1,6 +1,7 @@
 from ninja import Schema, ModelSchema
 from typing import Optional
 from django.contrib.auth import get_user_model
+from core.models.book import BookBorrowing
 
 
 User = get_user_model()
@@ -50,7 +51,7 @@ class UserListSchema(ModelSchema):
     
     @staticmethod
     def resolve_borrowing_count(obj):
-        return obj.borrowed_books.filter(status='active').count()
+        return obj.borrowed_books.filter(status__in=BookBorrowing.OPEN_STATUSES).count()
     
     class Config:
         model = User
@@ -0,0 +1,88 @@
+"""Full-text search over the book catalogue.
+
+SQLite uses an external-content FTS5 table (core_book_fts) kept in sync with
+core_book by triggers; PostgreSQL uses a generated, GIN-indexed tsvector
+column. Both are created by migration 0006 and maintained by the database
+itself, so every write path (save, delete, bulk_create, update) stays in
+sync. Results are ranked by relevance and paginated on (rank, id) so deep
+pages stay cheap. Searches for a number, such as an ISBN or part of one,
+match substrings of the ISBN, title and author instead.
+"""
+import re
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models import BooleanField, F, Q
+from django.db.models.expressions import RawSQL
+from core.book_import import normalize_isbn
+from core.pagination import keyset_query, split_page
+
+
+def normalize_search(term):
+    """Split a search box string into word tokens; ISBN-like input loses its hyphens"""
+    term = term.strip()
+    if re.fullmatch(r'[\d\-\s]+[xX]?', term):
+        term = re.sub(r'[\-\s]', '', term)
+    return re.findall(r'\w+', term)
+
+
+def search_query(queryset, term, cursor=None, limit=50):
+    """Return the unevaluated rows of one page of books matching ``term``, and their cursor fields.
+
+    Every token must match, and the last token also matches as a prefix so the
+    search box can query on each keystroke. Books are ranked by relevance.
+    A number, which the index only matches as a whole token, and databases
+    without a search index fall back to substring matching ordered by title;
+    an ISBN-10 also finds the book stored under its ISBN-13. As with
+    keyset_query, one row more than ``limit`` is selected.
+    """
+    tokens = normalize_search(term)
+    if not tokens:
+        return queryset.none(), ('id',)
+
+    vendor = connections[queryset.db].vendor
+    number = tokens[0] if len(tokens) == 1 and re.fullmatch(r'\d+[xX]?', tokens[0]) else None
+    if number is not None or vendor not in ('sqlite', 'postgresql'):
+        condition = Q()
+        for token in tokens:
+            condition &= Q(title__icontains=token) | Q(author__icontains=token) | Q(isbn__icontains=token)
+        if number is not None:
+            try:
+                condition |= Q(isbn=normalize_isbn(number))
+            except ValueError:
+                pass
+        return keyset_query(queryset.filter(condition), ('title', 'id'), cursor, limit), ('title', 'id')
+
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{token}"' for token in tokens[:-1])
+        match = f'{match} "{tokens[-1]}"*'.strip()
+        # Joined once, so the index is queried once rather than for each book
+        queryset = queryset.filter(
+            RawSQL('core_book_fts MATCH %s', [match], output_field=BooleanField()),
+            search_index__isnull=False,
+        )
+        rank = F('search_index__rank')
+    elif vendor == 'postgresql':
+        tsquery = ' & '.join(f"'{token}'" for token in tokens[:-1])
+        tsquery = f"{tsquery} & '{tokens[-1]}':*" if tsquery else f"'{tokens[-1]}':*"
+        query = SearchQuery(tsquery, search_type='raw', config='english')
+        # The generated column is maintained by the database, not declared on Book
+        queryset = queryset.alias(
+            search_vector=RawSQL('core_book.search_vector', [], output_field=SearchVectorField())
+        ).filter(search_vector=query)
+        # Negated so that, as with bm25, lower means more relevant
+        rank = -SearchRank(F('search_vector'), query, cover_density=True)
+
+    fields = ('search_rank', 'id')
+    return keyset_query(queryset.annotate(search_rank=rank), fields, cursor, limit), fields
+
+
+def search_books(queryset, term, cursor=None, limit=50):
+    """Return one page of books matching ``term`` and the cursor of the next page"""
+    page, fields = search_query(queryset, term, cursor, limit)
+    return split_page(list(page), fields, limit)
+
+
+async def asearch_books(queryset, term, cursor=None, limit=50):
+    """Async version of search_books"""
+    page, fields = search_query(queryset, term, cursor, limit)
+    return split_page([row async for row in page], fields, limit)
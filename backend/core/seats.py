@@ -0,0 +1,46 @@
+"""Seats of capacity-limited events.
+
+Event.registered_count counts the registrations holding a seat. A seat is
+claimed with a conditional UPDATE of that counter, so capacity holds under
+concurrent registrations without counting rows. Registrations beyond the
+capacity of an event with waitlist_enabled wait in registration order.
+Deleting a registration that holds a seat releases it and hands it to the
+waitlist, however the registration is deleted (see core.signals).
+"""
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.models.event import Event, EventRegistration
+
+
+def claim_seat(event_id):
+    """Take a seat with a conditional UPDATE; returns False when the event is full"""
+    return Event.objects.filter(id=event_id).filter(
+        Q(capacity=0) | Q(registered_count__lt=F('capacity'))
+    ).update(registered_count=F('registered_count') + 1) > 0
+
+
+def release_seat(event_id):
+    Event.objects.filter(id=event_id, registered_count__gt=0).update(
+        registered_count=F('registered_count') - 1
+    )
+
+
+def fill_from_waitlist(event_id):
+    """Move waitlisted registrations into free seats, oldest first"""
+    promoted = 0
+    while True:
+        registration_id = EventRegistration.objects.filter(
+            event_id=event_id, status='waitlisted'
+        ).order_by('registration_date', 'id').values_list('id', flat=True).first()
+        if registration_id is None:
+            return promoted
+        
+        with transaction.atomic():
+            if not claim_seat(event_id):
+                return promoted
+            # Another request may promote the same registration, so the move is conditional too
+            if EventRegistration.objects.filter(id=registration_id, status='waitlisted').update(status='registered'):
+                promoted += 1
+            else:
+                release_seat(event_id)
@@ -0,0 +1,93 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models import QuerySet
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from core.models.book import Book, BookBorrowing, User, WishlistItem
+from core.models.event import Event, EventRegistration
+from core.cache import invalidate_analytics
+from core.token_cache import token_cache
+from core import rollup, seats
+
+
+# Keep the DailyAnalytics rollup and the cached analytics responses in step
+# with the rows they aggregate
+
+@receiver(post_save, sender=BookBorrowing)
+def borrowing_saved(sender, instance, **kwargs):
+    rollup.mark_stale(instance.borrowed_date, instance.returned_date, timezone.now())
+    invalidate_analytics()
+
+@receiver(post_delete, sender=BookBorrowing)
+def borrowing_deleted(sender, instance, **kwargs):
+    # A removed borrowing changes active and overdue counts for its whole span
+    rollup.mark_stale_between(instance.borrowed_date, instance.returned_date or timezone.now())
+    invalidate_analytics()
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, created=False, update_fields=None, **kwargs):
+    # Logins only stamp last_login, which neither a figure nor a token depends on
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    # Tokens verified before a change of role or status, or a deletion, must
+    # not keep serving the old user, whoever made the change
+    if not created:
+        token_cache.invalidate_user(instance.id)
+    rollup.mark_stale(instance.date_joined)
+    invalidate_analytics()
+
+@receiver(post_save, sender=Event)
+@receiver(post_delete, sender=Event)
+def event_changed(sender, instance, **kwargs):
+    rollup.mark_stale(instance.created_at)
+    invalidate_analytics()
+
+@receiver(post_save, sender=EventRegistration)
+@receiver(post_delete, sender=EventRegistration)
+def registration_changed(sender, instance, **kwargs):
+    rollup.mark_stale(instance.registration_date)
+    invalidate_analytics()
+
+@receiver(post_delete, sender=EventRegistration)
+def registration_deleted(sender, instance, origin=None, **kwargs):
+    # A seat is released however its registration goes: unregistering, or a
+    # cascade from a deleted user. Deleting the event takes its waitlist along,
+    # so there is nothing to give the seat to.
+    if isinstance(origin, Event) or (isinstance(origin, QuerySet) and origin.model is Event):
+        return
+    if instance.status == 'registered':
+        seats.release_seat(instance.event_id)
+        transaction.on_commit(lambda: seats.fill_from_waitlist(instance.event_id))
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=WishlistItem)
+@receiver(post_delete, sender=WishlistItem)
+def catalogue_changed(sender, instance, **kwargs):
+    # Stock and popularity figures are read live rather than from the rollup
+    invalidate_analytics()
+
+@receiver(connection_created)
+def tune_sqlite(sender, connection, **kwargs):
+    # Apply SQLITE_PRAGMAS to every new SQLite connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
+
+def delay_query(execute, sql, params, many, context):
+    time.sleep(settings.DATABASE_LATENCY_MS / 1000)
+    return execute(sql, params, many, context)
+
+@receiver(connection_created)
+def add_latency(sender, connection, **kwargs):
+    # Simulate a remote database when DATABASE_LATENCY_MS is set; a reconnect
+    # reuses the wrapper object, so the delay is only added once
+    if getattr(settings, 'DATABASE_LATENCY_MS', 0) and delay_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(delay_query)
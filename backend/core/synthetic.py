@@ -0,0 +1,315 @@
+"""Synthetic data at production scale, for benchmarking (manage.py seed_db --scale).
+
+At scale 1 the generator writes 50k readers, 100k books, 5M borrowings, 250k
+wishlist entries, 2k events and 200k registrations spread over several
+years, with bulk_create in batches. Volumes are skewed the way a library's
+are: a few books and readers account for most borrowings (Zipf-like
+weights), activity grows towards the present and dips at weekends, readers
+only borrow after they joined, and the borrowings of the last weeks are
+still open or overdue. The same seed and the same day give the same data.
+
+Every synthetic reader shares one password hash, computed once.
+"""
+import bisect
+import itertools
+import random
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from core.models.book import Book, BookBorrowing, User, WishlistItem
+from core.models.event import Event, EventRegistration
+
+
+# Rows written at scale 1
+BASE_VOLUMES = {
+    'users': 50_000,
+    'books': 100_000,
+    'borrowings': 5_000_000,
+    'wishlist': 250_000,
+    'events': 2_000,
+    'registrations': 200_000,
+}
+
+SYNTHETIC_PASSWORD = 'readerpass'
+
+LOAN_DAYS = 14
+
+# Draws per row asked for, before giving up on picks that break a uniqueness rule
+ATTEMPTS = 3
+
+WORDS = (
+    'Shadow River Winter Garden Silent Empire Glass Iron Hidden Last Night Light Secret Lost '
+    'House Storm Ocean Stone Crown City Forest Dream Fire Golden Wild Broken Distant Northern '
+    'Bridge Mountain Star Island Memory Letter Journey Kingdom Song Mirror Clock Road Harbor'
+).split()
+SURNAMES = (
+    'Smith Johnson Brown Garcia Miller Davis Wilson Moore Taylor Anderson Thomas Jackson White '
+    'Harris Martin Thompson Young King Wright Lopez Hill Scott Green Adams Baker Nelson Carter'
+).split()
+EVENT_CATEGORIES = ['workshop', 'reading', 'book-club', 'lecture', 'kids']
+
+
+def volumes_for(scale):
+    """Number of rows of each kind at a scale, at least one of each"""
+    return {name: max(int(count * scale), 1) for name, count in BASE_VOLUMES.items()}
+
+
+def isbn13(number):
+    """A valid 979-prefixed ISBN-13 for a serial number, distinct from real 978 ones"""
+    digits = f'979{number:09d}'
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(digits))
+    return digits + str(-total % 10)
+
+
+def zipf_weights(count, exponent):
+    """Cumulative weights making rank 0 the most likely pick, for random.choices"""
+    return list(itertools.accumulate(1 / (rank + 1) ** exponent for rank in range(count)))
+
+
+@contextmanager
+def explicit_timestamps(*fields):
+    """Let bulk_create keep the given auto_now/auto_now_add values instead of stamping now"""
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def _field(model, name):
+    return model._meta.get_field(name)
+
+
+class SyntheticData:
+    """Writes skewed synthetic volumes in batches, reporting progress through a callback.
+
+    progress is called with the kind of row, the rows written so far, the
+    total asked for and whether that kind is finished. Picks that would break a
+    uniqueness rule or a capacity are drawn again, up to a few times the total.
+    """
+
+    def __init__(self, scale=1.0, seed=0, years=5, batch_size=5000, progress=None):
+        self.volumes = volumes_for(scale)
+        self.rng = random.Random(seed)
+        self.batch_size = batch_size
+        self.progress = progress or (lambda kind, done, total, finished=False: None)
+
+        # Anchored to the start of today so that a rerun on the same day matches
+        self.end = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.end - timedelta(days=365 * years)
+        self.span = (self.end - self.start).total_seconds()
+
+    def moment(self):
+        """A time in the seeded period; activity grows towards the end and dips at weekends"""
+        while True:
+            moment = self.start + timedelta(seconds=self.span * self.rng.random() ** 0.6)
+            if moment.weekday() < 5 or self.rng.random() < 0.6:
+                return moment
+
+    def write(self, kind, model, rows, total, keep=None):
+        """bulk_create rows from an iterable in batches, one transaction per batch.
+
+        Returns keep(row) of every row written, once it has its primary key, or
+        the number of rows written when keep is not given.
+        """
+        done = 0
+        kept = []
+        rows = itertools.islice(rows, total)
+        while True:
+            batch = list(itertools.islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                model.objects.bulk_create(batch, batch_size=self.batch_size)
+            if keep:
+                kept.extend(keep(row) for row in batch)
+            done += len(batch)
+            self.progress(kind, done, total)
+        self.progress(kind, done, total, finished=True)
+        return kept if keep else done
+
+    def run(self):
+        with explicit_timestamps(
+            _field(Book, 'created_at'), _field(Book, 'updated_at'),
+            _field(BookBorrowing, 'borrowed_date'), _field(WishlistItem, 'added_date'),
+            _field(Event, 'created_at'), _field(Event, 'updated_at'),
+            _field(EventRegistration, 'registration_date'),
+        ):
+            self.create_users()
+            self.create_books()
+            self.create_borrowings()
+            self.create_wishlists()
+            self.create_events()
+            self.create_registrations()
+
+    def create_users(self):
+        total = self.volumes['users']
+        password = make_password(SYNTHETIC_PASSWORD)
+        joined = sorted(self.moment() for _ in range(total))
+        # Readers in order of joining, so a borrower can be picked among those who had joined
+        self.readers = self.write('users', User, (
+            User(
+                username=f'user{i:07d}', email=f'user{i:07d}@example.com', password=password,
+                first_name=self.rng.choice(WORDS), last_name=self.rng.choice(SURNAMES),
+                role='reader', date_joined=date_joined,
+            )
+            for i, date_joined in enumerate(joined)
+        ), total, keep=lambda user: user.pk)
+        self.reader_joined = joined
+
+    def create_books(self):
+        total = self.volumes['books']
+        categories = [key for key, _ in Book.CATEGORY_CHOICES]
+        category_weights = zipf_weights(len(categories), 0.8)
+        authors = [f'{self.rng.choice(WORDS)} {self.rng.choice(SURNAMES)}' for _ in range(max(total // 5, 1))]
+        author_weights = zipf_weights(len(authors), 1.0)
+
+        def books():
+            for i in range(total):
+                created_at = self.start - timedelta(days=self.rng.uniform(0, 365))
+                copies = self.rng.choice((1, 1, 2, 2, 3, 3, 4, 5, 8, 10))
+                yield Book(
+                    title=' '.join(self.rng.sample(WORDS, self.rng.randint(2, 4))).title(),
+                    author=self.rng.choices(authors, cum_weights=author_weights)[0],
+                    description=f'A synthetic book about {" ".join(self.rng.sample(WORDS, 3)).lower()}.',
+                    isbn=isbn13(i), total_copies=copies, available_copies=copies,
+                    category=self.rng.choices(categories, cum_weights=category_weights)[0],
+                    created_at=created_at, updated_at=created_at,
+                )
+
+        self.book_ids = self.write('books', Book, books(), total, keep=lambda book: book.pk)
+        # Shuffled so popularity does not follow the order of creation
+        self.rng.shuffle(self.book_ids)
+        self.book_weights = zipf_weights(len(self.book_ids), 1.1)
+
+    def pick_reader(self, moment):
+        """A reader who had joined by moment, long-standing readers being the busiest"""
+        joined = bisect.bisect_right(self.reader_joined, moment)
+        if not joined:
+            return None
+        # Squaring a uniform draw skews it towards 0, the earliest readers to join
+        return self.readers[int(joined * self.rng.random() ** 2)]
+
+    def create_borrowings(self):
+        total = self.volumes['borrowings']
+        open_pairs = set()
+        self.open_by_book = {}
+
+        def borrowings():
+            for _ in range(total * ATTEMPTS):
+                borrowed_date = self.moment()
+                user_id = self.pick_reader(borrowed_date)
+                if user_id is None:
+                    continue
+                book_id = self.rng.choices(self.book_ids, cum_weights=self.book_weights)[0]
+                due_date = borrowed_date + timedelta(days=LOAN_DAYS)
+                # Most loans end within the loan period, a tail of them late
+                returned_date = borrowed_date + timedelta(days=self.rng.triangular(1, 40, 9))
+                if returned_date < self.end:
+                    status = 'returned'
+                else:
+                    if (book_id, user_id) in open_pairs:
+                        continue
+                    open_pairs.add((book_id, user_id))
+                    self.open_by_book[book_id] = self.open_by_book.get(book_id, 0) + 1
+                    returned_date = None
+                    status = 'overdue' if due_date < self.end else 'active'
+                yield BookBorrowing(
+                    book_id=book_id, user_id=user_id, borrowed_date=borrowed_date,
+                    due_date=due_date, returned_date=returned_date, status=status,
+                )
+
+        self.write('borrowings', BookBorrowing, borrowings(), total)
+
+        # Take the open borrowings out of stock, adding copies where demand exceeded them
+        books = Book.objects.filter(id__in=list(self.open_by_book)).only('id', 'total_copies')
+        changed = []
+        for book in books.iterator(chunk_size=self.batch_size):
+            taken = self.open_by_book[book.id]
+            book.total_copies = max(book.total_copies, taken)
+            book.available_copies = book.total_copies - taken
+            changed.append(book)
+        Book.objects.bulk_update(changed, ['total_copies', 'available_copies'], batch_size=1000)
+
+    def create_wishlists(self):
+        total = self.volumes['wishlist']
+        seen = set()
+
+        def items():
+            for _ in range(total * ATTEMPTS):
+                added_date = self.moment()
+                user_id = self.pick_reader(added_date)
+                book_id = self.rng.choices(self.book_ids, cum_weights=self.book_weights)[0]
+                if user_id is None or (book_id, user_id) in seen:
+                    continue
+                seen.add((book_id, user_id))
+                yield WishlistItem(book_id=book_id, user_id=user_id, added_date=added_date)
+
+        self.write('wishlist', WishlistItem, items(), total)
+
+    def create_events(self):
+        total = self.volumes['events']
+        organizer = User.objects.filter(role='admin').order_by('id').first()
+        if organizer is None:
+            organizer = User.objects.create_user(
+                username='admin', email='admin@example.com', password='adminpass', role='admin'
+            )
+
+        def events():
+            for _ in range(total):
+                created_at = self.moment()
+                start_date = created_at + timedelta(days=self.rng.uniform(3, 60))
+                yield Event(
+                    title=f'{" ".join(self.rng.sample(WORDS, 2))} {self.rng.choice(EVENT_CATEGORIES)}'.title(),
+                    description='A synthetic library event.', location=f'Room {self.rng.randint(1, 12)}',
+                    start_date=start_date, end_date=start_date + timedelta(hours=self.rng.choice((1, 2, 3))),
+                    capacity=self.rng.choice((0, 20, 30, 50, 100, 200)),
+                    waitlist_enabled=self.rng.random() < 0.3,
+                    category=self.rng.choice(EVENT_CATEGORIES), created_by=organizer,
+                    created_at=created_at, updated_at=created_at,
+                )
+
+        self.events = self.write('events', Event, events(), total, keep=lambda event: (
+            event.pk, event.created_at, event.start_date, event.capacity, event.waitlist_enabled
+        ))
+
+    def create_registrations(self):
+        total = self.volumes['registrations']
+        event_weights = zipf_weights(len(self.events), 0.7)
+        seats = {}
+        seen = set()
+
+        def registrations():
+            for _ in range(total * ATTEMPTS):
+                event_id, created_at, start_date, capacity, waitlist_enabled = self.rng.choices(
+                    self.events, cum_weights=event_weights
+                )[0]
+                registration_date = created_at + (start_date - created_at) * self.rng.random()
+                if registration_date >= self.end:
+                    continue
+                user_id = self.pick_reader(registration_date)
+                if user_id is None or (event_id, user_id) in seen:
+                    continue
+                taken = seats.get(event_id, 0)
+                if capacity and taken >= capacity:
+                    if not waitlist_enabled:
+                        continue
+                    status = 'waitlisted'
+                else:
+                    status = 'registered'
+                    seats[event_id] = taken + 1
+                seen.add((event_id, user_id))
+                yield EventRegistration(
+                    event_id=event_id, user_id=user_id, registration_date=registration_date,
+                    attended=status == 'registered' and start_date < self.end and self.rng.random() < 0.7,
+                    status=status,
+                )
+
+        self.write('registrations', EventRegistration, registrations(), total)
@@ -0,0 +1,1081 @@
+import importlib
+import io
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync
+from django.apps import apps as django_apps
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.db.models import Count
+from django.utils import timezone
+from ninja.errors import HttpError
+from ninja_jwt.exceptions import AuthenticationFailed
+from ninja_jwt.tokens import RefreshToken
+
+from core import book_import, rollup
+from core.book_fetch import BookFetcher, ResponseCache, isbn_query
+from core.cache import analytics_version, invalidate_analytics
+from core.controllers.analytics import QUERY_BUDGETS
+from core.models.analytics import DailyAnalytics
+from core.models.book import Book, BookBorrowing, User, WishlistItem
+from core.models.event import Event, EventRegistration
+from core.permissions import AsyncIsAdmin, jwt_auth
+from core.routers import replica_reads
+from core.search import search_books
+from core.synthetic import SyntheticData
+from core.token_cache import TokenCache, token_cache
+from core.tokens import LMSRefreshToken
+
+
+def aware(year, month, day):
+    return timezone.make_aware(datetime(year, month, day, 12))
+
+
+def make_user(username, role='reader'):
+    return User.objects.create_user(
+        username=username, email=f'{username}@example.com', password='pass', role=role
+    )
+
+
+def make_book(isbn, copies=3, **fields):
+    return Book.objects.create(
+        title=fields.pop('title', f'Book {isbn}'), author=fields.pop('author', 'Author'),
+        isbn=isbn, total_copies=copies, available_copies=copies, **fields
+    )
+
+
+def make_borrowing(book, user, borrowed_date, returned_date=None, status=None):
+    """A borrowing with historic dates, which auto_now_add would otherwise replace"""
+    borrowing = BookBorrowing.objects.create(
+        book=book, user=user, due_date=borrowed_date + timedelta(days=14),
+        returned_date=returned_date, status=status or ('returned' if returned_date else 'active'),
+    )
+    BookBorrowing.objects.filter(id=borrowing.id).update(borrowed_date=borrowed_date)
+    borrowing.borrowed_date = borrowed_date
+    return borrowing
+
+
+def client_for(user):
+    client = Client()
+    client.cookies['access_token'] = str(LMSRefreshToken.for_user(user).access_token)
+    return client
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.other = make_user('other')
+        self.book = make_book('9780000000002')
+
+    def test_refresh_multi_year_range(self):
+        make_borrowing(self.book, self.reader, aware(2020, 3, 1), aware(2020, 3, 10))
+        make_borrowing(self.book, self.other, aware(2024, 6, 1), aware(2024, 6, 20))
+        make_borrowing(self.book, self.reader, aware(2026, 1, 5))
+
+        # More days than one query can hold a column for
+        refreshed = rollup.refresh_range(date(2020, 1, 1), date(2026, 10, 17))
+
+        self.assertEqual(refreshed, (date(2026, 10, 17) - date(2020, 1, 1)).days + 1)
+        rows = {row.date: row for row in DailyAnalytics.objects.all()}
+        self.assertEqual(rows[date(2020, 1, 1)].active_users, 0)
+        self.assertEqual(rows[date(2020, 3, 5)].active_users, 1)
+        self.assertEqual(rows[date(2020, 3, 11)].active_users, 0)
+        self.assertEqual(rows[date(2024, 6, 10)].active_users, 1)
+        self.assertEqual(rows[date(2026, 3, 1)].active_users, 1)
+        self.assertEqual(rows[date(2020, 3, 1)].borrows, 1)
+        self.assertEqual(rows[date(2024, 6, 20)].returns, 1)
+        self.assertEqual(rows[date(2026, 3, 1)].overdue, 1)
+
+    @override_settings(DATABASE_ROUTERS=['core.routers.ReplicaRouter'])
+    def test_refresh_reads_the_primary(self):
+        make_borrowing(self.book, self.reader, aware(2024, 6, 1), aware(2024, 6, 20))
+
+        # No replica database is configured here, so any read routed to it would fail
+        with replica_reads():
+            rows = rollup.rollup_rows(date(2024, 6, 1), date(2024, 6, 30))
+
+        self.assertEqual(sum(row.borrows for row in rows), 1)
+        self.assertEqual(sum(row.returns for row in rows), 1)
+
+    def test_activity_over_several_years(self):
+        make_borrowing(self.book, self.reader, aware(2021, 5, 1), aware(2021, 5, 8))
+        client = client_for(make_user('admin', role='admin'))
+
+        response = client.get('/api/admin/analytics/activity', {
+            'start': '2020-01-01', 'end': '2026-10-17', 'granularity': 'quarter',
+        })
+
+        self.assertEqual(response.status_code, 200, response.content)
+
+
+@override_settings(BOOKS_PAGE_SIZE=2, BOOKS_MAX_PAGE_SIZE=3)
+class BookListTests(TestCase):
+    def setUp(self):
+        for i in range(5):
+            make_book(f'978000000000{i}', title=f'Title {i}')
+        self.client = client_for(make_user('reader'))
+
+    def titles(self, response):
+        self.assertEqual(response.status_code, 200)
+        return [book['title'] for book in response.json()]
+
+    def test_first_page_by_default(self):
+        response = self.client.get('/api/books')
+
+        self.assertEqual(self.titles(response), ['Title 0', 'Title 1'])
+        self.assertIn('X-Next-Cursor', response)
+
+    def test_limit_is_capped(self):
+        response = self.client.get('/api/books', {'limit': 1000})
+
+        self.assertEqual(self.titles(response), ['Title 0', 'Title 1', 'Title 2'])
+
+    def test_pages_follow_the_cursor(self):
+        titles = []
+        response = self.client.get('/api/books')
+        while True:
+            titles += self.titles(response)
+            if 'X-Next-Cursor' not in response:
+                break
+            response = self.client.get('/api/books', {'cursor': response['X-Next-Cursor']})
+
+        self.assertEqual(titles, [f'Title {i}' for i in range(5)])
+
+
+def query_plan(queryset):
+    """The lines of SQLite's EXPLAIN QUERY PLAN for a queryset, joined"""
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        return ' | '.join(row[-1] for row in cursor.fetchall())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'query plans are checked on SQLite')
+class HotPathIndexTests(TestCase):
+    """Each hot query is planned on its index, even on an empty table"""
+
+    def setUp(self):
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=30)
+
+    def assertUsesIndex(self, queryset, index):
+        plan = query_plan(queryset)
+        self.assertIn(index, plan)
+
+    def test_my_books(self):
+        self.assertUsesIndex(
+            BookBorrowing.objects.filter(user_id=1, status__in=BookBorrowing.OPEN_STATUSES),
+            'borrowing_user_status_idx',
+        )
+
+    def test_borrow_duplicate_check(self):
+        # borrow_book leaves the check to the partial unique index, which the insert itself probes
+        reader, book = make_user('reader'), make_book('9780000000002')
+        make_borrowing(book, reader, self.start)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            BookBorrowing.objects.create(book=book, user=reader, due_date=self.now)
+        make_borrowing(book, reader, self.start, returned_date=self.now)
+
+    def test_overdue_sweep(self):
+        self.assertUsesIndex(
+            BookBorrowing.objects.filter(status='active', due_date__lt=self.now).values('id'),
+            'borrowing_status_due_idx',
+        )
+
+    def test_rollup_borrowed_range(self):
+        self.assertUsesIndex(
+            BookBorrowing.objects.filter(borrowed_date__gte=self.start, borrowed_date__lt=self.now),
+            'borrowing_borrowed_idx',
+        )
+
+    def test_rollup_returned_range(self):
+        self.assertUsesIndex(
+            BookBorrowing.objects.filter(returned_date__gte=self.start, returned_date__lt=self.now),
+            'borrowing_returned_user_idx',
+        )
+
+    def test_user_borrowings_over_a_range(self):
+        self.assertUsesIndex(
+            BookBorrowing.objects.filter(user_id=1, borrowed_date__gte=self.start).values('user').annotate(
+                count=Count('id')
+            ),
+            'borrowing_user_borrowed_idx',
+        )
+
+    def test_event_listing(self):
+        events = Event.objects.select_related('created_by').filter(is_active=True)
+        self.assertUsesIndex(events, 'event_active_start_idx')
+        # Walked in the listing order, so upcoming_only needs no sort either
+        plan = query_plan(events.filter(end_date__gte=self.now))
+        self.assertIn('event_active_start_idx', plan)
+        self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_upcoming_events(self):
+        # SQLite prefers the ordered start_date walk for the listing; the bare filter uses end_date
+        self.assertUsesIndex(
+            Event.objects.filter(is_active=True, end_date__gte=self.now).order_by(), 'event_active_end_idx'
+        )
+
+    def test_events_by_category(self):
+        self.assertUsesIndex(Event.objects.filter(category='workshop'), 'event_category_idx')
+
+    def test_rollup_events_created(self):
+        self.assertUsesIndex(
+            Event.objects.filter(created_at__gte=self.start, created_at__lt=self.now), 'event_created_idx'
+        )
+
+    def test_rollup_registrations(self):
+        self.assertUsesIndex(
+            EventRegistration.objects.filter(registration_date__gte=self.start, registration_date__lt=self.now),
+            'registration_date_idx',
+        )
+
+    def test_rollup_new_users(self):
+        self.assertUsesIndex(
+            User.objects.filter(date_joined__gte=self.start, date_joined__lt=self.now), 'user_date_joined_idx'
+        )
+
+
+class ReaderListQueryTests(TestCase):
+    """my_books and the wishlist are read in one query, however long they are"""
+
+    def setUp(self):
+        self.reader = make_user('reader')
+        self.client = client_for(self.reader)
+        self.books = [make_book(f'97800000001{i:02d}') for i in range(20)]
+
+    def assertListedInOneQuery(self, path, expected_rows):
+        # A first request warms the token cache so only the listing itself is counted
+        self.client.get(path)
+        with self.assertNumQueries(1):
+            response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), expected_rows)
+
+    def test_my_books(self):
+        now = timezone.now()
+        make_borrowing(self.books[0], self.reader, now - timedelta(days=3))
+        self.assertListedInOneQuery('/api/reader/my-books', 1)
+
+        for book in self.books[1:]:
+            make_borrowing(book, self.reader, now - timedelta(days=20), returned_date=now - timedelta(days=2))
+        self.assertListedInOneQuery('/api/reader/my-books', 20)
+
+    def test_wishlist(self):
+        WishlistItem.objects.create(book=self.books[0], user=self.reader)
+        self.assertListedInOneQuery('/api/reader/wishlist', 1)
+
+        WishlistItem.objects.bulk_create(WishlistItem(book=book, user=self.reader) for book in self.books[1:])
+        self.assertListedInOneQuery('/api/reader/wishlist', 20)
+
+
+def make_readers(count):
+    # One password hash for every reader, as hashing each would dominate the run
+    password = make_password('pass')
+    return User.objects.bulk_create(
+        User(username=f'reader{i}', email=f'reader{i}@example.com', password=password, role='reader')
+        for i in range(count)
+    )
+
+
+class ConcurrentTestCase(TransactionTestCase):
+    """Runs API calls together on separate threads and connections"""
+
+    def run_together(self, calls, probe=None):
+        """Run each call on its own thread and connection, released at the same moment.
+
+        probe, when given, runs on each thread right after its call; returns
+        the results of the calls and the probes.
+        """
+        barrier = threading.Barrier(len(calls))
+        results = [None] * len(calls)
+        probes = []
+
+        def worker(index, call):
+            try:
+                barrier.wait()
+                results[index] = call()
+                if probe is not None:
+                    probes.append(probe())
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i, call)) for i, call in enumerate(calls)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, probes
+
+    def post(self, user, path, payload=None):
+        return lambda: client_for(user).post(path, json.dumps(payload or {}), content_type='application/json')
+
+
+class ConcurrentBorrowTests(ConcurrentTestCase):
+    """Concurrent borrows and returns on separate connections never oversell or double count a copy"""
+
+    # Hundreds of readers racing for a handful of copies
+    readers = 300
+    copies = 4
+
+    def setUp(self):
+        self.book = make_book('9780000000002', copies=self.copies)
+        self.users = make_readers(self.readers)
+
+    def run_together(self, calls):
+        results, stocks = super().run_together(
+            calls, probe=lambda: Book.objects.values_list('available_copies', flat=True).get(id=self.book.id)
+        )
+        self.assertTrue(all(stock >= 0 for stock in stocks), stocks)
+        return results
+
+    def test_concurrent_borrows_take_each_copy_once(self):
+        responses = self.run_together([
+            self.post(user, '/api/reader/borrow', {'book_id': self.book.id}) for user in self.users
+        ])
+
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200] * self.copies + [400] * (self.readers - self.copies))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, 0)
+        self.assertEqual(self.book.borrow_count, self.copies)
+        self.assertEqual(BookBorrowing.objects.filter(status='active').count(), self.copies)
+
+    def test_concurrent_borrows_by_one_reader_open_one_borrowing(self):
+        reader = self.users[0]
+        responses = self.run_together([
+            self.post(reader, '/api/reader/borrow', {'book_id': self.book.id}) for _ in range(50)
+        ])
+
+        self.assertEqual(sum(response.status_code == 200 for response in responses), 1)
+        self.assertTrue(all(response.status_code in (200, 400) for response in responses))
+        self.assertEqual(BookBorrowing.objects.filter(book=self.book, user=reader, status='active').count(), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, self.copies - 1)
+        self.assertEqual(self.book.borrow_count, 1)
+
+    def test_concurrent_returns_give_the_copy_back_once(self):
+        reader = self.users[0]
+        borrowing = client_for(reader).post(
+            '/api/reader/borrow', json.dumps({'book_id': self.book.id}), content_type='application/json'
+        ).json()
+
+        responses = self.run_together([
+            self.post(reader, '/api/reader/return', {'borrowing_id': borrowing['id']}) for _ in range(6)
+        ])
+
+        self.assertEqual(sum(response.status_code == 200 for response in responses), 1)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.available_copies, self.copies)
+
+
+class UniqueActiveBorrowingMigrationTests(TransactionTestCase):
+    """0008 closes the duplicate open borrowings the racy borrow endpoint could leave"""
+
+    before = [('core', '0007_hot_path_indexes')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        self.migrate(MigrationExecutor(connection).loader.graph.leaf_nodes())
+
+    def test_duplicate_open_borrowings_are_returned(self):
+        apps = self.migrate(self.before)
+        OldUser = apps.get_model('core', 'User')
+        OldBook = apps.get_model('core', 'Book')
+        OldBorrowing = apps.get_model('core', 'BookBorrowing')
+        reader = OldUser.objects.create(username='reader', email='reader@example.com', role='reader')
+        book = OldBook.objects.create(title='Book', author='Author', isbn='9780000000002', total_copies=3, available_copies=0)
+        due_date = timezone.now() + timedelta(days=14)
+        first, *_ = [
+            OldBorrowing.objects.create(book=book, user=reader, due_date=due_date, status='active')
+            for _ in range(3)
+        ]
+
+        apps = self.migrate([('core', '0008_unique_active_borrowing')])
+        OldBorrowing = apps.get_model('core', 'BookBorrowing')
+
+        self.assertEqual(list(OldBorrowing.objects.filter(status='active').values_list('id', flat=True)), [first.id])
+        self.assertEqual(OldBorrowing.objects.filter(status='returned', returned_date__isnull=False).count(), 2)
+        self.assertEqual(apps.get_model('core', 'Book').objects.get(id=book.id).available_copies, 2)
+
+
+def make_event(organizer, capacity, waitlist_enabled=True):
+    start_date = timezone.now() + timedelta(days=7)
+    return Event.objects.create(
+        title='Event', description='An event', location='Room 1', start_date=start_date,
+        end_date=start_date + timedelta(hours=2), capacity=capacity,
+        waitlist_enabled=waitlist_enabled, created_by=organizer,
+    )
+
+
+class EventSeatTests(TestCase):
+    """registered_count follows the registrations holding a seat, and freed seats go to the waitlist"""
+
+    def setUp(self):
+        self.organizer = make_user('organizer', role='admin')
+        self.event = make_event(self.organizer, capacity=1)
+        self.first, self.second = make_user('first'), make_user('second')
+
+    def register(self, user):
+        return client_for(user).post(f'/api/events/{self.event.id}/register')
+
+    def unregister(self, user):
+        # The waitlist is refilled once the delete commits
+        with self.captureOnCommitCallbacks(execute=True):
+            return client_for(user).delete(f'/api/events/{self.event.id}/unregister')
+
+    def statuses(self):
+        return dict(self.event.registrations.values_list('user__username', 'status'))
+
+    def test_unregistering_gives_the_seat_to_the_waitlist(self):
+        self.assertEqual(self.register(self.first).json()['status'], 'registered')
+        self.assertEqual(self.register(self.second).json()['status'], 'waitlisted')
+
+        self.assertEqual(self.unregister(self.first).status_code, 200)
+
+        self.assertEqual(self.statuses(), {'second': 'registered'})
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.registered_count, 1)
+
+    def test_unregistering_from_the_waitlist_keeps_the_seat_taken(self):
+        self.register(self.first)
+        self.register(self.second)
+
+        self.assertEqual(self.unregister(self.second).status_code, 200)
+
+        self.assertEqual(self.statuses(), {'first': 'registered'})
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.registered_count, 1)
+        self.assertEqual(self.unregister(self.second).status_code, 404)
+
+    def test_deleting_a_seated_user_gives_the_seat_to_the_waitlist(self):
+        self.register(self.first)
+        self.register(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.organizer).delete(f'/api/users/{self.first.id}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(), {'second': 'registered'})
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.registered_count, 1)
+
+    def test_deleting_a_waitlisted_user_keeps_the_seat_taken(self):
+        self.register(self.first)
+        self.register(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.second.delete()
+
+        self.event.refresh_from_db()
+        self.assertEqual(self.event.registered_count, 1)
+
+    def test_deleting_the_event_takes_its_registrations(self):
+        self.register(self.first)
+        self.register(self.second)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.event.delete()
+
+        self.assertFalse(EventRegistration.objects.exists())
+
+
+class ConcurrentEventTests(ConcurrentTestCase):
+    """Concurrent registrations never overbook an event, and freed seats go to the waitlist in order"""
+
+    readers = 120
+    capacity = 5
+
+    def setUp(self):
+        self.event = make_event(make_user('organizer', role='admin'), capacity=self.capacity)
+        self.users = make_readers(self.readers)
+
+    def registered_count(self):
+        return Event.objects.values_list('registered_count', flat=True).get(id=self.event.id)
+
+    def run_together(self, calls):
+        results, counts = super().run_together(calls, probe=self.registered_count)
+        self.assertTrue(all(count <= self.capacity for count in counts), counts)
+        return results
+
+    def register_all(self):
+        return self.run_together([
+            self.post(user, f'/api/events/{self.event.id}/register') for user in self.users
+        ])
+
+    def test_concurrent_registrations_fill_the_capacity_once(self):
+        responses = self.register_all()
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        statuses = Counter(response.json()['status'] for response in responses)
+        self.assertEqual(statuses, {'registered': self.capacity, 'waitlisted': self.readers - self.capacity})
+        self.assertEqual(self.event.registrations.filter(status='registered').count(), self.capacity)
+        self.assertEqual(self.registered_count(), self.capacity)
+
+    def test_concurrent_registrations_without_waitlist_are_turned_away(self):
+        Event.objects.filter(id=self.event.id).update(waitlist_enabled=False)
+        responses = self.register_all()
+
+        statuses = sorted(response.status_code for response in responses)
+        self.assertEqual(statuses, [200] * self.capacity + [400] * (self.readers - self.capacity))
+        self.assertFalse(self.event.registrations.filter(status='waitlisted').exists())
+        self.assertEqual(self.registered_count(), self.capacity)
+
+    def test_freed_seats_go_to_the_earliest_waitlisted(self):
+        self.register_all()
+        seated = list(self.event.registrations.filter(status='registered').values_list('user_id', flat=True))
+        waitlist = list(
+            self.event.registrations.filter(status='waitlisted')
+            .order_by('registration_date', 'id').values_list('user_id', flat=True)
+        )
+        users = {user.id: user for user in self.users}
+
+        responses = self.run_together([
+            lambda user=users[user_id]: client_for(user).delete(f'/api/events/{self.event.id}/unregister')
+            for user_id in seated
+        ])
+
+        self.assertTrue(all(response.status_code == 200 for response in responses))
+        self.assertEqual(
+            set(self.event.registrations.filter(status='registered').values_list('user_id', flat=True)),
+            set(waitlist[:self.capacity])
+        )
+        self.assertEqual(self.registered_count(), self.capacity)
+
+
+class AnalyticsQueryBudgetTests(TestCase):
+    """Each computed analytics response stays within its query budget, whatever the data"""
+
+    def setUp(self):
+        self.admin = make_user('admin', role='admin')
+        self.client = client_for(self.admin)
+        self.readers = [make_user(f'reader{i}') for i in range(3)]
+        self.books = [make_book(f'97800000002{i:02d}', category='fiction') for i in range(3)]
+        cache.clear()
+
+    def add_borrowings(self, count):
+        now = timezone.now()
+        for i in range(count):
+            borrowed_date = now - timedelta(days=i * 7 % 170 + 1)
+            make_borrowing(
+                self.books[i % 3], self.readers[i % 3], borrowed_date,
+                returned_date=borrowed_date + timedelta(days=5) if i % 4 else None,
+                status=None if i % 4 else 'returned',
+            )
+
+    def assertWithinBudgets(self):
+        for endpoint, budget in QUERY_BUDGETS.items():
+            with self.subTest(endpoint=endpoint):
+                url = f'/api/admin/analytics/{endpoint}?timeRange=6months'
+                # The warm-up request fills the rollup and token caches
+                self.assertEqual(self.client.get(url).status_code, 200)
+                with self.captureOnCommitCallbacks(execute=True):
+                    invalidate_analytics()
+                with self.assertNumQueries(budget):
+                    self.client.get(url)
+
+    def test_small_data(self):
+        self.add_borrowings(1)
+        self.assertWithinBudgets()
+
+    def test_more_data(self):
+        self.add_borrowings(60)
+        self.assertWithinBudgets()
+
+
+class AnalyticsCacheTests(TestCase):
+    """Cached analytics responses are served until a committed write bumps the version"""
+
+    url = '/api/admin/analytics/metrics?timeRange=6months'
+
+    def setUp(self):
+        cache.clear()
+        self.client = client_for(make_user('admin', role='admin'))
+        self.reader = client_for(make_user('reader'))
+        self.book = make_book('9780000000300')
+
+    def checked_out(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['booksCheckedOut']
+
+    def post(self, client, path, payload):
+        # Run the on_commit invalidation, as the request's commit would
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(path, json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_borrow_and_return_refresh_the_metrics(self):
+        self.assertEqual(self.checked_out(), 0)
+
+        borrowing = self.post(self.reader, '/api/reader/borrow', {'book_id': self.book.id})
+        self.assertEqual(self.checked_out(), 1)
+
+        self.post(self.reader, '/api/reader/return', {'borrowing_id': borrowing['id']})
+        self.assertEqual(self.checked_out(), 0)
+
+    def test_uncommitted_write_keeps_the_cached_metrics(self):
+        self.assertEqual(self.checked_out(), 0)
+
+        # Without a commit the version is not bumped and the cached figures stand
+        self.reader.post('/api/reader/borrow', json.dumps({'book_id': self.book.id}), content_type='application/json')
+        self.assertEqual(self.checked_out(), 0)
+
+    def test_rolled_back_invalidation_keeps_the_version(self):
+        version = analytics_version()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    invalidate_analytics()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertEqual(analytics_version(), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_analytics()
+        self.assertEqual(analytics_version(), version + 1)
+
+
+class StubBooksAPI(BaseHTTPRequestHandler):
+    """Google Books stand-in answering isbn: queries; script maps an ISBN to statuses to answer first"""
+
+    script = {}
+    requests = []
+    retry_after = '0'
+
+    def do_GET(self):
+        isbn = parse_qs(urlparse(self.path).query)['q'][0].removeprefix('isbn:')
+        self.requests.append((isbn, time.monotonic()))
+        statuses = self.script.get(isbn, [])
+        status = statuses.pop(0) if statuses else 200
+        if status != 200:
+            self.send_response(status)
+            self.send_header('Retry-After', self.retry_after)
+            self.end_headers()
+            return
+        body = json.dumps({'items': [{'volumeInfo': {
+            'title': f'Book {isbn}', 'authors': ['Author'], 'categories': ['Science'],
+            'industryIdentifiers': [{'type': 'ISBN_13', 'identifier': isbn}],
+        }}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class BookFetcherTests(SimpleTestCase):
+    def setUp(self):
+        StubBooksAPI.script = {}
+        StubBooksAPI.requests = []
+        StubBooksAPI.retry_after = '0'
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubBooksAPI)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.api_url = f'http://127.0.0.1:{self.server.server_port}/volumes'
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.cache_dir.cleanup)
+
+    def fetch(self, isbns, **options):
+        options = {'workers': 4, 'rate': 1000, 'burst': 10, 'retries': 2, 'backoff': 0.01, **options}
+        fetcher = BookFetcher(api_url=self.api_url, **options)
+        try:
+            return list(fetcher.fetch((isbn, isbn_query(isbn)) for isbn in isbns))
+        finally:
+            fetcher.close()
+
+    def test_retries_429_and_5xx(self):
+        StubBooksAPI.script = {'9780000000001': [429], '9780000000002': [503, 502], '9780000000003': [500] * 3}
+
+        results = self.fetch(['9780000000001', '9780000000002', '9780000000003'])
+
+        self.assertEqual([result.identifier for result in results], ['9780000000001', '9780000000002', '9780000000003'])
+        self.assertEqual(results[0].book['title'], 'Book 9780000000001')
+        self.assertEqual(results[0].attempts, 2)
+        self.assertEqual(results[1].attempts, 3)
+        self.assertEqual(results[1].book['category'], 'science')
+        # Two retries after the first attempt, then it gives up
+        self.assertIsNone(results[2].book)
+        self.assertIn('HTTP 500 after 3 attempts', results[2].error)
+
+    def test_client_errors_are_not_retried(self):
+        StubBooksAPI.script = {'9780000000001': [404]}
+
+        result, = self.fetch(['9780000000001'])
+
+        self.assertEqual(result.error, 'HTTP 404')
+        self.assertEqual(len(StubBooksAPI.requests), 1)
+
+    def test_retry_after_is_capped(self):
+        StubBooksAPI.script = {'9780000000001': [429]}
+        StubBooksAPI.retry_after = '3600'
+
+        started = time.monotonic()
+        result, = self.fetch(['9780000000001'], max_backoff=0.05)
+
+        self.assertEqual(result.attempts, 2)
+        self.assertLess(time.monotonic() - started, 5)
+
+    def test_negative_retries_make_one_attempt(self):
+        StubBooksAPI.script = {'9780000000001': [500]}
+
+        result, = self.fetch(['9780000000001'], retries=-1)
+
+        self.assertEqual(result.error, 'HTTP 500 after 1 attempts')
+        with self.assertRaisesMessage(CommandError, '--retries must not be negative'):
+            call_command('fetch_book_data', retries=-1, api_url=self.api_url, no_cache=True)
+
+    def test_rate_limit_spaces_requests(self):
+        isbns = [f'97800000000{i:02d}' for i in range(11)]
+
+        self.fetch(isbns, workers=8, rate=20, burst=1)
+
+        moments = sorted(moment for _, moment in StubBooksAPI.requests)
+        # Eleven requests at 20 a second, the first at once, span at least half a second
+        self.assertEqual(len(moments), 11)
+        self.assertGreaterEqual(moments[-1] - moments[0], 0.45)
+
+    def test_cache_hits_skip_the_api(self):
+        isbns = ['9780000000001', '9780000000002']
+        cache = ResponseCache(self.cache_dir.name)
+
+        first = self.fetch(isbns, cache=cache)
+        second = self.fetch(isbns, cache=ResponseCache(self.cache_dir.name))
+
+        self.assertEqual(len(StubBooksAPI.requests), 2)
+        self.assertFalse(any(result.cached for result in first))
+        self.assertTrue(all(result.cached for result in second))
+        self.assertEqual([result.book['title'] for result in second], [result.book['title'] for result in first])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        make_book('9780061120084', title='To Kill a Mockingbird', author='Harper Lee')
+        make_book('9780451524935', title='1984', author='George Orwell')
+        make_book('9780743273565', title='The Great Gatsby', author='F. Scott Fitzgerald')
+
+    def titles(self, term):
+        page, _ = search_books(Book.objects.all(), term)
+        return [book.title for book in page]
+
+    def test_words_and_prefixes(self):
+        self.assertEqual(self.titles('great gats'), ['The Great Gatsby'])
+        self.assertEqual(self.titles('orwell'), ['1984'])
+
+    def test_isbn_10_finds_the_isbn_13(self):
+        self.assertEqual(self.titles('0061120084'), ['To Kill a Mockingbird'])
+        self.assertEqual(self.titles('0-06-112008-4'), ['To Kill a Mockingbird'])
+
+    def test_isbn_substrings(self):
+        self.assertEqual(self.titles('978-0-06-112008-4'), ['To Kill a Mockingbird'])
+        self.assertEqual(self.titles('1120084'), ['To Kill a Mockingbird'])
+        self.assertEqual(self.titles('978045152'), ['1984'])
+
+    def test_numbers_in_titles(self):
+        self.assertEqual(self.titles('1984'), ['1984'])
+
+    @skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'needs the search index')
+    def test_ranked_pages_follow_the_cursor(self):
+        make_book('9780000000401', title='Dragon Riders', description='A saga.')
+        make_book('9780000000402', title='Sea Tales', description='A dragon appears once.')
+        make_book('9780000000403', title='Dragon Dragon', description='More dragons.')
+
+        titles, cursor = [], None
+        while True:
+            page, cursor = search_books(Book.objects.all(), 'dragon', cursor, limit=1)
+            titles += [book.title for book in page]
+            if cursor is None:
+                break
+
+        # Title matches rank above a description match, and no book is repeated or skipped
+        self.assertEqual(len(titles), 3)
+        self.assertEqual(set(titles[:2]), {'Dragon Riders', 'Dragon Dragon'})
+        self.assertEqual(titles[2], 'Sea Tales')
+
+
+class BookImportTests(TestCase):
+    def import_csv(self, text, chunk_size):
+        return book_import.import_books(io.StringIO(text), 'csv', chunk_size=chunk_size)
+
+    def test_last_row_of_an_isbn_wins_whatever_the_chunk(self):
+        text = (
+            'isbn,title,author,total_copies\n'
+            '978-0-06-112008-4,First,Harper Lee,2\n'
+            '9780451524935,1984,George Orwell,1\n'
+            '0061120081,Second,Harper Lee,9\n'
+        )
+        for chunk_size in (1, 2, 10):
+            with self.subTest(chunk_size=chunk_size):
+                Book.objects.all().delete()
+                report = self.import_csv(text, chunk_size)
+
+                self.assertEqual((report.created, report.updated, report.failed), (2, 1, 0))
+                book = Book.objects.get(isbn='9780061120084')
+                self.assertEqual((book.title, book.total_copies), ('Second', 2))
+
+    def test_hyphenated_isbns_are_updated_in_place(self):
+        make_book('978-0-06-112008-4', title='Old title')
+        migration = importlib.import_module('core.migrations.0014_normalize_isbns')
+        migration.normalize_isbns(django_apps, None)
+
+        report = self.import_csv('isbn,title,author\n9780061120084,New title,Harper Lee\n', 10)
+
+        self.assertEqual((report.created, report.updated), (0, 1))
+        self.assertEqual(list(Book.objects.values_list('isbn', 'title')), [('9780061120084', 'New title')])
+
+    def test_created_books_store_the_isbn_13(self):
+        client = client_for(make_user('admin', role='admin'))
+        response = client.post('/api/books', json.dumps({
+            'title': 'To Kill a Mockingbird', 'author': 'Harper Lee', 'isbn': '0-06-112008-1',
+            'total_copies': 1, 'category': 'fiction',
+        }), content_type='application/json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['isbn'], '9780061120084')
+
+
+class AsyncAuthTests(TestCase):
+    """AsyncIsAdmin, through CachedJWTAuth.aauthenticate, guards the async admin routes"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.admin = make_user('admin', role='admin')
+        self.reader = make_user('reader')
+
+    def request_for(self, user=None):
+        request = RequestFactory().get('/api/admin/analytics/metrics')
+        if user is not None:
+            request.COOKIES['access_token'] = str(LMSRefreshToken.for_user(user).access_token)
+        return request
+
+    async def assertRejected(self, request, status_code):
+        with self.assertRaises(HttpError) as raised:
+            await AsyncIsAdmin()(request)
+        self.assertEqual(raised.exception.status_code, status_code)
+
+    async def test_no_cookie_is_unauthorized(self):
+        await self.assertRejected(self.request_for(), 401)
+
+    async def test_reader_is_forbidden(self):
+        await self.assertRejected(self.request_for(self.reader), 403)
+
+    async def test_admin_is_allowed(self):
+        request = self.request_for(self.admin)
+        self.assertTrue(await AsyncIsAdmin()(request))
+        self.assertEqual(request.user.id, self.admin.id)
+
+    def test_cached_token_skips_the_user_query(self):
+        request = self.request_for(self.admin)
+        with self.assertNumQueries(1):
+            self.assertTrue(async_to_sync(AsyncIsAdmin())(request))
+
+        repeat = self.request_for(self.admin)
+        repeat.COOKIES['access_token'] = request.COOKIES['access_token']
+        with self.assertNumQueries(0):
+            self.assertTrue(async_to_sync(AsyncIsAdmin())(repeat))
+        self.assertEqual((repeat.user.id, repeat.user.role), (self.admin.id, 'admin'))
+
+    def test_async_admin_route(self):
+        self.assertEqual(Client().get('/api/admin/analytics/metrics').status_code, 401)
+        self.assertEqual(client_for(self.reader).get('/api/admin/analytics/metrics').status_code, 403)
+
+
+class TokenCacheTests(TestCase):
+    """Verified tokens are reused until they expire or their user changes, in any process"""
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.reader = make_user('reader')
+        self.token = str(LMSRefreshToken.for_user(self.reader).access_token)
+
+    def authenticate(self):
+        return jwt_auth.authenticate(RequestFactory().get('/'), self.token)
+
+    def test_cached_token_skips_decoding_and_the_user_query(self):
+        with self.assertNumQueries(1):
+            self.authenticate()
+        with self.assertNumQueries(0), mock.patch.object(jwt_auth, 'get_validated_token') as validate:
+            user = self.authenticate()
+        validate.assert_not_called()
+        self.assertEqual((user.id, user.role), (self.reader.id, 'reader'))
+
+    def test_entry_expires_with_the_token(self):
+        cache = TokenCache(ttl=300)
+        now = time.time()
+        with mock.patch('core.token_cache.time.time', return_value=now):
+            cache.set(self.token, self.reader, token_expires_at=now + 10)
+            self.assertIsNotNone(cache.get(self.token))
+        with mock.patch('core.token_cache.time.time', return_value=now + 11):
+            self.assertIsNone(cache.get(self.token))
+
+    def test_entry_expires_with_the_ttl(self):
+        cache = TokenCache(ttl=5)
+        now = time.time()
+        with mock.patch('core.token_cache.time.time', return_value=now):
+            cache.set(self.token, self.reader, token_expires_at=now + 3600)
+        with mock.patch('core.token_cache.time.time', return_value=now + 6):
+            self.assertIsNone(cache.get(self.token))
+
+    def test_role_change_is_seen_at_once(self):
+        self.authenticate()
+
+        self.reader.role = 'admin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.save()
+
+        self.assertEqual(self.authenticate().role, 'admin')
+
+    def test_deactivated_user_is_rejected(self):
+        self.authenticate()
+
+        self.reader.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.save()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_login_keeps_the_cached_token(self):
+        self.authenticate()
+
+        self.reader.last_login = timezone.now()
+        self.reader.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            self.authenticate()
+
+    def test_other_processes_forget_a_changed_user(self):
+        # A second process's cache, sharing only the Django cache with this one
+        other = TokenCache(sync_interval=0)
+        other.set(self.token, self.reader)
+        self.assertIsNotNone(other.get(self.token))
+
+        self.reader.role = 'admin'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.save()
+
+        self.assertIsNone(other.get(self.token))
+
+    def test_rolled_back_change_keeps_other_processes_cached(self):
+        other = TokenCache(sync_interval=0)
+        other.set(self.token, self.reader)
+        other.get(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    self.reader.role = 'admin'
+                    self.reader.save()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertIsNotNone(other.get(self.token))
+
+
+class VerifyRoleTests(TestCase):
+    """/auth/verify-role answers from the token claims, and from the database only for older tokens"""
+
+    url = '/api/auth/verify-role'
+
+    def setUp(self):
+        token_cache.clear()
+        self.addCleanup(token_cache.clear)
+        self.admin = make_user('admin', role='admin')
+
+    def client_with(self, token):
+        client = Client()
+        client.cookies['access_token'] = str(token)
+        return client
+
+    def test_no_cookie_is_unauthenticated(self):
+        response = Client().get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['authenticated'], False)
+
+    def test_role_claims_answer_without_a_query(self):
+        client = self.client_with(LMSRefreshToken.for_user(self.admin).access_token)
+
+        with self.assertNumQueries(0):
+            response = client.get(self.url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'authenticated': True, 'role': 'admin', 'id': self.admin.id, 'username': 'admin', 'isAdmin': True,
+        })
+
+    def test_token_without_claims_falls_back_to_the_database(self):
+        # Tokens issued before the role and username claims were added
+        token = RefreshToken.for_user(self.admin).access_token
+        self.assertNotIn('role', token)
+        client = self.client_with(token)
+
+        with self.assertNumQueries(1):
+            response = client.get(self.url)
+
+        self.assertEqual(response.json()['role'], 'admin')
+
+    def test_matching_etag_is_not_modified(self):
+        client = self.client_with(LMSRefreshToken.for_user(self.admin).access_token)
+        etag = client.get(self.url)['ETag']
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(response.content, b'')
+
+    def test_stale_etag_gets_the_payload(self):
+        client = self.client_with(LMSRefreshToken.for_user(self.admin).access_token)
+
+        response = client.get(self.url, HTTP_IF_NONE_MATCH='"stale"')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['role'], 'admin')
+
+
+class SyntheticDataTests(SimpleTestCase):
+    def test_long_standing_readers_borrow_most(self):
+        data = SyntheticData(seed=1)
+        data.readers = list(range(100))
+        data.reader_joined = [data.start + timedelta(days=i) for i in range(100)]
+
+        picks = [data.pick_reader(data.end) for _ in range(10000)]
+
+        self.assertIsNone(data.pick_reader(data.start - timedelta(days=1)))
+        self.assertTrue(all(pick < 100 for pick in picks))
+        self.assertGreater(sum(pick < 50 for pick in picks), 2 * sum(pick >= 50 for pick in picks))
+        # Only readers who had joined by then are picked
+        self.assertTrue(all(data.pick_reader(data.start + timedelta(days=9, hours=1)) < 10 for _ in range(100)))
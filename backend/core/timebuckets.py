@@ -0,0 +1,157 @@
+"""Calendar time buckets for the analytics charts.
+
+A Buckets object splits a range of time into consecutive hours, days, ISO
+weeks, months or quarters of the current time zone. Each bucket is keyed on
+the aware datetime at which it starts, so buckets of different years never
+share a key. Rows or timestamps are added up into the buckets in a single
+pass and every bucket gets a total, so empty periods come out as zeros. The
+cost of building the buckets grows with their number, not with the length
+of the range.
+"""
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+
+GRANULARITIES = ['hour', 'day', 'week', 'month', 'quarter']
+
+# Longest range, in days, for which each granularity is picked by default
+DEFAULT_GRANULARITY_DAYS = [
+    (2, 'hour'),
+    (31, 'day'),
+    (92, 'week'),
+    (731, 'month'),
+]
+
+
+def day_start(day):
+    """Return the aware datetime at which a calendar day starts"""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def floor(moment, granularity):
+    """Return the start of the bucket of the given granularity containing moment"""
+    local = timezone.localtime(moment)
+    if granularity == 'hour':
+        return local.replace(minute=0, second=0, microsecond=0)
+
+    day = local.date()
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    elif granularity == 'month':
+        day = day.replace(day=1)
+    elif granularity == 'quarter':
+        day = date(day.year, (day.month - 1) // 3 * 3 + 1, 1)
+    return day_start(day)
+
+
+def advance(start, granularity):
+    """Return the start of the bucket following the one starting at start"""
+    if granularity == 'hour':
+        # Step in UTC so that hours are not lost or repeated across DST changes
+        return timezone.localtime(start.astimezone(dt_timezone.utc) + timedelta(hours=1))
+
+    day = timezone.localtime(start).date()
+    if granularity == 'day':
+        return day_start(day + timedelta(days=1))
+    if granularity == 'week':
+        return day_start(day + timedelta(days=7))
+
+    months = 3 if granularity == 'quarter' else 1
+    month = day.month - 1 + months
+    return day_start(date(day.year + month // 12, month % 12 + 1, 1))
+
+
+def default_granularity(start, end):
+    """Pick a granularity that keeps a range between start and end to a readable number of buckets"""
+    days = (end - start) / timedelta(days=1)
+    for longest, granularity in DEFAULT_GRANULARITY_DAYS:
+        if days <= longest:
+            return granularity
+    return 'quarter'
+
+
+class Buckets:
+    """Consecutive buckets of one granularity covering start (inclusive) to end (exclusive).
+
+    The first bucket starts at the bucket boundary at or before start, so it
+    may reach back before the range; only what falls inside the range is
+    counted. ValueError is raised for an unknown granularity, an empty range,
+    or more than limit buckets.
+    """
+
+    def __init__(self, start, end, granularity=None, limit=None):
+        if granularity is None:
+            granularity = default_granularity(start, end)
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of: {', '.join(GRANULARITIES)}")
+        if end <= start:
+            raise ValueError("The end of the range must be after its start")
+
+        self.start = start
+        self.end = end
+        self.granularity = granularity
+
+        starts = []
+        moment = floor(start, granularity)
+        while moment < end:
+            if limit is not None and len(starts) == limit:
+                raise ValueError(f"The range spans more than {limit} {granularity} buckets")
+            starts.append(moment)
+            moment = advance(moment, granularity)
+        self.starts = starts
+        self.ends = starts[1:] + [moment]
+
+    def __len__(self):
+        return len(self.starts)
+
+    @property
+    def first_day(self):
+        return timezone.localdate(self.start)
+
+    @property
+    def last_day(self):
+        return timezone.localdate(self.end - timedelta(microseconds=1))
+
+    def index(self, moment):
+        """Return the position of the bucket containing moment, or None outside the range.
+
+        A date stands for the start of that day.
+        """
+        if not isinstance(moment, datetime):
+            moment = day_start(moment)
+        if moment < self.start or moment >= self.end:
+            return None
+        return bisect_right(self.starts, moment) - 1
+
+    def sum(self, rows, fields, key='date'):
+        """Add up the fields of rows into their buckets, which are located by their key attribute"""
+        totals = [dict.fromkeys(fields, 0) for _ in self.starts]
+        for row in rows:
+            index = self.index(getattr(row, key))
+            if index is None:
+                continue
+            for field in fields:
+                totals[index][field] += getattr(row, field)
+        return totals
+
+    def count(self, moments):
+        """Count the moments falling in each bucket"""
+        counts = [0] * len(self.starts)
+        for moment in moments:
+            index = self.index(moment)
+            if index is not None:
+                counts[index] += 1
+        return counts
+
+    def labels(self):
+        """Short chart labels, which include the year when the buckets span several years"""
+        if self.granularity == 'quarter':
+            return [f"Q{(start.month - 1) // 3 + 1} {start.year}" for start in self.starts]
+
+        formats = {'hour': '%d %b %H:%M', 'day': '%d %b', 'week': '%d %b', 'month': '%b'}
+        date_format = formats[self.granularity]
+        if self.starts[0].year != self.starts[-1].year:
+            date_format += ' %Y'
+        return [start.strftime(date_format) for start in self.starts]
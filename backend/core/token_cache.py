@@ -0,0 +1,146 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+
+GENERATION_KEY = 'auth:token-cache:generation'
+
+
+class TokenCache:
+    """Bounded LRU cache of verified access tokens.
+
+    Entries are keyed by a SHA-256 of the raw token and hold the few user
+    fields the API reads from ``request.user``. An entry lives until the
+    configured TTL or the token's own expiry, whichever comes first.
+
+    The cache is per process. Invalidating a user drops their tokens here at
+    once and, when the transaction commits, bumps a generation number in the
+    shared Django cache. Every process compares that number with its own at
+    most every sync_interval seconds and empties itself when it moved. With a
+    per-process cache backend (LocMemCache) other workers only forget a
+    changed user with the TTL.
+    """
+
+    def __init__(self, maxsize=10000, ttl=300, sync_interval=1):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.sync_interval = sync_interval
+        self._entries = OrderedDict()
+        self._keys_by_user = {}
+        self._lock = threading.Lock()
+        self._generation = None
+        self._synced_at = None
+
+    @staticmethod
+    def key_for(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        self._sync()
+        key = self.key_for(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] <= time.time():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry['user']
+
+    def set(self, token, user, token_expires_at=None):
+        if self.maxsize <= 0:
+            return
+        # Known to be current, so the entry is not dropped for an older invalidation
+        self._sync()
+        key = self.key_for(token)
+        expires_at = time.time() + self.ttl
+        if token_expires_at is not None:
+            expires_at = min(expires_at, token_expires_at)
+        identity = {
+            'id': user.id,
+            'username': user.username,
+            'email': user.email,
+            'role': user.role,
+            'is_active': user.is_active,
+            'is_staff': user.is_staff,
+        }
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {'user': identity, 'expires_at': expires_at}
+            self._keys_by_user.setdefault(user.id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_user(self, user_id):
+        """Drop every cached token of a user, e.g. after a role change or deletion.
+
+        Other processes empty their caches once the current transaction
+        commits, so none of them caches the old row again in between.
+        """
+        with self._lock:
+            for key in self._keys_by_user.pop(user_id, set()):
+                self._entries.pop(key, None)
+        transaction.on_commit(self._bump_generation)
+
+    def _bump_generation(self):
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:
+            # No generation stored yet (or it was evicted): start one
+            cache.add(GENERATION_KEY, 1, timeout=None)
+
+    def _sync(self):
+        """Empty the cache when another process invalidated a user since the last check"""
+        now = time.monotonic()
+        if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+            return
+        generation = cache.get(GENERATION_KEY)
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._keys_by_user.clear()
+                self._generation = generation
+            self._synced_at = now
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        user_keys = self._keys_by_user.get(entry['user']['id'])
+        if user_keys is not None:
+            user_keys.discard(key)
+            if not user_keys:
+                del self._keys_by_user[entry['user']['id']]
+
+
+def build_user(identity):
+    """Build an in-memory User from a cached identity without touching the database.
+
+    The instance carries only the cached fields; it is meant for permission
+    checks and foreign keys, not for saving.
+    """
+    User = get_user_model()
+    user = User(**identity)
+    user._state.adding = False
+    user._state.db = 'default'
+    return user
+
+
+_config = getattr(settings, 'JWT_AUTH_CACHE', {})
+token_cache = TokenCache(
+    maxsize=_config.get('MAXSIZE', 10000),
+    ttl=_config.get('TTL', 300),
+    sync_interval=_config.get('SYNC_INTERVAL', 1),
+)
@@ -0,0 +1,16 @@
+from ninja_jwt.tokens import RefreshToken
+
+
+class LMSRefreshToken(RefreshToken):
+    """Refresh token that also carries the user's role and username.
+
+    The claims are copied into every access token derived from it, which lets
+    /auth/verify-role answer from the signed token alone.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['role'] = user.role
+        token['username'] = user.username
+        return token
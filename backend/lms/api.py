@@ -6,6 +6,7 @@ from core.controllers.book import BookController, ReaderBookController
 from core.controllers.user import UserController
 from core.controllers.analytics import AnalyticsController
 from core.controllers.events import EventsController
+from core.controllers.exports import ExportController
 
 # from django.conf import settings
 
@@ -26,5 +27,6 @@ api.register_controllers(
     ReaderBookController,
     UserController,
     AnalyticsController,
-    EventsController
+    EventsController,
+    ExportController
 )
\ No newline at end of file
@@ -3,6 +3,34 @@ ASGI config for lms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Run it with uvicorn (see requirements.txt) from the backend directory:
+
+    uvicorn lms.asgi:application --host 0.0.0.0 --port 8000 --workers 2
+
+The book listing and details, the public event list and /auth/verify are
+async views on the async ORM. Under ASGI a request waiting on the database
+does not hold one of a fixed number of worker threads. The admin analytics
+routes only answer cache hits on the event loop; a miss runs the synchronous
+view in a thread. Keep CONN_MAX_AGE at 0 here, since connections are opened by
+those threads.
+
+This pays off only when queries wait on the network. Django 4.2 and
+django-ninja run each ORM call and the request parsing through sync_to_async,
+so against a local database the WSGI server (lms.wsgi) is faster. Measured on
+one core with 128 clients on the book and event routes, gunicorn gthread (one
+worker, 32 threads) against uvicorn (one worker), with DATABASE_LATENCY_MS
+simulating a remote database:
+
+    latency per query    0 ms     20 ms    50 ms    200 ms
+    WSGI req/s           102      93       70       25
+    ASGI req/s           91       84       85       83
+
+/auth/verify, which a token-cache hit answers without a query, stays faster
+under WSGI (249 against 161 req/s). Compare both on the target machine with:
+
+    DATABASE_LATENCY_MS=50 uvicorn lms.asgi:application --port 8000
+    python manage.py loadtest --url http://127.0.0.1:8000 --concurrency 128
+
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
 """
@@ -14,3 +42,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.settings')
 
 application = get_asgi_application()
+
+# Runs the overdue sweeper in this server process when OVERDUE_SWEEP_INTERVAL is set
+from core.overdue import start_scheduler  # noqa: E402
+
+start_scheduler()
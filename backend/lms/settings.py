@@ -10,8 +10,10 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,6 +48,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.ReplicaMiddleware',  # Before anything that may query the database
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Add CORS middleware before CommonMiddleware
     'django.middleware.common.CommonMiddleware',
@@ -79,10 +82,105 @@ WSGI_APPLICATION = 'lms.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_ENGINE selects the backend: 'sqlite' (the default, a file at
+# DATABASE_NAME or db.sqlite3) or 'postgresql', configured by DATABASE_NAME,
+# DATABASE_USER, DATABASE_PASSWORD, DATABASE_HOST and DATABASE_PORT.
+# DATABASE_CONN_MAX_AGE keeps connections open between requests for that many
+# seconds (checked before reuse), which saves a connect per request under
+# WSGI; leave it at 0 under ASGI.
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('DATABASE_NAME', 'lms'),
+            'USER': os.environ.get('DATABASE_USER', 'lms'),
+            'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+            'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+            'PORT': os.environ.get('DATABASE_PORT', '5432'),
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+            'CONN_HEALTH_CHECKS': True,
+            # Behind a transaction-pooling PgBouncer (DATABASE_POOLER=pgbouncer)
+            # a cursor may not outlive its transaction on the server
+            'DISABLE_SERVER_SIDE_CURSORS': os.environ.get('DATABASE_POOLER') == 'pgbouncer',
+        }
+    }
+elif DATABASE_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 0)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Seconds a writer waits for the file lock (SQLite's busy_timeout)
+                # before failing with "database is locked"
+                'timeout': int(os.environ.get('DATABASE_TIMEOUT', 20)),
+            },
+            # A file rather than shared-cache memory, so that tests writing from
+            # several threads wait on the file lock as they would in production
+            'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
+        }
+    }
+else:
+    raise ImproperlyConfigured(f"DATABASE_ENGINE must be 'sqlite' or 'postgresql', not {DATABASE_ENGINE!r}")
+
+# Read replica: set DATABASE_REPLICA_NAME (a second SQLite file, or the replica's
+# database name on Postgres) and/or DATABASE_REPLICA_HOST and DATABASE_REPLICA_PORT
+# to serve the GET requests of DATABASE_REPLICA_PATHS from it (see core.routers).
+# Everything else, and every write, stays on the primary. Migrations run on the
+# primary only; a local SQLite replica is a copy of db.sqlite3 and shows writes
+# once it is copied again.
+DATABASE_REPLICA = {
+    key: os.environ[f'DATABASE_REPLICA_{key}']
+    for key in ('NAME', 'HOST', 'PORT')
+    if os.environ.get(f'DATABASE_REPLICA_{key}')
+}
+if DATABASE_REPLICA:
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        **DATABASE_REPLICA,
+        # Tests run against the primary only
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Catalogue, event and analytics reads (BookController, EventsController and
+# AnalyticsController) and the exports that may be served from the replica
+DATABASE_REPLICA_PATHS = ['/api/books', '/api/events', '/api/admin/analytics', '/api/admin/export']
+
+# After a successful write a client reads from the primary for this many
+# seconds, longer than the replica is expected to lag behind
+DATABASE_REPLICA_PIN_SECONDS = int(os.environ.get('DATABASE_REPLICA_PIN_SECONDS', 5))
+
+# Pragmas run on every new SQLite connection (see core.signals). WAL lets
+# readers carry on while a borrow or return writes, and synchronous=NORMAL is
+# safe under WAL. Set SQLITE_TUNING=0 to open connections with SQLite's
+# defaults, e.g. to compare with manage.py bench_writes.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'temp_store': 'memory',
+    'cache_size': -64000,  # KiB
+    'mmap_size': 268435456,
+} if os.environ.get('SQLITE_TUNING', '1') != '0' else {}
+
+# Milliseconds to wait before every query (see core.signals), to load test the
+# WSGI and ASGI servers as if the database were across a network. Leave at 0
+# outside of benchmarks.
+DATABASE_LATENCY_MS = int(os.environ.get('DATABASE_LATENCY_MS', 0))
+
+# Cache backing the analytics responses (see core.cache). Local memory is per
+# process, so when several workers serve the API point CACHE_BACKEND and
+# CACHE_LOCATION at a shared backend, e.g.
+# django.core.cache.backends.redis.RedisCache with redis://host:6379/0 or
+# django.core.cache.backends.filebased.FileBasedCache with a directory, so that
+# invalidations reach every worker.
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'lms'),
     }
 }
 
@@ -109,6 +207,10 @@ CORS_ALLOW_HEADERS = [
     "x-csrftoken",
     "x-requested-with",
 ]
+# Let the browser read the pagination cursor of GET /books
+CORS_EXPOSE_HEADERS = [
+    "x-next-cursor",
+]
 
 
 # Password validation
@@ -164,3 +266,56 @@ CSRF_COOKIE_HTTPONLY = True
 CSRF_COOKIE_SAMESITE = 'Lax'  # Or 'Strict' for more security
 CSRF_USE_SESSIONS = True
 CSRF_COOKIE_NAME = 'csrftoken'
+
+# Analytics rollup: how long (seconds) today's DailyAnalytics row may be served
+# before it is recomputed on read
+ANALYTICS_ROLLUP_MAX_AGE = 60
+
+# Longest time (seconds) an analytics response is reused from the cache when
+# no borrowing, user, book or event changes in the meantime
+ANALYTICS_CACHE_TIMEOUT = 60
+
+# Most periods one analytics chart may be split into; longer series are
+# rejected, so ask for a coarser granularity instead
+ANALYTICS_MAX_BUCKETS = 1000
+
+# Threads used by /admin/analytics/dashboard to compute panels concurrently;
+# each holds its own database connection while it runs
+ANALYTICS_DASHBOARD_WORKERS = 4
+
+# In-process cache of verified access tokens (see core.token_cache). Entries
+# expire after TTL seconds or with the token, whichever is sooner; set MAXSIZE
+# to 0 to disable it. A changed or deleted user is dropped at once by the
+# process that saved them, and by every other process within SYNC_INTERVAL
+# seconds when CACHE_BACKEND is shared between them (Redis, Memcached);
+# with the default LocMemCache other workers keep them until the TTL.
+JWT_AUTH_CACHE = {
+    'MAXSIZE': 10000,
+    'TTL': 300,
+    'SYNC_INTERVAL': 1,
+}
+
+# /auth/verify-role answers from the role and username claims of the signed
+# access token instead of loading the user. A deactivated user keeps passing
+# this check until the token expires, although the API itself rejects them.
+AUTH_VERIFY_ROLE_STATELESS = True
+AUTH_VERIFY_ROLE_MAX_AGE = 15  # seconds
+
+# Overdue sweeper (see core.overdue): seconds between sweeps run by a thread of
+# each server process, or 0 to leave sweeping to a scheduled
+# `manage.py sweep_overdue` (or `sweep_overdue --every SECONDS`). Sweepers may
+# overlap safely, but one per deployment is enough.
+OVERDUE_SWEEP_INTERVAL = int(os.environ.get('OVERDUE_SWEEP_INTERVAL', 0))
+OVERDUE_SWEEP_BATCH_SIZE = 1000
+
+# Bulk catalogue import (see core.book_import): rows upserted per statement and
+# transaction, and row errors listed in a report (all are counted)
+BOOK_IMPORT_CHUNK_SIZE = 1000
+BOOK_IMPORT_MAX_ERRORS = 1000
+
+# Rows fetched per round trip, and encoded per chunk, by the /admin/export routes
+EXPORT_CHUNK_SIZE = 2000
+
+# Page size of GET /books when no limit is given, and the largest limit accepted
+BOOKS_PAGE_SIZE = 100
+BOOKS_MAX_PAGE_SIZE = 500
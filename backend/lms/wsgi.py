@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lms.settings')
 
 application = get_wsgi_application()
+
+# Runs the overdue sweeper in this server process when OVERDUE_SWEEP_INTERVAL is set
+from core.overdue import start_scheduler  # noqa: E402
+
+start_scheduler()
@@ -51,21 +51,29 @@ export default function BooksManagement() {
   const fetchBooks = async () => {
     try {
       setLoading(true);
-      const response = await fetch(`${API_URL}/books`, {
-        credentials: 'include',
-      });
-      
-      if (response.ok) {
-        const data = await response.json();
-        setBooks(data);
-      } else {
-        console.error("Failed to fetch books");
-        toast({
-          title: "Error",
-          description: "Failed to fetch books",
-          variant: "destructive",
+      // The API returns one page at a time; follow X-Next-Cursor to the last one
+      const data: Book[] = [];
+      let cursor: string | null = null;
+      do {
+        const query: string = cursor ? `?cursor=${encodeURIComponent(cursor)}` : "";
+        const response: Response = await fetch(`${API_URL}/books${query}`, {
+          credentials: 'include',
         });
-      }
+        
+        if (!response.ok) {
+          console.error("Failed to fetch books");
+          toast({
+            title: "Error",
+            description: "Failed to fetch books",
+            variant: "destructive",
+          });
+          return;
+        }
+        data.push(...(await response.json()));
+        cursor = response.headers.get("X-Next-Cursor");
+      } while (cursor);
+      
+      setBooks(data);
     } catch (error) {
       console.error("Error fetching books:", error);
       toast({
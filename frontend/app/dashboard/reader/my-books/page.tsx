@@ -46,7 +46,8 @@ export default function MyBooks() {
         setBorrowings(data);
         
         // Split into active and history
-        const active = data.filter((b: BookBorrowing) => b.status === 'active');
+        // Overdue borrowings are still on loan
+        const active = data.filter((b: BookBorrowing) => b.status === 'active' || b.status === 'overdue');
         const past = data.filter((b: BookBorrowing) => b.status === 'returned');
         
         setActiveBorrowings(active);
@@ -35,13 +35,21 @@ export interface WishlistItem {
   added_date: string;
 }
 
-// Book listing with optional filtering
+// Book listing with optional filtering. The API returns one page at a time,
+// so the pages are fetched in turn, following the X-Next-Cursor header.
 export const getBooks = async (category?: string, search?: string) => {
   const params: any = {};
   if (category && category !== 'all') params.category = category;
   if (search) params.search = search;
   
-  return fetchApi<Book[]>('/books', params);
+  const books: Book[] = [];
+  let cursor: string | undefined;
+  do {
+    const response = await api.get<Book[]>('/books', { params: { ...params, cursor } });
+    books.push(...response.data);
+    cursor = response.headers['x-next-cursor'];
+  } while (cursor);
+  return books;
 };
 
 // Get a specific book